@@ -0,0 +1,122 @@
+# Totum — analytique de cohorte : adhérence aux objectifs
+# Joint un journal multi-utilisateurs (une ligne par aliment saisi) aux objectifs par utilisateur
+# (cohort.cohort_targets ou colonnes micro) et calcule le "% objectif" par utilisateur / jour / nutriment,
+# vectorisé sur tout le jeu de données. Le mode streaming traite le journal par tranches de dates
+# pour garder une mémoire bornée sur des mois de données et des milliers d'utilisateurs.
+
+
+
+
+from __future__ import annotations
+import datetime as dt
+from typing import Iterable, Iterator
+import numpy as np
+import pandas as pd
+
+from totum_core import nutrient_label_key, TARGET_NUTRIENTS
+from journal_store import fetch_journal_between
+
+
+
+
+NON_NUTRIENT_COLS = {"id", "user_id", "date", "repas", "nom", "quantite_g"}
+
+
+
+
+def _bucket(label: str) -> str:
+    return nutrient_label_key(TARGET_NUTRIENTS.get(label, label))[0]
+
+
+
+
+def cohort_daily_totals(journal: pd.DataFrame, user_col: str = "user_id", date_col: str = "date") -> pd.DataFrame:
+    """Totaux par (utilisateur, jour) de toutes les colonnes nutriments, variantes de libellés regroupées."""
+    cols = [c for c in journal.columns if c not in NON_NUTRIENT_COLS | {user_col, date_col}]
+    num = journal[cols].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    keys = [journal[user_col].to_numpy(), journal[date_col].astype(str).to_numpy()]
+    daily = num.groupby(keys, sort=True).sum()
+    # regroupe ensuite les libellés équivalents (ex. 'Proteines_g' / 'Protéines_g') comme unify_totals_series
+    merged: dict[str, np.ndarray] = {}
+    for c in cols:
+        b = nutrient_label_key(str(c))[0]; v = daily[c].to_numpy()
+        merged[b] = merged[b] + v if b in merged else v
+    return pd.DataFrame(merged, index=daily.index.set_names([user_col, date_col]))
+
+
+
+
+def consumed_matrix(daily: pd.DataFrame, nutrients: list[str]) -> pd.DataFrame:
+    """Consommation par nutriment cible ; l'énergie est recalculée depuis les macros (4/4/9) comme dans le Bilan."""
+    out = {}
+    zeros = np.zeros(len(daily))
+    col = lambda name: daily[_bucket(name)].to_numpy() if _bucket(name) in daily.columns else zeros
+    for n in nutrients:
+        if n == "energie_kcal":
+            out[n] = col("proteines_g")*4 + col("glucides_g")*4 + col("lipides_g")*9
+        else:
+            out[n] = col(n)
+    return pd.DataFrame(out, index=daily.index, columns=nutrients)
+
+
+
+
+def adherence_matrix(journal: pd.DataFrame, targets: pd.DataFrame, nutrients: list[str] | None = None,
+                     user_col: str = "user_id", date_col: str = "date") -> pd.DataFrame:
+    """
+    % objectif par (utilisateur, jour) x nutriment.
+    `targets` : une ligne par utilisateur (index = identifiant), colonnes = clés de excel_like_targets
+    et/ou libellés de nutriments (ex. 'Calcium_mg'). Objectif nul ou absent -> 0 %, comme percent().
+    """
+    nutrients = list(nutrients or targets.columns)
+    if journal.empty:
+        return pd.DataFrame(columns=nutrients, index=pd.MultiIndex.from_arrays([[], []], names=[user_col, date_col]))
+    daily = cohort_daily_totals(journal, user_col, date_col)
+    cons = consumed_matrix(daily, nutrients).to_numpy()
+    tgt = targets.reindex(index=daily.index.get_level_values(user_col), columns=nutrients).to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(tgt > 0, cons / tgt * 100.0, 0.0)
+    return pd.DataFrame(np.nan_to_num(pct), index=daily.index, columns=nutrients)
+
+
+
+
+def iter_adherence(chunks: Iterable[pd.DataFrame], targets: pd.DataFrame, **kwargs) -> Iterator[pd.DataFrame]:
+    """Adhérence tranche par tranche ; chaque tranche doit contenir des journées complètes."""
+    for chunk in chunks:
+        if chunk is not None and not chunk.empty:
+            yield adherence_matrix(chunk, targets, **kwargs)
+
+
+
+
+def adherence_summary(chunks: Iterable[pd.DataFrame], targets: pd.DataFrame, nutrients: list[str] | None = None,
+                      user_col: str = "user_id", date_col: str = "date") -> pd.DataFrame:
+    """
+    Réduction en streaming : % objectif moyen par utilisateur x nutriment + nombre de jours saisis.
+    Seuls les accumulateurs (utilisateurs x nutriments) restent en mémoire entre deux tranches.
+    """
+    nutrients = list(nutrients or targets.columns)
+    sums = pd.DataFrame(columns=nutrients, dtype=float); days = pd.Series(dtype=float)
+    for adh in iter_adherence(chunks, targets, nutrients=nutrients, user_col=user_col, date_col=date_col):
+        g = adh.groupby(level=user_col)
+        sums = sums.add(g.sum(), fill_value=0.0)
+        days = days.add(g.size().astype(float), fill_value=0.0)
+    out = sums.div(days, axis=0)
+    out["jours"] = days.astype(int)
+    return out.rename_axis(user_col)
+
+
+
+
+def sqlite_journal_chunks(date_from: str, date_to: str, chunk_days: int = 31,
+                          user_id: str = "local") -> Iterator[pd.DataFrame]:
+    """Lit le journal (stockage actif, cf. journal_store) par fenêtres de `chunk_days` jours (journées jamais coupées)."""
+    start = dt.date.fromisoformat(str(date_from)); end = dt.date.fromisoformat(str(date_to))
+    while start <= end:
+        stop = min(start + dt.timedelta(days=chunk_days - 1), end)
+        df = fetch_journal_between(start.isoformat(), stop.isoformat())
+        if not df.empty:
+            df.insert(0, "user_id", user_id)
+            yield df
+        start = stop + dt.timedelta(days=1)
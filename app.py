@@ -7,192 +7,62 @@
 
 
 from __future__ import annotations
-import os, io, re, json, sqlite3, unicodedata, datetime as dt, base64, random, math
-from pathlib import Path
+import os, io, datetime as dt, random
 import numpy as np
 import pandas as pd
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import plotly.graph_objects as go
-import openpyxl
 
-
-
-
-VERSION = "v2025-10-07-v7-logo-centered-white-consels-journal-search-optimized"
-
-
-
-
-# --- Page config (layout wide, sidebar fermée) ---
-st.set_page_config(
-    page_title="Totum — suivi nutritionnel",
-    page_icon="🥗",
-    layout="wide",
-    initial_sidebar_state="collapsed",
+from totum_core import (
+    canon, calc_from_food_row, round1, unify_totals_frame, excel_like_targets,
+    journal_search_candidates,
+)
+from catalog import CatalogManager, CatalogSnapshot, ASSETS_DIR, DEFAULT_EXCEL_PATH, catalog_manager
+from warmup import warmup
+from tips import DEFAULT_ENGINE as DEFAULT_TIP_ENGINE
+from sync import SyncEngine, engine_from_env
+from static_assets import load_logo_assets, minify_css
+from planner import optimize_plan
+from viewmodels import (
+    LOCAL_USER, ViewModelCache, Prefetcher, build_bilan_view, build_conseils_view, build_trend_view, profile_hash,
+    find_ala_columns, TREND_NUTRIENTS,
 )
+from downsample import DEFAULT_WIDTH_PX, downsample, use_webgl, max_points
+from storage import nutrient_schema
+from journal_store import (
+    load_profile, save_profile, insert_journal, delete_journal_row, fetch_journal_by_date,
+    fetch_last_date_with_rows, fetch_all_journal, fetch_journal_page, count_journal_by_date,
+    journal_version, journal_names_by_date, insert_journal_batch, import_journal_frame, daily_totals, get_store,
+)
+
+try:
+    from st_keyup import st_keyup
+except ImportError:  # streamlit-keyup optionnel : recherche pendant la frappe (anti-rebond), sinon Entrée / sortie du champ
+    st_keyup = None
 
 
 
 
-DB_PATH = os.path.join(os.getcwd(), "totum.db")
+VERSION = "v2025-10-07-v7-logo-centered-white-consels-journal-search-optimized"
 
 
 
 
 # === Assets packagés
-ASSETS_DIR = Path(__file__).parent / "assets"
-DEFAULT_EXCEL_PATH = ASSETS_DIR / "TOTUM-Suivi nutritionnel.xlsx"
 DEFAULT_LOGO_PATH  = ASSETS_DIR / "logo.png"
+LOGO_ASSETS = load_logo_assets(DEFAULT_LOGO_PATH)   # réduit / encodé une fois par process (et par version du fichier)
 
 
 
 
-# ===================== Utils =====================
-def strip_accents(text: str) -> str:
-    text = str(text or "")
-    return "".join(ch for ch in unicodedata.normalize("NFD", text) if unicodedata.category(ch) != "Mn")
-
-
-
-
-def canon(s: str) -> str:
-    s = strip_accents(str(s)).lower().replace("_", " ").replace("/", " ").replace("-", " ")
-    return re.sub(r"\s+", " ", s).strip()
-
-
-
-
-def canon_key(s: str) -> str:
-    return canon(s).replace("(", "").replace(")", "").replace("’", "'").replace(" ", "").replace("__", "_")
-
-
-
-
-def norm(s: str) -> str:
-    s = strip_accents(s).lower()
-    return re.sub(r"[^a-z0-9]+", "", s)
-
-
-
-
-def normalize_unit(u: str) -> str:
-    u = (u or "").strip()
-    u = u.replace("mcg", "µg").replace("ug", "µg").replace("μg", "µg")
-    return u
-
-
-
-
-def parse_name_unit(label: str) -> tuple[str,str]:
-    if label is None: return "", ""
-    s = str(label).strip()
-    parts = re.split(r"\s*[-–—]\s*", s)
-    if len(parts) >= 2:
-        unit = normalize_unit(parts[-1])
-        name = "-".join(parts[:-1]).strip()
-        return name, unit
-    return s, ""
-
-
-
-
-def coerce_num_col(s: pd.Series | None) -> pd.Series | None:
-    if s is None: return None
-    s = s.astype(str).str.replace("\u00A0", " ", regex=False).str.replace(",", ".", regex=False)
-    ext = s.str.extract(r"([-+]?\d*\.?\d+)")[0]
-    return pd.to_numeric(ext, errors="coerce")
-
-
-
-
-def percent(n, d):
-    n = pd.to_numeric(n, errors="coerce").fillna(0.0)
-    d = pd.to_numeric(d, errors="coerce").replace(0, np.nan)
-    return (n / d * 100).fillna(0.0)
-
-
-
-
-def nutrient_cols(df_or_row):
-    cols = list(df_or_row.index if isinstance(df_or_row, pd.Series) else df_or_row.columns)
-    return [c for c in cols if str(c).endswith("_100g")]
-
-
-
-
-def per100_to_name(c): return c[:-5]
-
-
-
-
-def drop_parasite_columns(df: pd.DataFrame | None) -> pd.DataFrame | None:
-    if df is None or df.empty: return df
-    cols = []
-    for c in df.columns:
-        sc = str(c).strip().lower()
-        if sc == "" or sc.startswith("unnamed") or sc in {"done","none","nan"}:
-            continue
-        cols.append(c)
-    out = df[cols]
-    return out.loc[:, ~(out.isna().all())]
-
-
-
-
-def read_sheet_values_path(path: Path, sheet_name: str) -> pd.DataFrame | None:
-    try:
-        bio = io.BytesIO(Path(path).read_bytes())
-        wb = openpyxl.load_workbook(bio, data_only=True, read_only=True)
-        if sheet_name not in wb.sheetnames: return None
-        ws = wb[sheet_name]
-        rows = list(ws.values)
-        if not rows: return None
-        header = [str(x) if x is not None else "" for x in rows[0]]
-        df = pd.DataFrame(rows[1:], columns=header)
-        return drop_parasite_columns(df)
-    except Exception:
-        return None
-
-
-
-
-def clean_liste(df_liste: pd.DataFrame) -> pd.DataFrame:
-    df_liste = drop_parasite_columns(df_liste)
-    assert "nom" in df_liste.columns, "La feuille 'Liste' doit contenir la colonne 'nom'."
-    if "Energie_kcal_100g" in df_liste.columns and "Énergie_kcal_100g" not in df_liste.columns:
-        df_liste = df_liste.rename(columns={"Energie_kcal_100g": "Énergie_kcal_100g"})
-    keep = ["nom"] + [c for c in df_liste.columns if c.endswith("_100g")]
-    df = df_liste[keep].copy()
-    for c in [x for x in df.columns if x.endswith("_100g")]:
-        df[c] = coerce_num_col(df[c]).fillna(0.0)
-
-
-
-
-    # fusion de colonnes quasi identiques
-    dup_groups = {}
-    for c in [x for x in df.columns if x.endswith("_100g")]:
-        key = canon_key(c)
-        dup_groups.setdefault(key, []).append(c)
-    for cols in dup_groups.values():
-        if len(cols) > 1:
-            base = sorted(cols, key=len)[0]
-            df[base] = df[cols].sum(axis=1, numeric_only=True)
-            for extra in cols:
-                if extra != base and extra in df.columns:
-                    df.drop(columns=[extra], inplace=True, errors="ignore")
-    return df
-
-
-
-
-def calc_from_food_row(row: pd.Series, qty_g: float) -> dict:
-    out = {}
-    for c in nutrient_cols(row):
-        val = pd.to_numeric(pd.Series([row[c]]), errors="coerce").iloc[0]
-        if pd.notna(val):
-            out[per100_to_name(c)] = float(qty_g) * float(val) / 100.0
-    return out
+# --- Page config (layout wide, sidebar fermée) ---
+st.set_page_config(
+    page_title="Totum — suivi nutritionnel",
+    page_icon=str(LOGO_ASSETS.favicon_path) if LOGO_ASSETS and LOGO_ASSETS.favicon_path else "🥗",
+    layout="wide",
+    initial_sidebar_state="collapsed",
+)
 
 
 
@@ -214,12 +84,14 @@ COLORS = {
 
 
 # ============ Mobile-first CSS + Header plat (FORCE WHITE) ============
-def apply_mobile_css_and_topbar(logo_b64: str | None):
+@st.cache_resource(show_spinner=False)
+def mobile_css() -> str:
     # Minimal, non-invasive fix for mobile "grisé" issue:
     # - fix malformed rgba decimals (e.g. rgba(...,08) -> 0.08)
     # - force light color-scheme so browsers/extensions won't forcibly invert/gray colors
     # - protect images/svg/canvas and text fill from forced dark filters
-    st.markdown(f"""
+    # construit et minifié une fois par process (Streamlit réémet le bloc à chaque rerun)
+    return minify_css(f"""
     <style>
     [data-testid="stToolbar"], [data-testid="stDecoration"], [data-testid="stStatusWidget"], header, footer {{display:none!important;}}
     /* force light color scheme for browsers that respect it */
@@ -245,9 +117,11 @@ def apply_mobile_css_and_topbar(logo_b64: str | None):
     .topbar-logo {{ width:140px; height:140px; object-fit:contain; }}
 
 
-    [data-baseweb="tab-list"] {{ width:100%; display:grid!important; grid-template-columns:1fr 1fr 1fr 1fr; gap:.35rem; margin:.6rem 0 .2rem 0; }}
-    [data-baseweb="tab-list"] button {{ width:100%; background:#fff; color:var(--ink); border-radius:12px!important; border:1px solid rgba(0,0,0,0.08); padding:.55rem .6rem!important; font-weight:800; box-shadow:none; }}
-    [data-baseweb="tab-highlight"] {{ background: linear-gradient(90deg, {COLORS['brand']}, {COLORS['brand2']}); height:3px; }}
+    /* Navigation (st.radio key="page") : 4 boutons pleine largeur, la page active soulignée aux couleurs de la marque */
+    .st-key-page [role="radiogroup"] {{ width:100%; display:grid!important; grid-template-columns:1fr 1fr 1fr 1fr; gap:.35rem; margin:.6rem 0 .2rem 0; }}
+    .st-key-page [role="radiogroup"] label {{ width:100%; margin:0; justify-content:center; background:#fff; color:var(--ink); border-radius:12px; border:1px solid rgba(0,0,0,0.08); padding:.55rem .6rem; font-weight:800; }}
+    .st-key-page [role="radiogroup"] label > div:first-child {{ display:none; }}
+    .st-key-page [role="radiogroup"] label:has(input:checked) {{ border-bottom:3px solid {COLORS['brand']}; background:linear-gradient(180deg, #fff, #fff4ec); }}
 
 
     .stButton>button {{ background: linear-gradient(90deg, {COLORS['brand']}, {COLORS['brand2']}); border:0; color:#fff; font-weight:900; box-shadow:none; border-radius:12px; }}
@@ -269,50 +143,15 @@ def apply_mobile_css_and_topbar(logo_b64: str | None):
     /* keep text fill color strict */
     * {{ -webkit-text-fill-color: unset; }}
     </style>
-    """, unsafe_allow_html=True)
-
-
-    # Inject JS to reinforce theme color / color-scheme (helps some Android browsers)
-    st.markdown(f"""
-    <script>
-      (function(){{
-        try {{
-          document.documentElement.style.colorScheme = 'light';
-          document.documentElement.style.setProperty('--bg', '#ffffff');
-          var m = document.querySelector('meta[name="theme-color"]');
-          if(!m) {{ m = document.createElement('meta'); m.name = 'theme-color'; document.head.appendChild(m); }}
-          m.content = '#ffffff';
-        }} catch(e){{ console && console.warn && console.warn('color-scheme set failed', e); }}
-      }})();
-    </script>
-    """, unsafe_allow_html=True)
-    logo_html = f"<img class='topbar-logo' src='data:image/png;base64,{logo_b64}' alt='logo'/>" if logo_b64 else ""
-    st.markdown(f"""
-    <div class="topbar">
-      <div>{logo_html}</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-
-def set_favicon_from_logo(logo_b64: str | None):
-    if not logo_b64: return
-    st.markdown(f"""
-    <script>
-      (function() {{
-        const link = document.querySelector("link[rel='icon']") || document.createElement('link');
-        link.rel = 'icon';
-        link.href = "data:image/png;base64,{logo_b64}";
-        document.head.appendChild(link);
-      }})();
-    </script>
-    """, unsafe_allow_html=True)
-
-
+    """)
 
 
-def round1(x) -> float:
-    try: return float(np.round(float(x), 1))
-    except Exception: return 0.0
+def apply_mobile_css_and_topbar(logo_src: str | None):
+    # NB : les <script> passés à st.markdown ne sont jamais exécutés (innerHTML) -> plus de JS thème/favicon ;
+    # le favicon passe par set_page_config(page_icon=...)
+    st.markdown(mobile_css(), unsafe_allow_html=True)
+    logo_html = f"<img class='topbar-logo' src='{logo_src}' width='140' height='140' alt='logo'/>" if logo_src else ""
+    st.markdown(f"<div class='topbar'><div>{logo_html}</div></div>", unsafe_allow_html=True)
 
 
 
@@ -341,94 +180,6 @@ def donut(cons, target, title, color_key="energie", height=210):
 
 
 
-# ============ Unification totaux ============
-PREFERRED_NAMES = {
-    "energiekcal":"Énergie_kcal", "proteinesg":"Protéines_g", "glucidesg":"Glucides_g", "lipidesg":"Lipides_g",
-    "fibresg":"Fibres_g", "agsaturesg":"AG_saturés_g",
-    "acideoleiquew9g":"Acide_oléique_W9_g", "acidelinoleiquew6lag":"Acide_linoléique_W6_LA_g",
-    "acidealphalinoleniquew3alag":"Acide_alpha-linolénique_W3_ALA_g", "acidealpha-linoléniquew3alag":"Acide_alpha-linolénique_W3_ALA_g",
-    "acidealpha_linolenique_w3_alag":"Acide_alpha-linolénique_W3_ALA_g", "acidealphalinoleniquew3ala":"Acide_alpha-linolénique_W3_ALA_g",
-    "omega3alag":"Acide_alpha-linolénique_W3_ALA_g", "omega3ala":"Acide_alpha-linolénique_W3_ALA_g",
-    "w3alag":"Acide_alpha-linolénique_W3_ALA_g", "alag":"Acide_alpha-linolénique_W3_ALA_g",
-    "epag":"EPA_g", "dhag":"DHA_g", "sucresg":"Sucres_g", "selg":"Sel_g",
-}
-def unify_totals_series(s: pd.Series) -> pd.Series:
-    if not isinstance(s, pd.Series) or s.empty: return s
-    buckets: dict[str, float] = {}; name_for_bucket: dict[str,str] = {}
-    for col in s.index:
-        key = canon_key(col); preferred = PREFERRED_NAMES.get(key); bucket = preferred or key
-        buckets[bucket] = buckets.get(bucket, 0.0) + float(s[col] or 0.0)
-        if preferred: name_for_bucket[bucket] = preferred
-        else: name_for_bucket.setdefault(bucket, col)
-    out = pd.Series({name_for_bucket[k]: v for k,v in buckets.items()})
-    if "Énergie_kcal" not in out.index and "Energie_kcal" in out.index: out["Énergie_kcal"] = out["Energie_kcal"]
-    return out
-
-
-
-
-# ============ Profil / objectifs ============
-def bmr_harris_benedict_revised(sex, age, height_cm, weight_kg):
-    if norm(sex).startswith("h"):
-        return 88.362 + 13.397*float(weight_kg) + 4.799*float(height_cm) - 5.677*int(age)
-    else:
-        return 447.593 + 9.247*float(weight_kg) + 3.098*float(height_cm) - 4.330*int(age)
-
-
-
-
-ACTIVITY_TABLE = {
-    "sedentaire":{"factor":1.2, "prot_min":0.8, "prot_max":1.0},
-    "leger":{"factor":1.375, "prot_min":1.0, "prot_max":1.2},
-    "modere":{"factor":1.55, "prot_min":1.2, "prot_max":1.6},
-    "intense":{"factor":1.725, "prot_min":1.6, "prot_max":2.0},
-    "tresintense":{"factor":1.9, "prot_min":2.0, "prot_max":2.5},
-    "athlete":{"factor":1.9, "prot_min":2.0, "prot_max":2.5},
-}
-RULES = {
-    "lipides_pct":0.35, "agsat_pct":0.10, "omega9_pct":0.15, "omega6_pct":0.04, "ala_pct":0.01,
-    "glucides_pct":0.55, "sucres_pct":0.10, "fibres_g":30.0, "epa_g":0.25, "dha_g":0.25, "sel_g":6.0,
-}
-
-
-
-
-def activity_key(a: str) -> str:
-    a = norm(a)
-    if "sedentaire" in a: return "sedentaire"
-    if "leger" in a: return "leger"
-    if "modere" in a: return "modere"
-    if "intense" in a and "tres" not in a and "2x" not in a: return "intense"
-    if "tresintense" in a or "2x" in a or "athlete" in a: return "tresintense"
-    return "sedentaire"
-
-
-
-
-def excel_like_targets(p: dict) -> dict:
-    bmr = bmr_harris_benedict_revised(p["sexe"], int(p["age"]), float(p["taille_cm"]), float(p["poids_kg"]))
-    af = ACTIVITY_TABLE[activity_key(p["activite"])]["factor"]
-    prot_max = ACTIVITY_TABLE[activity_key(p["activite"])]["prot_max"]
-    tdee = bmr * af
-    return {
-        "energie_kcal": float(tdee),
-        "proteines_g":  float(float(p["poids_kg"]) * prot_max),
-        "lipides_g":    float(tdee * RULES["lipides_pct"] / 9.0),
-        "agsatures_g":  float(tdee * RULES["agsat_pct"]   / 9.0),
-        "omega9_g":     float(tdee * RULES["omega9_pct"]  / 9.0),
-        "omega6_g":     float(tdee * RULES["omega6_pct"]  / 9.0),
-        "ala_w3_g":     float(tdee * RULES["ala_pct"]     / 9.0),
-        "epa_g":        RULES["epa_g"],
-        "dha_g":        RULES["dha_g"],
-        "glucides_g":   float(tdee * RULES["glucides_pct"]/ 4.0),
-        "sucres_g":     float(tdee * RULES["sucres_pct"]  / 4.0),
-        "fibres_g":     RULES["fibres_g"],
-        "sel_g":        RULES["sel_g"],
-    }
-
-
-
-
 def get_profile_targets_cached() -> dict:
     p = st.session_state["profile"]
     base = excel_like_targets(p)
@@ -439,200 +190,115 @@ def get_profile_targets_cached() -> dict:
 
 
 
-# ============ SQLite ============
-def db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
-
-
-
-
-def init_db():
-    conn = db()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS profile (
-            id INTEGER PRIMARY KEY CHECK (id=1),
-            sexe TEXT, age INTEGER, taille_cm REAL, poids_kg REAL,
-            activite TEXT, prot_pct INTEGER, gluc_pct INTEGER, lip_pct INTEGER
-        );
-    """)
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS journal (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            repas TEXT NOT NULL,
-            nom TEXT NOT NULL,
-            quantite_g REAL NOT NULL,
-            nutrients_json TEXT NOT NULL
-        );
-    """)
-    conn.commit()
-    return conn
-
-
-
+# ============ Chargement Excel auto ============
+@st.cache_resource(show_spinner=False)
+def get_catalog_manager() -> CatalogManager:
+    # un seul gestionnaire par process (partagé avec warmup.py) : parse initial au démarrage, puis rechargement à chaud
+    return catalog_manager(DEFAULT_EXCEL_PATH)
 
-def load_profile():
-    conn = init_db()
-    cur = conn.execute("SELECT sexe,age,taille_cm,poids_kg,activite,prot_pct,gluc_pct,lip_pct FROM profile WHERE id=1;")
-    row = cur.fetchone()
-    if row:
-        return {"sexe":row[0],"age":row[1],"taille_cm":row[2],"poids_kg":row[3],
-                "activite":row[4],"repartition_macros":(row[5],row[6],row[7])}
-    return {"sexe":"Homme","age":40,"taille_cm":181.0,"poids_kg":72.0,"activite":"Sédentaire","repartition_macros":(30,55,15)}
 
 
 
+@st.cache_resource(show_spinner=False)
+def get_sync_engine() -> SyncEngine | None:
+    # synchro optionnelle (TOTUM_SYNC_URL) : tâche de fond, l'UI ne lit et n'écrit que totum.db
+    engine = engine_from_env()
+    return engine.start() if engine else None
 
-def save_profile(p):
-    conn = init_db()
-    conn.execute("""
-        INSERT INTO profile (id,sexe,age,taille_cm,poids_kg,activite,prot_pct,gluc_pct,lip_pct)
-        VALUES (1,?,?,?,?,?,?,?,?)
-        ON CONFLICT(id) DO UPDATE SET
-            sexe=excluded.sexe, age=excluded.age, taille_cm=excluded.taille_cm, poids_kg=excluded.poids_kg,
-            activite=excluded.activite, prot_pct=excluded.prot_pct, gluc_pct=excluded.gluc_pct, lip_pct=excluded.lip_pct;
-    """, (p["sexe"], int(p["age"]), float(p["taille_cm"]), float(p["poids_kg"]),
-          p["activite"], 30, 55, 15))
-    conn.commit()
 
 
 
+def current_catalog() -> CatalogSnapshot | None:
+    return get_catalog_manager().current()
 
-def insert_journal(date_iso, repas, nom, quantite_g, nutrients: dict):
-    conn = init_db()
-    conn.execute("INSERT INTO journal (date,repas,nom,quantite_g,nutrients_json) VALUES (?,?,?,?,?)",
-                 (date_iso, repas, nom, float(quantite_g), json.dumps(nutrients, ensure_ascii=False)))
-    conn.commit()
 
 
 
+def load_assets_default():
+    # simple prise de références sur la version publiée : aucun parse sur le thread UI
+    snap = current_catalog()
+    if snap is None: return
+    st.session_state["catalog_version"] = snap.version
+    st.session_state["foods"] = snap.foods
+    st.session_state["targets_micro"] = snap.micro_targets_for(st.session_state["profile"]["sexe"])
+    st.session_state["targets_macro"] = snap.targets_macro
 
-def delete_journal_row(row_id: int):
-    conn = init_db()
-    conn.execute("DELETE FROM journal WHERE id=?", (int(row_id),))
-    conn.commit()
 
 
 
+def food_nutrients(name: str, qty_g: float):
+    """Nutriments de qty_g grammes : vecteur float32 depuis la matrice du snapshot, sinon dict (liste de la session)."""
+    snap = current_catalog()
+    if snap is not None and snap.version == st.session_state.get("catalog_version"):
+        return snap.food_entry(name, qty_g, nutrient_schema(snap.nutrient_names))
+    foods = st.session_state["foods"]
+    row = foods.loc[foods["nom"] == name]
+    return None if row.empty else calc_from_food_row(row.iloc[0], qty_g)
 
-def fetch_journal_by_date(date_iso) -> pd.DataFrame:
-    conn = init_db()
-    cur = conn.execute("SELECT id,date,repas,nom,quantite_g,nutrients_json FROM journal WHERE date=? ORDER BY id ASC;", (date_iso,))
-    rows = cur.fetchall()
-    if not rows: return pd.DataFrame(columns=["id","date","repas","nom","quantite_g"])
-    df = pd.DataFrame(rows, columns=["id","date","repas","nom","quantite_g","nutrients_json"])
-    expanded = []
-    for js in df["nutrients_json"]:
-        try: expanded.append(json.loads(js))
-        except Exception: expanded.append({})
-    nutr_df = pd.DataFrame(expanded).fillna(0.0)
-    return pd.concat([df.drop(columns=["nutrients_json"]), nutr_df], axis=1)
 
 
 
+def search_foods(q: str, limit: int) -> list[str]:
+    # backend choisi par le snapshot (mémoire ou FTS5) ; liste de la session si le snapshot a changé entre-temps
+    snap = current_catalog()
+    if snap is not None and snap.version == st.session_state.get("catalog_version"):
+        return snap.search(q, limit)
+    return journal_search_candidates(st.session_state["foods"], q, limit=limit)
 
-def fetch_last_date_with_rows() -> str | None:
-    conn = init_db()
-    cur = conn.execute("SELECT date, COUNT(*) c FROM journal GROUP BY date ORDER BY date DESC;")
-    r = cur.fetchone()
-    return r[0] if r else None
 
 
 
+def gap_recommendations(date_iso: str, totals: pd.Series | None = None, k: int = 5) -> pd.DataFrame:
+    """Aliments qui comblent le mieux les manques du jour (matrice du snapshot), en cache comme les vues."""
+    snap = current_catalog()
+    if snap is None or snap.version != st.session_state.get("catalog_version"): return pd.DataFrame()
+    return cached_view(f"reco{k}", date_iso, lambda: snap.recommender.recommend(
+        unify_totals_for_date(date_iso) if totals is None else totals,
+        st.session_state.get("profile_targets") or get_profile_targets_cached(),
+        st.session_state.get("targets_micro"), k=k))
 
-# ============ Chargement Excel auto ============
-def build_objectif_robuste(df: pd.DataFrame) -> pd.Series:
-    if df is None or df.empty: return pd.Series(dtype=float)
-    candidates = [c for c in ["Objectif","Ojectifs","Cible","Objectifs","Objectif (jour)","Target","Cible (jour)"] if c in df.columns]
-    out = pd.Series(0.0, index=df.index, dtype=float)
-    for c in candidates:
-        v = coerce_num_col(df[c])
-        out = out.where(out > 0, v.fillna(0.0))
-    return pd.Series([round1(x) for x in out], index=df.index, dtype=float)
 
 
 
-
-def load_assets_default():
-    if not DEFAULT_EXCEL_PATH.exists(): return
-    # Liste
-    df_liste = read_sheet_values_path(DEFAULT_EXCEL_PATH, "Liste")
-    if df_liste is not None and not df_liste.empty:
-        st.session_state["foods"] = clean_liste(df_liste)
-    # Cibles micro
-    sex = st.session_state["profile"]["sexe"]
-    micro_sheet = "Cible micro Homme" if canon(sex).startswith("homme") else "Cible micro Femme"
-    df_micro = read_sheet_values_path(DEFAULT_EXCEL_PATH, micro_sheet)
-    if df_micro is not None and "Nutriment" in df_micro.columns:
-        tm = drop_parasite_columns(df_micro.copy()); tm["Objectif"] = build_objectif_robuste(tm)
-        keep = [c for c in ["Nutriment","Icône","Fonction","Bénéfice Santé","Objectif"] if c in tm.columns]
-        st.session_state["targets_micro"] = tm[keep]
-    # Cibles macro
-    df_macro_raw = read_sheet_values_path(DEFAULT_EXCEL_PATH, "Cible Macro")
-    if df_macro_raw is not None and "Nutriment" in df_macro_raw.columns:
-        tmac = drop_parasite_columns(df_macro_raw.copy()); tmac["Objectif"] = build_objectif_robuste(tmac)
-        keep = [c for c in ["Nutriment","Icône","Fonction","Bénéfice Santé","Objectif"] if c in tmac.columns]
-        st.session_state["targets_macro"] = tmac[keep]
-
-
-
-
-def macro_base_name(label: str) -> str:
-    name, _ = parse_name_unit(label); nc = canon(name); ns = nc.replace(" ", "")
-    if nc.startswith("energie"): return "energie"
-    if nc.startswith("proteine"): return "proteines"
-    if nc.startswith("glucide"): return "glucides"
-    if nc.startswith("lipide"): return "lipides"
-    if nc.startswith("sucres"): return "sucres"
-    if "acides grassatures" in nc or "acides gras satures" in nc or "ag satures" in nc or "agsatures" in nc: return "agsatures"
-    if "omega9" in ns or ("oleique" in nc and "w9" in nc): return "omega9"
-    if "omega6" in ns or ("linoleique" in nc and ("w6" in nc or "la" in nc)): return "omega6"
-    if "epa" in nc: return "epa"
-    if "dha" in nc: return "dha"
-    if "omega3" in ns or "w3" in ns or ("alpha" in nc and "linolenique" in nc) or "ala" in nc: return "ala"
-    if nc.startswith("fibres"): return "fibres"
-    if nc.startswith("sel"): return "sel"
-    return name
+def render_recommendations(reco: pd.DataFrame, date_iso: str, repas: str, key: str):
+    if reco.empty:
+        st.caption("Rien à proposer : objectifs atteints ou catalogue sans valeurs nutritionnelles."); return
+    for i, r in enumerate(reco.itertuples(index=False)):
+        cA, cB, cC = st.columns([5,4,1])
+        cA.write(f"• **{r.Aliment}**")
+        cB.caption(f"{r.Grammes:.0f} g — {r.Comble}")
+        if cC.button("➕", key=f"{key}_{i}"):
+            calc = food_nutrients(r.Aliment, float(r.Grammes))
+            if calc is not None:
+                insert_journal(date_iso, repas, r.Aliment, float(r.Grammes), calc)
+                st.session_state["last_added_date"] = date_iso
+                st.success(f"Ajouté : {r.Grammes:.0f} g de {r.Aliment} ({repas})")
 
 
 
 
 # ============ Session ============
+warmup(DEFAULT_EXCEL_PATH)  # une fois par process (déjà fait si le serveur a été lancé par `python warmup.py serve`)
 if "foods" not in st.session_state: st.session_state["foods"] = pd.DataFrame(columns=["nom"])
 if "targets_micro" not in st.session_state: st.session_state["targets_micro"] = pd.DataFrame()
 if "targets_macro" not in st.session_state: st.session_state["targets_macro"] = pd.DataFrame()
-if "logo_bytes" not in st.session_state: st.session_state["logo_bytes"] = None
+if "catalog_version" not in st.session_state: st.session_state["catalog_version"] = 0
 if "profile" not in st.session_state: st.session_state["profile"] = load_profile()
 if "last_added_date" not in st.session_state: st.session_state["last_added_date"] = None
 if "profile_targets" not in st.session_state: st.session_state["profile_targets"] = get_profile_targets_cached()
+get_sync_engine()  # démarre la synchro de fond si TOTUM_SYNC_URL est défini
 
 
 
 
-# -- logo auto
-def _reload_default_logo():
-    if DEFAULT_LOGO_PATH.exists():
-        st.session_state["logo_bytes"] = DEFAULT_LOGO_PATH.read_bytes()
-_reload_default_logo()
 load_assets_default()
 
 
 
 
-def _logo_b64() -> str | None:
-    data = st.session_state.get("logo_bytes")
-    if not data and DEFAULT_LOGO_PATH.exists():
-        data = DEFAULT_LOGO_PATH.read_bytes()
-    return base64.b64encode(data).decode() if data else None
-
-
-
-
 # ===================== HEADER + FAVICON =====================
-apply_mobile_css_and_topbar(_logo_b64())
-set_favicon_from_logo(_logo_b64())
+apply_mobile_css_and_topbar(LOGO_ASSETS.src(static=bool(st.get_option("server.enableStaticServing")))
+                            if LOGO_ASSETS else None)
 
 
 
@@ -642,55 +308,6 @@ set_favicon_from_logo(_logo_b64())
 
 
 
-# ---------- helper: improved search/fuzzy (lightweight, no extra dependency) ----------
-def journal_search_candidates(foods_df: pd.DataFrame, q: str, limit: int = 12) -> list[str]:
-    """
-    Recherche optimisée :
-    - priorité startswith (meilleure correspondance)
-    - ensuite token match (tous tokens présents)
-    - ensuite contains
-    - fallback : approximate by character overlap score
-    """
-    if foods_df is None or foods_df.empty:
-        return []
-    q = (q or "").strip()
-    base = foods_df["nom"].astype(str).tolist()
-    if not q:
-        return base[:limit]
-    q_canon = canon(q)
-    q_tokens = [t for t in q_canon.split(" ") if t]
-    starts = []
-    token_match = []
-    contains = []
-    for name in base:
-        c = canon(name)
-        if c.startswith(q_canon):
-            starts.append(name); continue
-        # token match: all tokens present
-        if all(tok in c for tok in q_tokens):
-            token_match.append(name); continue
-        if q_canon in c:
-            contains.append(name); continue
-    # fallback approximate: score by number of matching chars (simple heuristic)
-    rest = [n for n in base if n not in starts and n not in token_match and n not in contains]
-    def char_score(a, b):
-        sa = set(canon(a))
-        sb = set(canon(b))
-        inter = len(sa & sb)
-        union = max(len(sa | sb), 1)
-        return inter / union
-    rest_sorted = sorted(rest, key=lambda x: -char_score(x, q_canon))
-    out = starts + token_match + contains + rest_sorted
-    # dedupe preserving order
-    seen = set(); uniq = []
-    for x in out:
-        if x not in seen:
-            uniq.append(x); seen.add(x)
-    return uniq[:limit]
-
-
-
-
 # ---------- render profile (unchanged majorly) ----------
 def render_profile_page():
     st.subheader("👤 Profil")
@@ -728,6 +345,146 @@ def render_profile_page():
 
 
 
+# ---------- lignes du jour (paginées) ----------
+JOURNAL_PAGE_SIZE = 50
+JOURNAL_PREFERRED_ORDER = ["date","repas","nom","quantite_g","Énergie_kcal","Protéines_g","Glucides_g","Lipides_g",
+                           "Fibres_g","AG_saturés_g","Acide_linoléique_W6_LA_g","Acide_oléique_W9_g",
+                           "Acide_alpha-linolénique_W3_ALA_g","EPA_g","DHA_g"]
+
+
+
+
+def render_journal_rows(date_iso: str):
+    # pagination keyset sur id : on garde la pile des id de départ de chaque page (précédent = pop)
+    nav = st.session_state.get("journal_page")
+    if not nav or nav["date"] != date_iso: nav = st.session_state["journal_page"] = {"date": date_iso, "starts": [0]}
+    total = count_journal_by_date(date_iso)
+    df_page = fetch_journal_page(date_iso, nav["starts"][-1], JOURNAL_PAGE_SIZE)
+    if df_page.empty and len(nav["starts"]) > 1:   # page vidée par des suppressions
+        nav["starts"] = [0]; df_page = fetch_journal_page(date_iso, 0, JOURNAL_PAGE_SIZE)
+    if df_page.empty:
+        st.dataframe(df_page, use_container_width=True); return
+
+    n_pages = max(1, -(-total // JOURNAL_PAGE_SIZE)); page = len(nav["starts"])
+    if n_pages > 1:
+        cp, cinfo, cn = st.columns([1,3,1])
+        if cp.button("◀ Précédent", disabled=page == 1, key="journal_prev"):
+            nav["starts"].pop(); st.rerun()
+        cinfo.caption(f"{total} lignes — page {page}/{n_pages}")
+        if cn.button("Suivant ▶", disabled=page >= n_pages, key="journal_next"):
+            nav["starts"].append(int(df_page["id"].iloc[-1])); st.rerun()
+
+    cols = [c for c in JOURNAL_PREFERRED_ORDER if c in df_page.columns] + \
+           [c for c in df_page.columns if c not in JOURNAL_PREFERRED_ORDER]
+    df_show = df_page[cols].copy()
+    numcols = df_show.select_dtypes(include=[np.number]).columns.difference(["id"])
+    df_show[numcols] = df_show[numcols].round(1)
+    st.dataframe(df_show.drop(columns=["id"]), use_container_width=True)
+
+    st.markdown("#### Supprimer une ligne")
+    labels = dict(zip(df_page["id"].astype(int),
+                      "#" + df_page["id"].astype(int).astype(str) + " — " + df_page["repas"].astype(str) + ": "
+                      + df_page["nom"].astype(str) + " (" + df_page["quantite_g"].astype(float).round(1).astype(str) + " g)"))
+    sel_id = st.selectbox("Ligne à supprimer", list(labels), format_func=labels.get)
+    if st.button("🗑️ Supprimer cette ligne"):
+        delete_journal_row(int(sel_id)); st.success(f"Ligne #{sel_id} supprimée."); st.rerun()
+
+
+
+
+def render_swaps(date_iso: str):
+    """Échange plus léger (moins d'AG saturés, de sucres ou de sel, profil nutritionnel proche) d'un aliment du jour."""
+    snap = current_catalog()
+    names = journal_names_by_date(date_iso)
+    if snap is None or not names: return
+    with st.expander("🔁 Échanges plus légers"):
+        nom = st.selectbox("Aliment du jour", names, key="swap_food")
+        worst, swaps = snap.substitution_index().healthier_swaps(nom)
+        if swaps.empty:
+            st.caption("Pas d'échange proche trouvé dans le catalogue."); return
+        st.caption(f"Aliments proches avec moins de {worst.rsplit('_', 1)[0].replace('_', ' ')} (écarts pour 100 g) :")
+        st.dataframe(swaps, hide_index=True, use_container_width=True)
+
+
+
+
+def render_meal_planner(date_iso: str, repas: str):
+    """Journée type : le QP de planner.py sur les meilleurs candidats du recommandeur (+ aliments déjà saisis)."""
+    snap = current_catalog()
+    if snap is None or snap.version != st.session_state.get("catalog_version"): return
+    with st.expander("🧮 Journée type optimisée"):
+        c1, c2 = st.columns(2)
+        n_cand = c1.number_input("Aliments candidats", min_value=20, max_value=1000, value=150, step=10, key="plan_n")
+        g_max = c2.number_input("Max par aliment (g)", min_value=50, max_value=1000, value=250, step=25, key="plan_gmax")
+        if st.button("Calculer un plan", key="plan_run"):
+            reco = snap.recommender.recommend(pd.Series(dtype=float),
+                                              st.session_state.get("profile_targets") or get_profile_targets_cached(),
+                                              st.session_state.get("targets_micro"), k=int(n_cand))
+            names = [n for n in dict.fromkeys([*reco["Aliment"], *journal_names_by_date(date_iso)]) if n in snap.row_of]
+            st.session_state["meal_plan"] = optimize_plan(
+                names, snap.nutrient_names, snap.matrix[[snap.row_of[n] for n in names]],
+                st.session_state.get("profile_targets") or get_profile_targets_cached(),
+                st.session_state.get("targets_micro"), bounds=(0.0, float(g_max)))
+        plan = st.session_state.get("meal_plan")
+        if plan is None: return
+        st.caption(f"{len(plan.plan)} aliments — résolu en {plan.solve_s*1000:.0f} ms ({plan.iterations} itérations)")
+        st.dataframe(plan.plan, hide_index=True, use_container_width=True)
+        st.dataframe(plan.achieved.drop(columns=["Plafond"]), hide_index=True, use_container_width=True)
+        if st.button("➕ Ajouter tout le plan au journal", key="plan_add"):
+            ids = insert_journal_batch(plan.journal_rows(date_iso, repas, food_nutrients))
+            st.session_state["last_added_date"] = date_iso
+            st.session_state.pop("meal_plan", None)
+            st.success(f"{len(ids)} lignes ajoutées ({repas})")
+
+
+
+
+SEARCH_DEBOUNCE_MS = 300
+
+
+
+
+@st.fragment
+def render_quick_add():
+    """
+    Recherche + ajout rapide isolés : une frappe ne relance que ce bloc (avec streamlit-keyup, après
+    SEARCH_DEBOUNCE_MS ms sans frappe ; sinon à l'Entrée ou en quittant le champ).
+    Un ajout ne relance que ce bloc : les totaux du jour affichés ici sont recalculés (clé journal_version(jour)),
+    le reste de la page suit au prochain rerun complet, les vues des autres jours restent en cache.
+    """
+    flash = st.session_state.pop("quick_add_flash", None)
+    if flash: st.success(flash)
+    label, hint = "🔎 Rechercher un aliment", "Tape 2-3 lettres… (ex: poulet, riz, pomme)"
+    if st_keyup is not None:
+        q = st_keyup(label, key="journal_q", debounce=SEARCH_DEBOUNCE_MS, placeholder=hint)
+    else:
+        q = st.text_input(label, placeholder=hint, key="journal_q")
+    today = dt.date.today().isoformat()
+    if st.session_state.get("last_added_date") == today:
+        t = cached_view("quick_totals", today, lambda: unify_totals_for_date(today))
+        st.caption(f"Aujourd'hui : {float(t.get('Énergie_kcal', 0.0)):.0f} kcal · "
+                   f"{float(t.get('Protéines_g', 0.0)):.1f} g de protéines")
+    # Generate prioritized suggestions (journal_search_candidates ou FTS5, cf. TOTUM_SEARCH_BACKEND)
+    suggestions = search_foods(q, 10)
+    if not suggestions: return
+    st.caption("Suggestions rapides : choisis puis ajoute en un clic 👇")
+    cA, cB, cC = st.columns([6,2,2])
+    name = cA.radio("Suggestions", suggestions, key="quick_pick", label_visibility="collapsed")
+    qty_val = cB.number_input("g", min_value=1, value=150, step=10, key="quick_qty")
+    if cC.button("➕ Ajouter", key="quick_add"):
+        calc = food_nutrients(name, qty_val)
+        if calc is not None:
+            insert_journal(today, "Déjeuner", name, qty_val, calc)
+            st.session_state["last_added_date"] = today
+            st.session_state["quick_add_flash"] = f"Ajouté : {qty_val} g de {name} (Déjeuner)"
+            try:
+                st.rerun(scope="fragment")
+            except StreamlitAPIException:   # clic traité pendant un rerun complet (ex. AppTest) : pas de portée fragment
+                st.rerun()
+
+
+
+
 # ---------- render journal (improved search + UX) ----------
 def render_journal_page():
     st.subheader("🧾 Journal")
@@ -736,26 +493,7 @@ def render_journal_page():
 
 
 
-    # Recherche intelligente
-    q = st.text_input("🔎 Rechercher un aliment", placeholder="Tape 2-3 lettres… (ex: poulet, riz, pomme)")
-    # Generate prioritized suggestions using journal_search_candidates
-    suggestions = journal_search_candidates(foods, q, limit=10)
-    if suggestions:
-        st.caption("Suggestions rapides : clique pour ajouter en un clic 👇")
-        for idx, name in enumerate(suggestions):
-            with st.container():
-                cA, cB, cC = st.columns([6,2,2])
-                cA.write(f"• {name}")
-                qty_key = f"qty_sugg_{idx}"
-                qty_val = cB.number_input("g", min_value=1, value=150, step=10, key=qty_key, label_visibility="collapsed")
-                if cC.button("➕", key=f"add_sugg_{idx}"):
-                    row = foods.loc[foods["nom"] == name]
-                    if not row.empty:
-                        row = row.iloc[0]
-                        calc = calc_from_food_row(row, qty_val)
-                        insert_journal(dt.date.today().isoformat(), "Déjeuner", name, qty_val, calc)
-                        st.session_state["last_added_date"] = dt.date.today().isoformat()
-                        st.success(f"Ajouté : {qty_val} g de {name} (Déjeuner)")
+    render_quick_add()
 
 
 
@@ -770,17 +508,16 @@ def render_journal_page():
     date_sel = c1.date_input("Date", value=dt.date.today(), format="DD/MM/YYYY", key="date_input_journal")
     repas = c2.selectbox("Repas", ["Petit-déjeuner","Déjeuner","Dîner","Collation"])
     qty = c3.number_input("Quantité (g)", min_value=1, value=150, step=10)
-    options = foods["nom"].astype(str).tolist() if not foods.empty else ["(liste vide)"]
-    # apply local filtering with same search heuristic to keep options small & fast
-    if q:
-        options = journal_search_candidates(foods, q, limit=200) or options
+    # liste complète, filtrée par la saisie du menu lui-même : la recherche rapide vit dans son fragment
+    # (magasin importé : pas de liste complète en mémoire, seule la recherche rapide sert)
+    snap = current_catalog()
+    options = (foods["nom"].astype(str).tolist() if not foods.empty
+               else ["(recherche rapide ci-dessus)" if snap is not None and len(snap) else "(liste vide)"])
     nom = c4.selectbox("Aliment (liste)", options=options)
     if st.button("➕ Ajouter (depuis la liste)"):
         if not foods.empty and nom != "(liste vide)":
-            row = foods.loc[foods["nom"] == nom]
-            if not row.empty:
-                row = row.iloc[0]
-                calc = calc_from_food_row(row, qty)
+            calc = food_nutrients(nom, qty)
+            if calc is not None:
                 insert_journal(date_sel.isoformat(), repas, nom, qty, calc)
                 st.session_state["last_added_date"] = date_sel.isoformat()
                 st.success(f"Ajouté : {qty} g de {nom} ({repas})")
@@ -849,320 +586,219 @@ def render_journal_page():
 
 
     st.markdown("### Lignes du jour")
-    df_day = fetch_journal_by_date(date_sel.isoformat())
-    if not df_day.empty:
-        preferred_order = ["date","repas","nom","quantite_g","Énergie_kcal","Protéines_g","Glucides_g","Lipides_g",
-                           "Fibres_g","AG_saturés_g","Acide_linoléique_W6_LA_g","Acide_oléique_W9_g",
-                           "Acide_alpha-linolénique_W3_ALA_g","EPA_g","DHA_g"]
-        cols = [c for c in preferred_order if c in df_day.columns] + [c for c in df_day.columns if c not in preferred_order]
-        df_show = df_day[cols].copy()
-        numcols = df_show.select_dtypes(include=[np.number]).columns
-        df_show[numcols] = df_show[numcols].applymap(round1)
-        st.dataframe(df_show.drop(columns=["id"]), use_container_width=True)
-    else:
-        st.dataframe(df_day, use_container_width=True)
+    render_journal_rows(date_sel.isoformat())
 
 
 
 
-    if not df_day.empty:
-        st.markdown("#### Supprimer une ligne")
-        options = df_day[["id","repas","nom","quantite_g"]].copy()
-        options["label"] = options.apply(lambda r: f'#{int(r["id"])} — {r["repas"]}: {r["nom"]} ({round1(r["quantite_g"])} g)', axis=1)
-        sel_label = st.selectbox("Ligne à supprimer", options["label"].tolist())
-        sel_id = int(options.loc[options["label"].eq(sel_label), "id"].iloc[0])
-        if st.button("🗑️ Supprimer cette ligne"):
-            delete_journal_row(sel_id); st.success(f"Ligne #{sel_id} supprimée."); st.rerun()
+    render_swaps(date_sel.isoformat())
 
 
 
 
-# ---------- bilan (inchangé sauf petites optimisations) ----------
-def unify_totals_for_date(date_iso: str) -> pd.Series:
-    df_today = fetch_journal_by_date(date_iso)
-    if not df_today.empty:
-        base_exclude = {"id","date","repas","nom","quantite_g"}
-        df_clean = drop_parasite_columns(df_today).copy()
-        for c in df_clean.columns:
-            if c not in base_exclude: df_clean[c] = pd.to_numeric(df_clean[c], errors="coerce")
-        df_num = df_clean.drop(columns=[c for c in base_exclude if c in df_clean.columns], errors="ignore")
-        raw = df_num.sum(numeric_only=True)
-        return unify_totals_series(raw)
-    return pd.Series(dtype=float)
+    render_meal_planner(date_sel.isoformat(), repas)
 
 
 
 
-def render_bilan_page():
-    st.subheader("📊 Bilan")
-    default_bilan_date = dt.date.today()
-    last_with = fetch_last_date_with_rows()
-    if last_with and fetch_journal_by_date(default_bilan_date.isoformat()).empty:
-        if st.session_state.get("last_added_date"):
-            try: default_bilan_date = pd.to_datetime(st.session_state["last_added_date"]).date()
-            except Exception: default_bilan_date = pd.to_datetime(last_with).date()
-        else:
-            default_bilan_date = pd.to_datetime(last_with).date()
+    st.markdown("### 🎯 Pour compléter la journée")
+    render_recommendations(gap_recommendations(date_sel.isoformat()), date_sel.isoformat(), repas, "reco_journal")
 
 
 
 
-    date_bilan = st.date_input("Date", value=default_bilan_date, format="DD/MM/YYYY", key="date_bilan")
-    df_day = fetch_journal_by_date(date_bilan.isoformat())
-    totals = unify_totals_for_date(date_bilan.isoformat())
+# ---------- bilan (inchangé sauf petites optimisations) ----------
+def unify_totals_for_date(date_iso: str) -> pd.Series:
+    snap = current_catalog()
+    return unify_totals_frame(fetch_journal_by_date(date_iso), labels=snap.labels if snap else None)
 
 
 
 
-    targets_macro = st.session_state["targets_macro"].copy()
-    targets_micro = st.session_state["targets_micro"].copy()
-    profile_targets = st.session_state.get("profile_targets", get_profile_targets_cached())
+def session_view_cache() -> ViewModelCache:
+    if "vm_cache" not in st.session_state: st.session_state["vm_cache"] = ViewModelCache()
+    return st.session_state["vm_cache"]
 
 
 
 
-    # === ALA : calcul conso robuste ===
-    def _find_ala_columns_in(dfcols: list[str]) -> list[str]:
-        cols = []
-        for c in dfcols:
-            ck = canon_key(c)
-            if "epa" in ck or "dha" in ck: continue
-            if ("ala" in ck and ("omega3" in ck or "w3" in ck)) or ("alpha" in ck and "linolen" in ck) \
-               or ck.endswith("alag") or ck.endswith("ala") or "acidealphalinoleniquew3" in ck:
-                cols.append(c)
-        return cols
+def view_key(kind: str, date_iso: str | None, catalog_version: int, profile_key: str) -> tuple:
+    # sans Streamlit : aussi calculée par le thread de préchargement
+    return (kind, LOCAL_USER, date_iso, journal_version(date_iso), catalog_version, profile_key)
 
 
 
 
-    def _ala_consumed_from_day(df: pd.DataFrame, totals_series: pd.Series) -> float:
-        if df is not None and not df.empty and "Acide_alpha-linolénique_W3_ALA_g" in df.columns:
-            return float(pd.to_numeric(df["Acide_alpha-linolénique_W3_ALA_g"], errors="coerce").fillna(0.0).sum())
-        if df is not None and not df.empty:
-            ala_cols = _find_ala_columns_in(df.columns.tolist())
-            if ala_cols:
-                s = pd.DataFrame(df[ala_cols]).apply(pd.to_numeric, errors="coerce").fillna(0.0)
-                return float(s.sum(numeric_only=True).sum())
-        if isinstance(totals_series, pd.Series) and not totals_series.empty:
-            cand = _find_ala_columns_in(list(totals_series.index))
-            if cand:
-                return float(pd.to_numeric(totals_series[cand], errors="coerce").fillna(0.0).sum())
-            if "Acide_alpha-linolénique_W3_ALA_g" in totals_series.index:
-                return float(pd.to_numeric(pd.Series([totals_series["Acide_alpha-linolénique_W3_ALA_g"]]), errors="coerce").fillna(0.0).iloc[0])
-        return 0.0
+def cached_view(kind: str, date_iso: str | None, build):
+    """
+    Modèle de vue mis en cache par session ; la clé change dès que ce jour du journal (tout le journal si
+    date_iso est None), le catalogue ou le profil change.
+    """
+    key = view_key(kind, date_iso, st.session_state.get("catalog_version", 0), profile_hash(st.session_state["profile"]))
+    return session_view_cache().get_or_build(key, build)
 
 
 
 
-    ala_from_day = _ala_consumed_from_day(df_day, totals)
+def render_donuts_grid(items, cols=5, height=205):
+    cfg = {"displaylogo": False, "responsive": True, "staticPlot": True}
+    for i in range(0, len(items), cols):
+        row_items = items[i:i+cols]
+        row_cols = st.columns(len(row_items))
+        for col, it in zip(row_cols, row_items):
+            with col:
+                st.markdown(f"<div class='donut-title'>{it['title']}</div>", unsafe_allow_html=True)
+                fig = donut(it["cons"], it["target"], it["title"], it.get("color","energie"), height=height)
+                st.plotly_chart(fig, config=cfg, use_container_width=True)
 
 
 
 
-    MACRO_KEYS = {
-        "Énergie":["Énergie_kcal","Energie_kcal","kcal","energie_kcal"],
-        "Protéines":["Protéines_g","Proteines_g"], "Glucides":["Glucides_g"], "Lipides":["Lipides_g"],
-        "Fibres":["Fibres_g","Fibre_g"], "Sucres":["Sucres_g"],
-        "AG saturés":["AG_saturés_g","Acides_gras_saturés_g","AG_satures_g"],
-        "Oméga-9":["Acide_oléique_W9_g","Acide_oleique_W9_g"],
-        "Oméga-6":["Acide_linoléique_W6_LA_g","Acide_linoleique_W6_LA_g"],
-        "EPA":["EPA_g"], "DHA":["DHA_g"], "Sel":["Sel_g"],
-    }
+def pct_color(p):
+    if pd.isna(p): return COLORS["warn"]
+    if p < 50: return COLORS["bad"]
+    if p < 100: return COLORS["warn"]
+    return COLORS["ok"]
 
 
 
 
-    def _any_of(keys) -> float:
-        for key in keys:
-            if key in totals.index and pd.notna(totals[key]): return float(totals[key])
-        keyset = [canon_key(k) for k in keys]
-        for idx in totals.index:
-            if canon_key(idx) in keyset and pd.notna(totals[idx]): return float(totals[idx])
-        return 0.0
+def micro_bar(df: pd.DataFrame, title: str):
+    if df.empty: st.info(f"Aucune donnée pour {title.lower()}."); return
+    xmax = float(max((df["Objectif"].max(), df["Consommée"].max()), default=0.0)) * 1.15 or 1.0
+    height = max(320, int(24*len(df)) + 110)
+    fig = go.Figure()
+    fig.add_bar(y=df["Nutriment"], x=df["Objectif"], name="Objectif", orientation="h",
+                marker_color=COLORS["objectif"], opacity=0.30, hovertemplate="Objectif: %{x:.1f}<extra></extra>")
+    fig.add_bar(y=df["Nutriment"], x=df["Consommée"], name="Ingéré", orientation="h",
+                marker_color=[pct_color(v) for v in df["% objectif"]],
+                text=[f"{c:.1f}/{o:.1f} ({p:.0f}%)" for c,o,p in zip(df["Consommée"], df["Objectif"], df["% objectif"])],
+                textposition="outside", cliponaxis=False, hovertemplate="Ingéré: %{x:.1f}<extra></extra>")
+    fig.update_layout(barmode="overlay", title=title, xaxis_title="", yaxis_title="", xaxis=dict(range=[0, xmax]),
+                      height=height, margin=dict(l=6,r=6,t=36,b=8), legend=dict(orientation="h", y=-0.18),
+                      font=dict(size=13), paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)")
+    st.plotly_chart(fig, config={"displaylogo":False,"responsive":True,"staticPlot":True}, use_container_width=True)
 
 
 
 
-    def consumed_value_for_strict(label: str) -> float:
-        base = macro_base_name(label)
-        if base == "energie":
-            p = float(totals.get("Protéines_g", totals.get("Proteines_g", 0.0)))
-            g = float(totals.get("Glucides_g", 0.0)); l = float(totals.get("Lipides_g", 0.0))
-            return p*4 + g*4 + l*9
-        if base == "ala": return ala_from_day
-        mapping = {"proteines":"Protéines","glucides":"Glucides","lipides":"Lipides","fibres":"Fibres","sucres":"Sucres",
-                   "agsatures":"AG saturés","omega9":"Oméga-9","omega6":"Oméga-6","epa":"EPA","dha":"DHA","sel":"Sel"}
-        if base in mapping: return _any_of(MACRO_KEYS.get(mapping[base], []))
-        if label in totals.index and pd.notna(totals[label]): return float(totals[label])
-        for idx in totals.index:
-            if canon_key(idx) == canon_key(label): return float(totals[idx])
-        return 0.0
+TREND_SPANS = {"3 mois": 91, "1 an": 365, "Tout": None}
 
 
 
 
-    def build_macros_df(targets_macro: pd.DataFrame, profile_targets: dict):
-        p = st.session_state["profile"]; xlt = excel_like_targets(p)
-        df = targets_macro.copy()
-        # Fallback si Excel vide
-        if df is None or df.empty or "Nutriment" not in df.columns:
-            rows = [
-                {"Nutriment":"Énergie (calories)-kcal","Icône":"🔥"},
-                {"Nutriment":"Lipides-g","Icône":"🥑"},
-                {"Nutriment":"AG saturés-g","Icône":"🥓"},
-                {"Nutriment":"Acide_oléique_W9-g","Icône":"🫒"},
-                {"Nutriment":"Acide_linoléique_W6_LA-g","Icône":"🌻"},
-                {"Nutriment":"Oméga-3 (ALA)-g","Icône":"🌱"},
-                {"Nutriment":"EPA-g","Icône":"🐟"},
-                {"Nutriment":"DHA-g","Icône":"🧠"},
-                {"Nutriment":"Glucides-g","Icône":"🍞"},
-                {"Nutriment":"Sucres-g","Icône":"🍬"},
-                {"Nutriment":"Fibres-g","Icône":"🌾"},
-                {"Nutriment":"Protéines-g","Icône":"💪"},
-                {"Nutriment":"Sel-g","Icône":"🧂"},
-            ]
-            df = pd.DataFrame(rows)
-        if "Objectif" not in df.columns: df["Objectif"] = np.nan
+def trend_chart(trend: pd.DataFrame, nutrients, width_px: int = DEFAULT_WIDTH_PX, method: str = "lttb"):
+    """Courbes de l'historique, réduites à la largeur du tracé ; WebGL pour les traces denses, kcal sur un 2e axe."""
+    fig = go.Figure(); dual = "Énergie_kcal" in nutrients and len(nutrients) > 1
+    for n in nutrients:
+        x, y = downsample(trend["date"], trend[n], width_px, method)
+        x = np.datetime_as_string(x, unit="D")   # "AAAA-MM-JJ" : charge utile plus courte que l'horodatage complet
+        trace = go.Scattergl if use_webgl(len(x)) else go.Scatter
+        fig.add_trace(trace(x=x, y=y, mode="lines", name=n.rsplit("_", 1)[0].replace("_", " "),
+                            yaxis="y2" if dual and n == "Énergie_kcal" else "y",
+                            hovertemplate="%{x|%d/%m/%Y} : %{y:.1f}<extra></extra>"))
+    fig.update_layout(height=320, margin=dict(l=6,r=6,t=10,b=8), legend=dict(orientation="h", y=-0.2),
+                      yaxis2=dict(overlaying="y", side="right", showgrid=False, title="kcal") if dual else None,
+                      font=dict(size=13), paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)")
+    return fig
 
 
 
 
-        # Calcul "type Excel" par défaut
-        def excel_objective_for_row(nutr_label: str) -> float | None:
-            base = macro_base_name(str(nutr_label))
-            m = {"energie":"energie_kcal","lipides":"lipides_g","agsatures":"agsatures_g","omega9":"omega9_g","omega6":"omega6_g",
-                 "ala":"ala_w3_g","epa":"epa_g","dha":"dha_g","glucides":"glucides_g","sucres":"sucres_g","fibres":"fibres_g",
-                 "proteines":"proteines_g","sel":"sel_g"}.get(base)
-            return excel_like_targets(p)[m] if m else None
+def render_trend():
+    """Historique des totaux par jour (agrégés par le stockage), calculé seulement quand l'interrupteur est activé."""
+    c1, c2 = st.columns([2, 3])
+    span = c1.radio("Période", list(TREND_SPANS), horizontal=True, key="trend_span")
+    nutrients = c2.multiselect("Nutriments", TREND_NUTRIENTS, default=["Énergie_kcal"], key="trend_nutrients",
+                               format_func=lambda n: n.rsplit("_", 1)[0].replace("_", " "))
+    last = fetch_last_date_with_rows()
+    if not last or not nutrients: st.info("Aucune donnée à afficher."); return
+    days = TREND_SPANS[span]
+    start = (dt.date.fromisoformat(last) - dt.timedelta(days=days - 1)).isoformat() if days else "0000-01-01"
+    trend = cached_view(f"tendance:{span}", None, lambda: build_trend_view(daily_totals(start, last)))
+    st.plotly_chart(trend_chart(trend, nutrients), config={"displaylogo": False, "responsive": True},
+                    use_container_width=True)
+    st.caption(f"{len(trend)} jours saisis — au plus {max_points()} points par courbe")
 
 
 
 
-        df["Objectif"] = df["Nutriment"].apply(lambda n: excel_objective_for_row(str(n)) if str(n) else np.nan)
+def bilan_context() -> dict:
+    """Entrées du modèle de vue Bilan lues dans la session (le thread de préchargement n'y a pas accès)."""
+    snap = current_catalog()
+    return {"labels": snap.labels if snap else None,
+            "targets_macro": st.session_state["targets_macro"], "targets_micro": st.session_state["targets_micro"],
+            "profile": st.session_state["profile"],
+            "profile_targets": st.session_state.get("profile_targets") or get_profile_targets_cached(),
+            "catalog_version": st.session_state.get("catalog_version", 0),
+            "profile_key": profile_hash(st.session_state["profile"])}
 
 
 
 
-        # 🔒 GARANTIE : ligne ALA présente et objectif non nul
-        df["_base"] = df["Nutriment"].apply(macro_base_name)
-        if df[df["_base"].eq("ala")].empty:
-            df = pd.concat([df, pd.DataFrame([{"Nutriment":"Oméga-3 (ALA)-g","Icône":"🌱","Objectif":np.nan}])], ignore_index=True)
-            df["_base"] = df["Nutriment"].apply(macro_base_name)
+def build_bilan_for(date_iso: str, ctx: dict) -> dict:
+    df_day = fetch_journal_by_date(date_iso)
+    totals = unify_totals_frame(df_day, labels=ctx["labels"])
+    return build_bilan_view(df_day, totals, ctx["targets_macro"], ctx["targets_micro"], ctx["profile"],
+                            ctx["profile_targets"])
 
 
 
 
-        omega3_from_profile = float(profile_targets.get("ala_w3_g", excel_like_targets(p)["ala_w3_g"]))
-        df.loc[df["_base"].eq("ala"), "Objectif"] = omega3_from_profile
+@st.cache_resource(show_spinner=False)
+def get_prefetcher() -> Prefetcher:
+    # un thread de fond par process, partagé par les sessions (chacune remplit son propre cache)
+    return Prefetcher()
 
 
 
 
-        # Consommations + % objectifs
-        df["Consommée"] = df["Nutriment"].apply(consumed_value_for_strict)
-        df["Objectif"]  = pd.to_numeric(df["Objectif"], errors="coerce").fillna(omega3_from_profile)
-        df["Consommée"] = pd.to_numeric(df["Consommée"], errors="coerce").fillna(0.0)
-        df["Objectif"]   = df["Objectif"].apply(round1); df["Consommée"] = df["Consommée"].apply(round1)
-        df["% objectif"] = percent(df["Consommée"], df["Objectif"]).apply(round1)
-        for c in ["Icône"]:
-            if c not in df.columns: df[c] = ""
-            df[c] = df[c].fillna("")
-        return df
+def prefetch_adjacent_days(day: dt.date, ctx: dict):
+    """J-1 et J+1 construits en tâche de fond dans le cache de la session : naviguer jour par jour devient instantané."""
+    cache = session_view_cache()
+    for d_iso in ((day - dt.timedelta(days=1)).isoformat(), (day + dt.timedelta(days=1)).isoformat()):
+        get_prefetcher().submit(
+            cache, (id(cache), "bilan", d_iso, ctx["catalog_version"], ctx["profile_key"]),
+            lambda d_iso=d_iso: view_key("bilan", d_iso, ctx["catalog_version"], ctx["profile_key"]),
+            lambda d_iso=d_iso: build_bilan_for(d_iso, ctx))
 
 
 
 
-    macros_df = build_macros_df(st.session_state["targets_macro"].copy(), profile_targets)
+def render_bilan_page():
+    st.subheader("📊 Bilan")
+    default_bilan_date = dt.date.today()
+    last_with = fetch_last_date_with_rows()
+    if last_with and count_journal_by_date(default_bilan_date.isoformat()) == 0:
+        if st.session_state.get("last_added_date"):
+            try: default_bilan_date = pd.to_datetime(st.session_state["last_added_date"]).date()
+            except Exception: default_bilan_date = pd.to_datetime(last_with).date()
+        else:
+            default_bilan_date = pd.to_datetime(last_with).date()
+
 
 
 
+    date_bilan = st.date_input("Date", value=default_bilan_date, format="DD/MM/YYYY", key="date_bilan")
+    date_iso = date_bilan.isoformat()
 
-    def render_donuts_grid(items, cols=5, height=205):
-        cfg = {"displaylogo": False, "responsive": True, "staticPlot": True}
-        for i in range(0, len(items), cols):
-            row_items = items[i:i+cols]
-            row_cols = st.columns(len(row_items))
-            for col, it in zip(row_cols, row_items):
-                with col:
-                    st.markdown(f"<div class='donut-title'>{it['title']}</div>", unsafe_allow_html=True)
-                    fig = donut(it["cons"], it["target"], it["title"], it.get("color","energie"), height=height)
-                    st.plotly_chart(fig, config=cfg, use_container_width=True)
+    ctx = bilan_context()
+    view = cached_view("bilan", date_iso, lambda: build_bilan_for(date_iso, ctx))
 
 
 
 
     # === Macros principaux
     st.markdown("### 🌾 Macros principaux")
-    def val_pair(base_name, fallback):
-        md = macros_df.copy(); md["_base"] = md["Nutriment"].apply(macro_base_name)
-        sel = md[md["_base"].eq(base_name)]
-        if sel.empty: return 0.0, round1(fallback)
-        row = sel.iloc[0]
-        cons = pd.to_numeric(pd.Series([row.get("Consommée", 0)]), errors="coerce").fillna(0).iloc[0]
-        obj  = pd.to_numeric(pd.Series([row.get("Objectif",  fallback)]), errors="coerce").fillna(fallback).iloc[0]
-        return float(cons), round1(obj)
-
-
-
-
-    xlt = excel_like_targets(st.session_state["profile"])
-    c1,t1 = val_pair("energie",   xlt["energie_kcal"])
-    c2,t2 = val_pair("proteines", xlt["proteines_g"])
-    c3,t3 = val_pair("glucides",  xlt["glucides_g"])
-    c4,t4 = val_pair("lipides",   xlt["lipides_g"])
-    c5,t5 = val_pair("fibres",    xlt["fibres_g"])
-    render_donuts_grid([
-        {"title":"Énergie (kcal)", "cons":c1,"target":t1,"color":"energie"},
-        {"title":"Protéines (g)",  "cons":c2,"target":t2,"color":"proteines"},
-        {"title":"Glucides (g)",   "cons":c3,"target":t3,"color":"glucides"},
-        {"title":"Lipides (g)",    "cons":c4,"target":t4,"color":"lipides"},
-        {"title":"Fibres (g)",     "cons":c5,"target":t5,"color":"fibres"},
-    ])
-
-
-
-
+    render_donuts_grid(view["macros"])
     # === Acides gras essentiels
     st.markdown("### 🫒 Acides gras essentiels")
-    def donut_vals(base_label: str, fallback: float):
-        if macros_df.empty or "Nutriment" not in macros_df.columns: return 0.0, round1(fallback)
-        md = macros_df.copy(); md["_base"] = md["Nutriment"].apply(macro_base_name)
-        sel = md[md["_base"].eq(base_label)]
-        if sel.empty: return 0.0, round1(fallback)
-        row = sel.iloc[0]
-        cons = pd.to_numeric(pd.Series([row.get("Consommée", 0)]), errors="coerce").fillna(0).iloc[0]
-        obj  = pd.to_numeric(pd.Series([row.get("Objectif",  fallback)]), errors="coerce").fillna(fallback).iloc[0]
-        return float(cons), round1(obj)
-
-
-
-
-    a_c,a_t   = donut_vals("ala",    xlt["ala_w3_g"])
-    epa_c,epa_t=donut_vals("epa",    xlt["epa_g"])
-    dha_c,dha_t=donut_vals("dha",    xlt["dha_g"])
-    la_c,la_t = donut_vals("omega6", xlt["omega6_g"])
-    o9_c,o9_t = donut_vals("omega9", xlt["omega9_g"])
-    render_donuts_grid([
-        {"title":"Oméga-3 (ALA)","cons":a_c,"target":a_t,"color":"omega3"},
-        {"title":"EPA (g)","cons":epa_c,"target":epa_t,"color":"epa"},
-        {"title":"DHA (g)","cons":dha_c,"target":dha_t,"color":"dha"},
-        {"title":"Oméga-6 (g)","cons":la_c,"target":la_t,"color":"omega6"},
-        {"title":"Oméga-9 (g)","cons":o9_c,"target":o9_t,"color":"omega9"},
-    ])
-
-
-
-
+    render_donuts_grid(view["acides_gras"])
     # === À surveiller
     st.markdown("### ⚠️ À surveiller")
-    sugars_c,sugars_t = val_pair("sucres", xlt["sucres_g"])
-    agsat_c,agsat_t   = val_pair("agsatures", xlt["agsatures_g"])
-    sel_c,sel_t       = val_pair("sel", xlt["sel_g"])
-    render_donuts_grid([
-        {"title":"Sucres (g)","cons":sugars_c,"target":sugars_t,"color":"glucides"},
-        {"title":"AG saturés (g)","cons":agsat_c,"target":agsat_t,"color":"lipides"},
-        {"title":"Sel (g)","cons":sel_c,"target":sel_t,"color":"muted"},
-    ], cols=3, height=200)
+    render_donuts_grid(view["surveiller"], cols=3, height=200)
+    # === Historique
+    if st.toggle("📈 Historique", key="show_trend"): render_trend()
 
 
 
@@ -1171,158 +807,28 @@ def render_bilan_page():
     st.caption(f"<span class='dot' style='background:{COLORS['ok']}'></span>Objectif atteint  "
                f"<span class='dot' style='background:{COLORS['warn']}'></span>En cours  "
                f"<span class='dot' style='background:{COLORS['bad']}'></span>Insuffisant", unsafe_allow_html=True)
-
-
-
-
-    if targets_micro.empty or "Nutriment" not in targets_micro.columns:
-        st.info("Aucune ‘Cible micro’ chargée."); return
-
-
-
-
-    tmi = targets_micro.copy()
-    if "Objectif" not in tmi.columns or (pd.to_numeric(tmi["Objectif"], errors="coerce").fillna(0.0) == 0).all():
-        tmi["Objectif"] = build_objectif_robuste(tmi)
-
-
-
-
-    def consumed_micro(r):
-        name, unit = parse_name_unit(str(r["Nutriment"]))
-        key = f"{name}_{normalize_unit(unit)}".replace(" ","_")
-        if isinstance(totals, pd.Series) and key in totals.index and pd.notna(totals[key]): return float(totals[key])
-        for idx in totals.index:
-            if canon_key(idx) == canon_key(key): return float(totals[idx])
-        return 0.0
-
-
-
-
-    tmi["Consommée"] = tmi.apply(consumed_micro, axis=1)
-    tmi["Objectif"]  = tmi["Objectif"].apply(round1)
-    tmi["Consommée"] = tmi["Consommée"].apply(round1)
-    tmi["% objectif"]= percent(tmi["Consommée"], tmi["Objectif"]).apply(round1)
-
-
-
-
-    def is_vitamin(n: str) -> bool:
-        n = strip_accents(n).lower(); return n.startswith("vit") or "vitamine" in n
-
-
-
-
-    vit = tmi[tmi["Nutriment"].astype(str).apply(is_vitamin)].copy()
-    mino= tmi[~tmi["Nutriment"].astype(str).apply(is_vitamin)].copy()
-    if not vit.empty:  vit  = vit.sort_values("% objectif", ascending=False)
-    if not mino.empty: mino = mino.sort_values("% objectif", ascending=False)
-
-
-
-
-    def pct_color(p):
-        if pd.isna(p): return COLORS["warn"]
-        if p < 50: return COLORS["bad"]
-        if p < 100: return COLORS["warn"]
-        return COLORS["ok"]
-
-
-
-
-    def micro_bar(df: pd.DataFrame, title: str):
-        if df.empty: st.info(f"Aucune donnée pour {title.lower()}."); return
-        df = df.copy()
-        xmax = float(max((df["Objectif"].max(), df["Consommée"].max()), default=0.0)) * 1.15 or 1.0
-        height = max(320, int(24*len(df)) + 110)
-        fig = go.Figure()
-        fig.add_bar(y=df["Nutriment"], x=df["Objectif"], name="Objectif", orientation="h",
-                    marker_color=COLORS["objectif"], opacity=0.30, hovertemplate="Objectif: %{x:.1f}<extra></extra>")
-        fig.add_bar(y=df["Nutriment"], x=df["Consommée"], name="Ingéré", orientation="h",
-                    marker_color=[pct_color(v) for v in df["% objectif"]],
-                    text=[f"{c:.1f}/{o:.1f} ({p:.0f}%)" for c,o,p in zip(df["Consommée"], df["Objectif"], df["% objectif"])],
-                    textposition="outside", cliponaxis=False, hovertemplate="Ingéré: %{x:.1f}<extra></extra>")
-        fig.update_layout(barmode="overlay", title=title, xaxis_title="", yaxis_title="", xaxis=dict(range=[0, xmax]),
-                          height=height, margin=dict(l=6,r=6,t=36,b=8), legend=dict(orientation="h", y=-0.18),
-                          font=dict(size=13), paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)")
-        st.plotly_chart(fig, config={"displaylogo":False,"responsive":True,"staticPlot":True}, use_container_width=True)
-
-
-
-
-    st.markdown("### 🍊 Vitamines")
-    micro_bar(vit,  "Vitamines — objectif vs ingéré")
-    st.markdown("### 🧂 Minéraux")
-    micro_bar(mino, "Minéraux — objectif vs ingéré")
+    if not view["has_micro"]:
+        st.info("Aucune ‘Cible micro’ chargée.")
+    else:
+        st.markdown("### 🍊 Vitamines")
+        micro_bar(view["vitamines"], "Vitamines — objectif vs ingéré")
+        st.markdown("### 🧂 Minéraux")
+        micro_bar(view["mineraux"],  "Minéraux — objectif vs ingéré")
+    # jour affiché : on prépare la veille et le lendemain pendant que l'utilisateur lit
+    prefetch_adjacent_days(date_bilan, ctx)
 
 
 
 
 # ===================== Onglet 4 — Conseils (remplace Alimentation) =====================
-def generate_contextual_tips(profile: dict, totals: pd.Series) -> tuple[list[str], list[str]]:
+def generate_contextual_tips(totals: pd.Series, profile_targets: dict) -> tuple[list[str], list[str]]:
     """
     Retourne (conseils_pratiques, phrases_motivation)
-    Ces listes varient à CHAQUE affichage (basé sur un mélange aléatoire déterminé par l'heure)
-    et sont contextualisées par le profil + consommations du jour.
+    Ces listes varient à CHAQUE affichage (tirage via le random.Random de la session, l'état global n'est pas touché)
+    et sont contextualisées par les objectifs du profil + consommations du jour.
     """
-    # seed with minute to change à chaque affichage / refresh
-    seed = int(dt.datetime.now().timestamp() // 5)  # change toutes les 5s environ pour tests; tu peux ajuster
-    random.seed(seed + int(profile.get("poids_kg", 70)) + int(profile.get("age",40)))
-    # base tips pool (holistique / naturopathique + pragmatique)
-    general_tips = [
-        "Commence ton repas par un grand verre d’eau — l’hydratation améliore la satiété et la digestion.",
-        "Ajoute une portion de légumes verts à chaque repas pour booster fibres et micronutriments.",
-        "Privilégie les protéines au petit-déjeuner pour mieux gérer l’appétit toute la matinée.",
-        "Remplace une portion de céréales raffinées par des légumineuses pour plus de fibres et protéines.",
-        "Pour réduire les sucres, choisis un fruit entier plutôt qu’un jus ou un dessert sucré.",
-        "Intègre des cuillères d’huile d’olive crue en finition pour augmenter OMÉGA-9 et saveur.",
-        "Si tu manques d’énergie l’après-midi, une petite marche de 10–15 min aide beaucoup.",
-        "Favorise les aliments fermentés (yaourt nature, kéfir, choucroute) pour ta flore intestinale.",
-        "Pour un sommeil réparateur, évite la caféine après 15h et choisis un dîner léger en sucres simples.",
-        "Un snack combinant protéine + fibres (yaourt + graines, pomme + purée d’amande) retarde la faim.",
-    ]
-    # naturopathic / lifestyle tips
-    naturop_tips = [
-        "Pense à la rondeur digestive : mastique plus lentement pour améliorer assimilation et satiété.",
-        "Un bain chaud, respiration lente ou courte méditation avant le dîner favorisent une digestion calme.",
-        "Alterne sources de protéines végétales et animales sur la semaine pour diversité micro-nutritionnelle.",
-        "Inclue une source d’iode (algue en petite quantité, poisson) si tu consommes peu d’iode habituellement.",
-    ]
-    # targeted tips selon totaux (ex : sucres, fibres, AG saturés)
-    targeted = []
-    try:
-        pct_sucres = float(totals.get("Sucres_g", 0.0)) / max(float(profile.get("profile_targets", {}).get("sucres_g", profile.get("poids_kg",1))), 1.0)
-    except Exception:
-        pct_sucres = 0.0
-    if float(totals.get("Sucres_g", 0.0)) > (profile.get("profile_targets", {}).get("sucres_g", 40) * 0.9):
-        targeted.append("Ton apport en sucres est élevé aujourd'hui — observe boissons et snacks sucrés.")
-    if float(totals.get("AG_saturés_g", totals.get("AG_satures_g", 0.0))) > profile.get("profile_targets", {}).get("agsatures_g", 0) * 0.9:
-        targeted.append("AG saturés proches de la limite — préfère poisson, volaille, huile d'olive plutôt que charcuterie.")
-    if float(totals.get("Fibres_g", 0.0)) < profile.get("profile_targets", {}).get("fibres_g", 25):
-        targeted.append("Penses-y : une portion additionnelle de légumes/légumineuses équivaut à +5–8 g de fibres.")
-    # Build final lists - sample varied items
-    pool_tips = general_tips + naturop_tips + targeted
-    random.shuffle(pool_tips)
-    chosen_tips = pool_tips[:4] if len(pool_tips) >= 4 else pool_tips
-
-
-
-
-    motiv_pool = [
-        "Super boulot — chaque petit choix compte, continue comme ça 💪",
-        "Une habitude à la fois : rappelle-toi pourquoi tu as commencé ✨",
-        "Tu es sur la bonne voie — la constance bat la perfection chaque jour.",
-        "Chaque repas est une nouvelle opportunité pour te sentir mieux aujourd'hui.",
-        "Petit conseil : célèbre tes petites victoires (un repas équilibré = une victoire).",
-        "Rappelle-toi : le progrès est progressif — sois gentil·le avec toi-même.",
-    ]
-    random.shuffle(motiv_pool)
-    chosen_motiv = motiv_pool[:3]
-
-
-
-
-    return chosen_tips, chosen_motiv
+    if "tips_rng" not in st.session_state: st.session_state["tips_rng"] = random.Random()
+    return DEFAULT_TIP_ENGINE.pick(totals, profile_targets, st.session_state["tips_rng"])
 
 
 
@@ -1331,10 +837,12 @@ def render_conseils_page():
     st.subheader("💡 Conseils")
     # contexte
     last_date = fetch_last_date_with_rows() or dt.date.today().isoformat()
-    totals = unify_totals_for_date(last_date)
-    profile_targets = st.session_state.get("profile_targets", get_profile_targets_cached())
-    # generate dynamic, context-aware tips + motivations
-    tips, motivs = generate_contextual_tips(st.session_state["profile"], totals)
+    view = cached_view("conseils", last_date, lambda: build_conseils_view(
+        unify_totals_for_date(last_date), st.session_state.get("targets_macro", pd.DataFrame()),
+        st.session_state.get("targets_micro", pd.DataFrame())))
+    profile_targets = st.session_state.get("profile_targets") or get_profile_targets_cached()
+    # generate dynamic, context-aware tips + motivations (tirage à chaque affichage, totaux en cache)
+    tips, motivs = generate_contextual_tips(view["totals"], profile_targets)
     # show a prominent dynamic advice card (varies at each page render)
     st.markdown("### Conseil rapide")
     with st.container():
@@ -1343,6 +851,8 @@ def render_conseils_page():
             st.success("💡 " + tips[0])
         else:
             st.success("💡 Continue comme ça — petit à petit, tu atteindras tes objectifs !")
+    st.markdown("### 🍽️ Aliments qui comblent tes manques")
+    render_recommendations(gap_recommendations(last_date, view["totals"]), last_date, "Collation", "reco_conseils")
     st.divider()
     # motivations (varient)
     st.markdown("### Motivation du jour")
@@ -1363,8 +873,6 @@ def render_conseils_page():
 
     st.divider()
     # conserve les cartes macro / micro si disponibles (valeur ajoutée)
-    targets_macro = st.session_state.get("targets_macro", pd.DataFrame()).copy()
-    targets_micro = st.session_state.get("targets_micro", pd.DataFrame()).copy()
 
 
 
@@ -1394,46 +902,15 @@ def render_conseils_page():
 
 
 
-    if not targets_macro.empty:
-        show_cards(targets_macro, "🌾 Macro — rôles & bénéfices", "🥗")
-    if not targets_micro.empty:
-        def is_vit(n:str)->bool: n=strip_accents(n).lower(); return n.startswith("vit") or "vitamine" in n
-        vit = targets_micro[targets_micro["Nutriment"].astype(str).apply(is_vit)].copy()
-        mino= targets_micro[~targets_micro["Nutriment"].astype(str).apply(is_vit)].copy()
-        if not vit.empty:  show_cards(vit,  "🍊 Vitamines — rôles & bénéfices", "🍊")
-        if not mino.empty: show_cards(mino, "🧂 Minéraux — rôles & bénéfices",   "🧂")
-
-
-
-
-# ===================== Tabs =====================
-tab_profile, tab_journal, tab_bilan, tab_food = st.tabs(["👤 Profil", "🧾 Journal", "📊 Bilan", "💡 Conseils"])
-with tab_profile: render_profile_page()
-with tab_journal: render_journal_page()
-with tab_bilan:   render_bilan_page()
-with tab_food:    render_conseils_page()
+    if not view["macro_cards"].empty:
+        show_cards(view["macro_cards"], "🌾 Macro — rôles & bénéfices", "🥗")
+    if not view["vitamines"].empty: show_cards(view["vitamines"], "🍊 Vitamines — rôles & bénéfices", "🍊")
+    if not view["mineraux"].empty:  show_cards(view["mineraux"],  "🧂 Minéraux — rôles & bénéfices",   "🧂")
 
 
 
 
 # ===================== Export/Import (conservé) =====================
-st.markdown("### 💾 Export / Import")
-def fetch_all_journal() -> pd.DataFrame:
-    conn = init_db()
-    cur = conn.execute("SELECT id,date,repas,nom,quantite_g,nutrients_json FROM journal ORDER BY date, id;")
-    rows = cur.fetchall()
-    if not rows: return pd.DataFrame(columns=["date","repas","nom","quantite_g"])
-    df = pd.DataFrame(rows, columns=["id","date","repas","nom","quantite_g","nutrients_json"])
-    expanded = []
-    for js in df["nutrients_json"]:
-        try: expanded.append(json.loads(js))
-        except Exception: expanded.append({})
-    nutr_df = pd.DataFrame(expanded).fillna(0.0)
-    return pd.concat([df.drop(columns=["nutrients_json"]), nutr_df], axis=1)
-
-
-
-
 def to_excel_bytes(df: pd.DataFrame) -> bytes:
     out = io.BytesIO()
     with pd.ExcelWriter(out, engine="openpyxl") as writer:
@@ -1443,42 +920,45 @@ def to_excel_bytes(df: pd.DataFrame) -> bytes:
 
 
 
-cE, cI = st.columns(2)
-if cE.button("📥 Exporter le journal (.xlsx)"):
-    all_j = fetch_all_journal()
-    if all_j.empty: st.warning("Journal vide.")
-    else:
-        st.download_button("Télécharger journal.xlsx", data=to_excel_bytes(all_j),
-                           file_name="journal.xlsx",
-                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-with cI:
-    imp = st.file_uploader("Importer un journal (.xlsx)", type=["xlsx"], key="impjournal")
-    if imp is not None:
-        try:
-            j = pd.read_excel(imp)
-            required = {"date","repas","nom","quantite_g"}
-            if not required.issubset(j.columns):
-                st.error("Colonnes attendues : date, repas, nom, quantite_g (+ colonnes nutriments optionnelles).")
-            else:
-                count = 0
-                for _, r in j.iterrows():
-                    date_iso = str(pd.to_datetime(r["date"]).date())
-                    repas = str(r["repas"]); nom = str(r["nom"]); q = float(r["quantite_g"])
-                    nutr = {}
-                    for c in j.columns:
-                        if c in ["date","repas","nom","quantite_g"]: continue
-                        val = pd.to_numeric(pd.Series([r[c]]), errors="coerce").iloc[0]
-                        if pd.notna(val): nutr[c] = float(val)
-                    insert_journal(date_iso, repas, nom, q, nutr); count += 1
-                st.success(f"{count} lignes importées dans SQLite (totum.db).")
-        except Exception as e:
-            st.error(f"Import impossible : {e}")
+def render_export_import():
+    st.markdown("### 💾 Export / Import")
+    cE, cI = st.columns(2)
+    if cE.button("📥 Exporter le journal (.xlsx)"):
+        all_j = fetch_all_journal()
+        if all_j.empty: st.warning("Journal vide.")
+        else:
+            # valeurs stockées en float32 : on arrondit pour ne pas exporter de queues (12.300000190734863)
+            num = all_j.columns.difference(["id","date","repas","nom","quantite_g"])
+            all_j[num] = all_j[num].round(4)
+            st.download_button("Télécharger journal.xlsx", data=to_excel_bytes(all_j),
+                               file_name="journal.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    with cI:
+        imp = st.file_uploader("Importer un journal (.xlsx)", type=["xlsx"], key="impjournal")
+        # le fichier reste dans l'uploader d'un rerun à l'autre : on ne le traite qu'une fois
+        if imp is not None and st.session_state.get("imported_file_id") != imp.file_id:
+            try:
+                j = pd.read_excel(imp)
+                required = {"date","repas","nom","quantite_g"}
+                if not required.issubset(j.columns):
+                    st.error("Colonnes attendues : date, repas, nom, quantite_g (+ colonnes nutriments optionnelles).")
+                else:
+                    st.session_state["import_report"] = import_journal_frame(j)
+                    st.session_state["imported_file_id"] = imp.file_id
+            except Exception as e:
+                st.error(f"Import impossible : {e}")
+        rep = st.session_state.get("import_report")
+        if imp is not None and rep:
+            dead = rep.get("tombstoned", 0)
+            st.success(f"{rep['inserted']} nouvelles lignes importées, {rep['skipped'] - dead} déjà présentes"
+                       + (f", {dead} supprimées auparavant" if dead else "") + f" (sur {rep['rows']}, {rep['duration_s']:.2f}s).")
 
 
 
 
 # ===================== Diagnostic léger =====================
-with st.expander("🛠️ Diagnostic (ouvrir seulement si besoin)"):
+def render_diagnostic():
+    """Calculé seulement quand l'interrupteur est activé (un expander exécute son contenu même fermé)."""
     st.write("Assets dir:", str(ASSETS_DIR), "exists:", ASSETS_DIR.exists())
     try: st.write("Assets list:", os.listdir(ASSETS_DIR) if ASSETS_DIR.exists() else "—")
     except Exception as e: st.write("Assets list error:", e)
@@ -1489,19 +969,45 @@ with st.expander("🛠️ Diagnostic (ouvrir seulement si besoin)"):
     df_dbg = fetch_journal_by_date(last)
     if df_dbg is not None and not df_dbg.empty:
         st.write("Colonnes du journal (dernier jour):", list(df_dbg.columns))
-        # colonnes candidates ALA
-        def _find_ala_columns_in(cols):
-            out = []
-            for c in cols:
-                ck = canon_key(c)
-                if "epa" in ck or "dha" in ck: continue
-                if ("ala" in ck and ("omega3" in ck or "w3" in ck)) or ("alpha" in ck and "linolen" in ck) \
-                   or ck.endswith("alag") or ck.endswith("ala") or "acidealphalinoleniquew3" in ck:
-                    out.append(c)
-            return out
-        ala_cols = _find_ala_columns_in(df_dbg.columns.tolist())
+        ala_cols = find_ala_columns(df_dbg.columns.tolist())
         st.write("ALA colonnes détectées:", ala_cols if ala_cols else "—")
         if ala_cols:
             s = pd.DataFrame(df_dbg[ala_cols]).apply(pd.to_numeric, errors="coerce").fillna(0.0)
             st.write("Somme ALA (débug):", float(s.sum(numeric_only=True).sum()))
+    st.write("Stockage:", get_store().describe())
+    st.write("Préchauffage:", pd.DataFrame(warmup(DEFAULT_EXCEL_PATH)))
+    snap = current_catalog()
+    st.write("Catalogue:", f"v{snap.version} — {len(snap)} aliments, construit en {snap.build_s:.2f}s" if snap else "—")
+    sync_engine = get_sync_engine()
+    st.write("Synchro:", "désactivée (TOTUM_SYNC_URL)" if sync_engine is None
+             else (sync_engine.last_sync or {}) if sync_engine.last_error is None else f"erreur : {sync_engine.last_error}")
+    vm_cache = st.session_state.get("vm_cache")
+    if vm_cache is not None:
+        st.write("Cache des vues:", f"{len(vm_cache)} entrées, {vm_cache.nbytes / 2**20:.1f} / "
+                 f"{vm_cache.max_bytes / 2**20:.0f} Mo — {vm_cache.hits} hits (dont {vm_cache.prefetch_hits} préchargés) "
+                 f"/ {vm_cache.misses} misses")
     st.write("Build:", VERSION)
+
+
+
+
+# ===================== Navigation =====================
+# st.tabs exécute les quatre pages à chaque rerun (seul l'affichage est masqué) ;
+# avec un radio, seule la page choisie calcule quoi que ce soit.
+PAGES = {
+    "👤 Profil":   render_profile_page,
+    "🧾 Journal":  render_journal_page,
+    "📊 Bilan":    render_bilan_page,
+    "💡 Conseils": render_conseils_page,
+}
+page = st.radio("Page", list(PAGES), horizontal=True, key="page", label_visibility="collapsed")
+PAGES[page]()
+if page == "🧾 Journal":
+    st.divider(); render_export_import()
+
+
+
+
+st.divider()
+if st.toggle("🛠️ Diagnostic", key="show_diagnostic"):
+    render_diagnostic()
@@ -1 +1,24 @@
 
+-- Journal des changements synchronisés (sync.py, TOTUM_SYNC_KIND=supabase) : append-only, un enregistrement par
+-- ajout / suppression. Les clients écrivent et lisent directement par l'API REST (/rest/v1/journal_changes) avec
+-- le JWT de l'utilisateur connecté : user_id = son uuid, la RLS limite chacun à ses propres lignes.
+-- Les clients tirent par seq croissant et résolvent les conflits en last-writer-wins (updated_at, device).
+create table if not exists public.journal_changes (
+    seq bigserial primary key,
+    user_id uuid not null default auth.uid() references auth.users (id) on delete cascade,
+    uid text not null,
+    op text not null check (op in ('upsert', 'delete')),
+    updated_at bigint not null,
+    device text not null default '',
+    date date,
+    repas text,
+    nom text,
+    quantite_g double precision,
+    nutrients jsonb,
+    received_at timestamptz not null default now()
+);
+create index if not exists journal_changes_user_seq on public.journal_changes (user_id, seq);
+
+alter table public.journal_changes enable row level security;
+create policy "journal_changes_own_rows" on public.journal_changes
+    for all using (auth.uid() = user_id) with check (auth.uid() = user_id);
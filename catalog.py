@@ -0,0 +1,355 @@
+# Totum — catalogue d'aliments avec rechargement à chaud
+# Un thread de fond surveille le classeur Excel (mtime + taille, par polling), reconstruit le catalogue
+# nettoyé, l'index de recherche et le registre des libellés, puis publie la nouvelle version d'un bloc.
+# Les sessions ne voient que des versions complètes ; le thread UI ne paie jamais la reconstruction.
+# Avec TOTUM_SHARED_CATALOG_DIR, la version construite est publiée une fois pour tous les processus (shared_catalog.py).
+# Source des aliments (TOTUM_CATALOG_SOURCE) :
+#   excel  (défaut) feuille 'Liste' du classeur
+#   store  magasin importé par catalog_import.py (TOTUM_CATALOG_DB), déjà nettoyé, avec son index de recherche ;
+#          les cibles restent lues dans le classeur, surveillé comme le magasin. Rien n'est chargé en mémoire
+#          (StoreSnapshot) : recherche et valeurs par aliment viennent du magasin, la matrice est un memmap.
+
+
+
+
+from __future__ import annotations
+import os, time, threading
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from totum_core import (
+    canon, clean_liste, drop_parasite_columns, build_objectif_robuste, read_workbook_sheets,
+    build_search_index, build_label_registry, nutrient_cols, per100_to_name, journal_search_candidates,
+    compile_micro_targets,
+)
+from nutrients import NutrientEntry, NutrientSchema, food_entry
+from search_fts import SEARCH_BACKEND, FtsSearchIndex, fts5_available
+from recommender import GapRecommender
+from substitutes import SubstitutionIndex
+from shared_catalog import shared_enabled, source_digest, publish, attach
+from catalog_import import DEFAULT_STORE_PATH, CatalogStore
+
+
+
+
+ASSETS_DIR = Path(__file__).parent / "assets"
+DEFAULT_EXCEL_PATH = ASSETS_DIR / "TOTUM-Suivi nutritionnel.xlsx"
+SHEET_LISTE = "Liste"
+SHEET_MACRO = "Cible Macro"
+SHEET_MICRO = {"homme": "Cible micro Homme", "femme": "Cible micro Femme"}
+TARGET_COLS = ["Nutriment","Icône","Fonction","Bénéfice Santé","Objectif"]
+POLL_INTERVAL_S = float(os.getenv("TOTUM_CATALOG_POLL_S", "2.0"))
+CATALOG_SOURCE = os.getenv("TOTUM_CATALOG_SOURCE", "excel").strip().lower()   # "excel" | "store"
+
+
+
+
+def targets_frame(df: pd.DataFrame | None) -> pd.DataFrame:
+    if df is None or "Nutriment" not in df.columns: return pd.DataFrame()
+    t = drop_parasite_columns(df.copy()); t["Objectif"] = build_objectif_robuste(t)
+    return t[[c for c in TARGET_COLS if c in t.columns]]
+
+
+
+
+class CatalogSnapshot:
+    """Version complète et immuable du catalogue (ne jamais modifier un snapshot publié)."""
+    __slots__ = ("version", "stamp", "foods", "targets_macro", "targets_micro",
+                 "search_index", "fts_index", "labels", "row_of", "nutrient_names", "matrix", "recommender", "build_s",
+                 "_substitutes", "_lock")
+
+    def __init__(self, version: int, stamp, foods: pd.DataFrame, targets_macro: pd.DataFrame,
+                 targets_micro: dict[str, pd.DataFrame], build_s: float = 0.0, matrix: np.ndarray | None = None):
+        self.version = version
+        self.stamp = stamp
+        self.foods = foods
+        self.targets_macro = targets_macro
+        self.targets_micro = targets_micro
+        names = foods["nom"].astype(str).tolist() if "nom" in foods.columns else []
+        # recherche : index en mémoire (défaut) ou FTS5 sur fichier partagé (TOTUM_SEARCH_BACKEND=fts5)
+        # (catalogue partagé entre processus : FTS5 aussi, l'index est alors un fichier commun)
+        use_fts = (SEARCH_BACKEND == "fts5" or shared_enabled()) and fts5_available()
+        self.fts_index = FtsSearchIndex.build(names) if use_fts else None
+        self.search_index = build_search_index(names) if self.fts_index is None else None
+        cols = nutrient_cols(foods)
+        self.nutrient_names = tuple(per100_to_name(c) for c in cols)
+        self.labels = build_label_registry(self.nutrient_names)
+        # valeurs /100 g en float32 (aliments x nutriments) : une ligne du journal = une ligne x quantité
+        # (déjà fournie, en memmap partagé, quand le snapshot vient de shared_catalog)
+        if matrix is None:
+            matrix = (foods[cols].apply(pd.to_numeric, errors="coerce").fillna(0.0).to_numpy(dtype=np.float32)
+                      if cols else np.zeros((len(foods), 0), dtype=np.float32))
+        self.matrix = matrix
+        self.recommender = GapRecommender(names, self.nutrient_names, self.matrix)
+        row_of: dict[str, int] = {}
+        for i, n in enumerate(names): row_of.setdefault(n, i)
+        self.row_of = row_of
+        self.build_s = build_s
+        self._substitutes: SubstitutionIndex | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.foods)
+
+    def substitution_index(self) -> SubstitutionIndex:
+        """Index de substitution, construit au premier usage puis partagé (même durée de vie que le snapshot)."""
+        if self._substitutes is None:
+            with self._lock:
+                if self._substitutes is None:
+                    self._substitutes = SubstitutionIndex(self.foods["nom"].astype(str) if "nom" in self.foods.columns
+                                                          else [], self.nutrient_names, self.matrix)
+        return self._substitutes
+
+    def micro_targets_for(self, sexe: str) -> pd.DataFrame:
+        key = "homme" if canon(sexe).startswith("homme") else "femme"
+        return self.targets_micro.get(key, pd.DataFrame())
+
+    def search(self, q: str, limit: int = 12) -> list[str]:
+        if self.fts_index is not None:
+            return self.fts_index.search(q, limit)
+        return journal_search_candidates(self.foods, q, limit=limit, index=self.search_index)
+
+    def food_row(self, name: str) -> pd.Series | None:
+        i = self.row_of.get(str(name))
+        return None if i is None else self.foods.iloc[i]
+
+    def food_entry(self, name: str, qty_g: float, schema: NutrientSchema) -> NutrientEntry | None:
+        """Nutriments de `qty_g` grammes de l'aliment, encodés dans `schema` (qui doit contenir nutrient_names)."""
+        i = self.row_of.get(str(name))
+        return None if i is None else food_entry(self.matrix[i], self.nutrient_names, qty_g, schema)
+
+
+
+
+class _StoreRows:
+    """row_of d'un StoreSnapshot : nom -> ligne de la matrice, résolu dans le magasin à la demande."""
+    __slots__ = ("store",)
+
+    def __init__(self, store: CatalogStore):
+        self.store = store
+
+    def get(self, name, default=None):
+        i = self.store.row_of(name)
+        return default if i is None else i
+
+    def __contains__(self, name) -> bool:
+        return self.store.row_of(name) is not None
+
+    def __getitem__(self, name) -> int:
+        i = self.store.row_of(name)
+        if i is None: raise KeyError(name)
+        return i
+
+
+
+
+class StoreSnapshot(CatalogSnapshot):
+    """
+    Catalogue servi par le magasin importé (TOTUM_CATALOG_SOURCE=store), sans le charger : recherche par l'index FTS
+    du magasin, valeurs /100 g lues aliment par aliment. `foods` reste vide (pas de liste complète en mémoire).
+    Recommandeur et index d'échanges, qui balaient tout le catalogue, sont construits au premier usage sur la
+    matrice en memmap (fichier .npy du magasin) et les noms lus une fois.
+    """
+    __slots__ = ("store", "_matrix", "_recommender")
+
+    def __init__(self, version: int, stamp, store: CatalogStore, targets_macro: pd.DataFrame,
+                 targets_micro: dict[str, pd.DataFrame], build_s: float = 0.0):
+        self.version = version
+        self.stamp = stamp
+        self.store = store
+        self.foods = pd.DataFrame(columns=["nom"])
+        self.targets_macro = targets_macro
+        self.targets_micro = targets_micro
+        self.fts_index = store.search_index
+        self.search_index = None
+        self.nutrient_names = store.nutrient_names
+        self.labels = build_label_registry(self.nutrient_names)
+        self.row_of = _StoreRows(store)
+        self.build_s = build_s
+        self._matrix: np.ndarray | None = None
+        self._recommender: GapRecommender | None = None
+        self._substitutes: SubstitutionIndex | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None: self._matrix = self.store.matrix()
+        return self._matrix
+
+    @property
+    def recommender(self) -> GapRecommender:
+        if self._recommender is None:
+            matrix = self.matrix
+            with self._lock:
+                if self._recommender is None:
+                    self._recommender = GapRecommender(self.store.names(), self.nutrient_names, matrix)
+        return self._recommender
+
+    def substitution_index(self) -> SubstitutionIndex:
+        if self._substitutes is None:
+            matrix = self.matrix
+            with self._lock:
+                if self._substitutes is None:
+                    self._substitutes = SubstitutionIndex(self.store.names(), self.nutrient_names, matrix)
+        return self._substitutes
+
+    def search(self, q: str, limit: int = 12) -> list[str]:
+        return self.store.search(q, limit)
+
+    def food_row(self, name: str) -> pd.Series | None:
+        df = self.store.frame([str(name)])
+        return None if df.empty else df.iloc[0]
+
+    def food_entry(self, name: str, qty_g: float, schema: NutrientSchema) -> NutrientEntry | None:
+        return self.store.food_entry(name, qty_g, schema)
+
+
+
+
+def _attached_snapshot(shared: dict, version: int, stamp, build_s: float) -> CatalogSnapshot:
+    # colonnes float32 = vues sur le memmap (aucune copie), seule la colonne des noms est propre au processus
+    foods = pd.DataFrame(shared["matrix"], columns=[f"{n}_100g" for n in shared["nutrient_names"]], copy=False)
+    foods.insert(0, "nom", shared["names"])
+    return CatalogSnapshot(version, stamp, foods, shared["targets_macro"], shared["targets_micro"],
+                           build_s=build_s, matrix=shared["matrix"])
+
+
+
+
+def build_snapshot(path: Path, version: int, stamp=None, store_path: Path | None = None) -> CatalogSnapshot | None:
+    """
+    Catalogue du classeur `path` ; avec `store_path`, aliments du magasin importé (StoreSnapshot, déjà partagé
+    entre processus par ses fichiers) et cibles du classeur.
+    """
+    t0 = time.perf_counter()
+    if store_path is not None:
+        store = CatalogStore(store_path)
+        if not len(store): store.close(); return None
+        sheets = read_workbook_sheets(path, [SHEET_MACRO, *SHEET_MICRO.values()]) if Path(path).exists() else {}
+        micro = {k: compile_micro_targets(targets_frame(sheets.get(sheet))) for k, sheet in SHEET_MICRO.items()}
+        return StoreSnapshot(version, stamp, store, targets_frame(sheets.get(SHEET_MACRO)), micro,
+                             build_s=time.perf_counter() - t0)
+    digest = source_digest(path) if shared_enabled() else None
+    if digest:   # version déjà publiée par un autre processus : pas de lecture du classeur
+        shared = attach(digest)
+        if shared is not None: return _attached_snapshot(shared, version, stamp, time.perf_counter() - t0)
+    sheets = read_workbook_sheets(path, [SHEET_LISTE, SHEET_MACRO, *SHEET_MICRO.values()])
+    df_liste = sheets.get(SHEET_LISTE)
+    if df_liste is None or df_liste.empty: return None
+    foods = clean_liste(df_liste)
+    micro = {k: compile_micro_targets(targets_frame(sheets.get(sheet))) for k, sheet in SHEET_MICRO.items()}
+    macro = targets_frame(sheets.get(SHEET_MACRO))
+    if digest:
+        cols = nutrient_cols(foods)
+        matrix = (foods[cols].apply(pd.to_numeric, errors="coerce").fillna(0.0).to_numpy(dtype=np.float32)
+                  if cols else np.zeros((len(foods), 0), dtype=np.float32))
+        try:
+            publish(digest, foods["nom"].astype(str), [per100_to_name(c) for c in cols], matrix, macro, micro)
+            shared = attach(digest)
+            if shared is not None: return _attached_snapshot(shared, version, stamp, time.perf_counter() - t0)
+        except OSError:
+            pass   # dossier partagé inaccessible : catalogue privé à ce processus
+    return CatalogSnapshot(version, stamp, foods, macro, micro, build_s=time.perf_counter() - t0)
+
+
+
+
+class CatalogManager:
+    """
+    Détient la version courante du catalogue et la remplace quand le classeur change.
+    - current() : lecture d'une simple référence, sans verrou ni calcul
+    - refresh() : reconstruit hors du thread UI puis publie (swap atomique) avec version + 1
+    Un classeur en cours d'écriture (illisible, ou modifié pendant la lecture) est ignoré : on retente au tick suivant.
+    Avec `store_path` (magasin importé), le magasin est surveillé en plus du classeur des cibles.
+    """
+
+    def __init__(self, path: Path, poll_interval: float = POLL_INTERVAL_S, store_path: Path | None = None):
+        self.path = Path(path)
+        self.store_path = Path(store_path) if store_path is not None else None
+        self.poll_interval = poll_interval
+        self.last_error: Exception | None = None
+        self._snapshot: CatalogSnapshot | None = None
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def _stat(path: Path):
+        try:
+            s = os.stat(path)
+            return (s.st_mtime_ns, s.st_size)
+        except OSError:
+            return None
+
+    def _stamp(self):
+        book = self._stat(self.path)
+        if self.store_path is None: return book
+        store = self._stat(self.store_path)
+        return None if store is None else (store, book)
+
+    def current(self) -> CatalogSnapshot | None:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        snap = self._snapshot
+        return snap.version if snap else 0
+
+    def refresh(self) -> bool:
+        """Reconstruit si le classeur a changé depuis la version publiée ; True si une nouvelle version est publiée."""
+        with self._build_lock:
+            stamp = self._stamp()
+            old = self._snapshot
+            if stamp is None or (old is not None and old.stamp == stamp): return False
+            try:
+                new = build_snapshot(self.path, (old.version if old else 0) + 1, stamp, self.store_path)
+            except Exception as e:
+                self.last_error = e; return False
+            if new is None or self._stamp() != stamp: return False
+            self.last_error = None
+            self._snapshot = new
+            return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.refresh()
+
+    def start(self) -> "CatalogManager":
+        # premier chargement synchrone (démarrage), puis surveillance en tâche de fond
+        self.refresh()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="totum-catalog-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+
+
+_MANAGERS: dict[str, CatalogManager] = {}
+_MANAGERS_LOCK = threading.Lock()
+
+
+
+
+def catalog_manager(path: Path = DEFAULT_EXCEL_PATH, source: str = CATALOG_SOURCE,
+                    store_path: Path = DEFAULT_STORE_PATH) -> CatalogManager:
+    """
+    Gestionnaire unique par process et par source, démarré au premier appel (app, API mobile et warm-up le partagent).
+    source "excel" : tout vient du classeur `path` ; "store" : aliments du magasin `store_path`, cibles de `path`.
+    """
+    if source not in ("excel", "store"): raise ValueError(f"TOTUM_CATALOG_SOURCE inconnu : {source!r} (excel | store)")
+    store = Path(store_path) if source == "store" else None
+    key = f"{Path(path).resolve()}|{store.resolve() if store else ''}"
+    with _MANAGERS_LOCK:
+        mgr = _MANAGERS.get(key)
+        if mgr is None: mgr = _MANAGERS[key] = CatalogManager(Path(path), store_path=store).start()
+    return mgr
@@ -0,0 +1,404 @@
+# Totum — import de grands catalogues (CIQUAL, OpenFoodFacts, export CSV de la feuille Liste)
+# Le fichier source (CSV ou Parquet) est lu par tranches : seules les colonnes utiles sont décodées, renommées
+# vers les colonnes Totum "<Nutriment>_<unité>_100g", puis nettoyées avec les règles de clean_liste
+# (conversion numérique, fusion des colonnes quasi identiques par canon_key). Le résultat est écrit dans un
+# magasin SQLite séparé : une ligne par aliment, valeurs /100 g en float32 (même encodage que le journal),
+# nom indexé. Rien n'est gardé en RAM entre deux tranches. L'index de recherche est celui de l'app (FtsSearchIndex,
+# search_fts.py), construit en fin d'import et publié à côté du magasin, comme la matrice aliments x nutriments
+# (.npy, ouverte en memmap par le recommandeur).
+# Le magasin devient le catalogue de l'app avec TOTUM_CATALOG_SOURCE=store (cf. catalog.py ; cibles lues dans le classeur).
+#
+# Lancer : python catalog_import.py <source.csv|.tsv|.parquet> [catalog.db] [--preset off|ciqual|totum] [--chunksize N]
+
+
+
+
+from __future__ import annotations
+import os, sys, json, time, hashlib, sqlite3, threading
+from pathlib import Path
+from typing import Callable, Iterator
+import numpy as np
+import pandas as pd
+
+from totum_core import canon, canon_key, clean_liste, coerce_num_col, nutrient_cols, per100_to_name
+from nutrients import NutrientEntry, NutrientSchema, food_entry
+from units import conversion_factor, split_unit
+from search_fts import SEARCH_DIR, FtsSearchIndex, fts5_available
+
+
+
+
+DEFAULT_STORE_PATH = Path(os.getenv("TOTUM_CATALOG_DB", Path(__file__).parent / "assets" / "catalog.db"))
+CHUNKSIZE = 50_000
+
+# colonne source -> (colonne Totum /100 g, unité de la source). Correspondance par canon_key (accents / casse / espaces
+# ignorés) ; le multiplicateur vient du registre d'unités (units.py), un nombre reste accepté dans un mapping explicite.
+PRESETS: dict[str, dict] = {
+    "off": {
+        "name": "product_name",
+        "columns": {
+            "energy-kcal_100g": ("Énergie_kcal_100g", "kcal"),
+            "fat_100g": ("Lipides_g_100g", "g"),
+            "saturated-fat_100g": ("AG_saturés_g_100g", "g"),
+            "monounsaturated-fat_100g": ("AG_monoinsaturés_g_100g", "g"),
+            "polyunsaturated-fat_100g": ("AG_polyinsaturés_g_100g", "g"),
+            "oleic-acid_100g": ("Acide_oléique_W9_g_100g", "g"),
+            "linoleic-acid_100g": ("Acide_linoléique_W6_LA_g_100g", "g"),
+            "alpha-linolenic-acid_100g": ("Acide_alpha-linolénique_W3_ALA_g_100g", "g"),
+            "eicosapentaenoic-acid_100g": ("EPA_g_100g", "g"),
+            "docosahexaenoic-acid_100g": ("DHA_g_100g", "g"),
+            "cholesterol_100g": ("Cholestérol_mg_100g", "g"),
+            "carbohydrates_100g": ("Glucides_g_100g", "g"),
+            "sugars_100g": ("Sucres_g_100g", "g"),
+            "fiber_100g": ("Fibres_g_100g", "g"),
+            "proteins_100g": ("Protéines_g_100g", "g"),
+            "salt_100g": ("Sel_g_100g", "g"),
+            # OFF stocke minéraux et vitamines en g/100 g
+            "calcium_100g": ("Calcium_mg_100g", "g"),
+            "copper_100g": ("Cuivre_mg_100g", "g"),
+            "iron_100g": ("Fer_mg_100g", "g"),
+            "iodine_100g": ("Iode_µg_100g", "g"),
+            "magnesium_100g": ("Magnésium_mg_100g", "g"),
+            "manganese_100g": ("Manganèse_mg_100g", "g"),
+            "phosphorus_100g": ("Phosphore_mg_100g", "g"),
+            "potassium_100g": ("Potassium_mg_100g", "g"),
+            "selenium_100g": ("Sélénium_µg_100g", "g"),
+            "sodium_100g": ("Sodium_mg_100g", "g"),
+            "zinc_100g": ("Zinc_mg_100g", "g"),
+            "beta-carotene_100g": ("Beta-Carotène_µg_100g", "g"),
+            "vitamin-d_100g": ("Vitamine_D_µg_100g", "g"),
+            "vitamin-e_100g": ("Vitamine_E_mg_100g", "g"),
+            "vitamin-k_100g": ("Vitamine_K1_µg_100g", "g"),
+            "vitamin-c_100g": ("Vitamine_C_mg_100g", "g"),
+            "vitamin-b1_100g": ("Vitamine_B1_mg_100g", "g"),
+            "vitamin-b2_100g": ("Vitamine_B2_mg_100g", "g"),
+            "vitamin-pp_100g": ("Vitamine_B3_mg_100g", "g"),
+            "pantothenic-acid_100g": ("Vitamine_B5_mg_100g", "g"),
+            "vitamin-b6_100g": ("Vitamine_B6_mg_100g", "g"),
+            "vitamin-b9_100g": ("Vitamine_B9_µg_100g", "g"),
+            "vitamin-b12_100g": ("Vitamine_B12_µg_100g", "g"),
+        },
+    },
+    "ciqual": {
+        "name": "alim_nom_fr",
+        "columns": {
+            "Energie, Règlement UE N° 1169/2011 (kcal/100 g)": ("Énergie_kcal_100g", "kcal"),
+            "Lipides (g/100 g)": ("Lipides_g_100g", "g"),
+            "AG saturés (g/100 g)": ("AG_saturés_g_100g", "g"),
+            "AG monoinsaturés (g/100 g)": ("AG_monoinsaturés_g_100g", "g"),
+            "AG polyinsaturés (g/100 g)": ("AG_polyinsaturés_g_100g", "g"),
+            "AG 18:1 9c (n-9), oléique (g/100 g)": ("Acide_oléique_W9_g_100g", "g"),
+            "AG 18:2 9c,12c (n-6), linoléique (g/100 g)": ("Acide_linoléique_W6_LA_g_100g", "g"),
+            "AG 18:3 c9,c12,c15 (n-3), alpha-linolénique (g/100 g)": ("Acide_alpha-linolénique_W3_ALA_g_100g", "g"),
+            "AG 20:5 5c,8c,11c,14c,17c (n-3), EPA (g/100 g)": ("EPA_g_100g", "g"),
+            "AG 22:6 4c,7c,10c,13c,16c,19c (n-3), DHA (g/100 g)": ("DHA_g_100g", "g"),
+            "Cholestérol (mg/100 g)": ("Cholestérol_mg_100g", "mg"),
+            "Glucides (g/100 g)": ("Glucides_g_100g", "g"),
+            "Sucres (g/100 g)": ("Sucres_g_100g", "g"),
+            "Fibres alimentaires (g/100 g)": ("Fibres_g_100g", "g"),
+            "Protéines, N x facteur de Jones (g/100 g)": ("Protéines_g_100g", "g"),
+            "Sel chlorure de sodium (g/100 g)": ("Sel_g_100g", "g"),
+            "Calcium (mg/100 g)": ("Calcium_mg_100g", "mg"),
+            "Cuivre (mg/100 g)": ("Cuivre_mg_100g", "mg"),
+            "Fer (mg/100 g)": ("Fer_mg_100g", "mg"),
+            "Iode (µg/100 g)": ("Iode_µg_100g", "µg"),
+            "Magnésium (mg/100 g)": ("Magnésium_mg_100g", "mg"),
+            "Manganèse (mg/100 g)": ("Manganèse_mg_100g", "mg"),
+            "Phosphore (mg/100 g)": ("Phosphore_mg_100g", "mg"),
+            "Potassium (mg/100 g)": ("Potassium_mg_100g", "mg"),
+            "Sélénium (µg/100 g)": ("Sélénium_µg_100g", "µg"),
+            "Sodium (mg/100 g)": ("Sodium_mg_100g", "mg"),
+            "Zinc (mg/100 g)": ("Zinc_mg_100g", "mg"),
+            "Rétinol (µg/100 g)": ("Rétinol_µg_100g", "µg"),
+            "Beta-Carotène (µg/100 g)": ("Beta-Carotène_µg_100g", "µg"),
+            "Vitamine D (µg/100 g)": ("Vitamine_D_µg_100g", "µg"),
+            "Vitamine E (mg/100 g)": ("Vitamine_E_mg_100g", "mg"),
+            "Vitamine K1 (µg/100 g)": ("Vitamine_K1_µg_100g", "µg"),
+            "Vitamine K2 (µg/100 g)": ("Vitamine_K2_µg_100g", "µg"),
+            "Vitamine C (mg/100 g)": ("Vitamine_C_mg_100g", "mg"),
+            "Vitamine B1 ou Thiamine (mg/100 g)": ("Vitamine_B1_mg_100g", "mg"),
+            "Vitamine B2 ou Riboflavine (mg/100 g)": ("Vitamine_B2_mg_100g", "mg"),
+            "Vitamine B3 ou PP ou Niacine (mg/100 g)": ("Vitamine_B3_mg_100g", "mg"),
+            "Vitamine B5 ou Acide pantothénique (mg/100 g)": ("Vitamine_B5_mg_100g", "mg"),
+            "Vitamine B6 (mg/100 g)": ("Vitamine_B6_mg_100g", "mg"),
+            "Vitamine B9 ou Folates totaux (µg/100 g)": ("Vitamine_B9_µg_100g", "µg"),
+            "Vitamine B12 (µg/100 g)": ("Vitamine_B12_µg_100g", "µg"),
+        },
+    },
+    # export CSV de la feuille Liste : colonnes déjà au format Totum
+    "totum": {"name": "nom", "columns": {}},
+}
+
+
+
+
+# ============ Lecture par tranches ============
+def _read_header(src: Path, sep: str | None) -> list[str]:
+    if src.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq   # optionnel : seulement pour les dumps Parquet
+        return list(pq.ParquetFile(src).schema_arrow.names)
+    return list(pd.read_csv(src, sep=sep, nrows=0, engine="python" if sep is None else "c").columns)
+
+
+
+
+def _sniff_sep(src: Path) -> str:
+    if src.suffix.lower() in (".tsv", ".tab"): return "\t"
+    with open(src, "r", encoding="utf-8", errors="replace") as f:
+        head = f.readline()
+    return max(("\t", ";", ","), key=head.count)
+
+
+
+
+def iter_source_chunks(src: Path, columns: list[str], chunksize: int = CHUNKSIZE,
+                       sep: str | None = None) -> Iterator[pd.DataFrame]:
+    """Tranches de `chunksize` lignes, restreintes à `columns`, en texte brut (la conversion numérique vient après)."""
+    src = Path(src)
+    if src.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(src).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(src, sep=sep or _sniff_sep(src), usecols=columns, dtype=str, chunksize=chunksize,
+                           on_bad_lines="skip", encoding_errors="replace", low_memory=True)
+
+
+
+
+def _factor(unit, dst: str) -> float:
+    """Multiplicateur source -> colonne Totum : un nombre tel quel, sinon l'unité source convertie via units.py."""
+    if isinstance(unit, (int, float)): return float(unit)
+    name, dst_unit = split_unit(dst)
+    return conversion_factor(unit, dst_unit, name)
+
+
+
+
+def resolve_mapping(header: list[str], preset: str | None = None, mapping: dict | None = None):
+    """(preset, colonne nom source, {colonne source: (colonne Totum, multiplicateur)}) pour l'en-tête donné."""
+    if mapping is not None:
+        spec = {"name": mapping.get("name", "nom"), "columns": mapping.get("columns") or {}}
+    else:
+        keys = {canon_key(c) for c in header}
+        preset = preset or next((p for p, sp in PRESETS.items() if canon_key(sp["name"]) in keys), None)
+        if preset not in PRESETS: raise ValueError("Format non reconnu : préciser --preset (off, ciqual, totum) ou un mapping.")
+        spec = PRESETS[preset]
+    by_key = {canon_key(c): c for c in header}
+    name_col = by_key.get(canon_key(spec["name"]))
+    if name_col is None: raise ValueError("Colonne du nom d'aliment introuvable dans la source.")
+    if spec["columns"]:
+        cols = {by_key[canon_key(c)]: (dst, _factor(u, dst)) for c, (dst, u) in spec["columns"].items() if canon_key(c) in by_key}
+    else:   # colonnes déjà au format Totum
+        cols = {c: (c, 1.0) for c in header if str(c).endswith("_100g")}
+    if not cols: raise ValueError("Aucune colonne nutriment reconnue dans la source.")
+    return preset or "mapping", name_col, cols
+
+
+
+
+def normalize_chunk(chunk: pd.DataFrame, name_col: str, cols: dict) -> pd.DataFrame:
+    """
+    Renomme vers les colonnes Totum en appliquant à chaque colonne source son propre facteur d'unité, puis
+    clean_liste (fusion canon_key) : deux colonnes d'unités différentes fusionnées sont déjà dans l'unité Totum.
+    """
+    data = {"nom": chunk[name_col].astype(str).str.strip()}
+    for src_col, (dst, f) in cols.items():
+        if dst in data: continue
+        v = coerce_num_col(chunk[src_col])
+        data[dst] = v * f if f != 1.0 else v
+    df = pd.DataFrame(data)
+    df = df[df["nom"].ne("") & df["nom"].ne("nan")]
+    if df.empty: return df
+    return clean_liste(df).reset_index(drop=True)
+
+
+
+
+# ============ Magasin SQLite ============
+def _create_store(conn: sqlite3.Connection):
+    conn.executescript("""
+        PRAGMA journal_mode=OFF;
+        PRAGMA synchronous=OFF;
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE nutrient_columns (idx INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+        CREATE TABLE foods (id INTEGER PRIMARY KEY, nom TEXT NOT NULL, per100 BLOB NOT NULL);
+    """)
+
+
+
+
+def _write_matrix(conn: sqlite3.Connection, path: Path, width: int) -> Path:
+    """Valeurs /100 g de tous les aliments (ordre des id) dans un .npy float32, écrit par blocs puis renommé."""
+    n = int(conn.execute("SELECT COUNT(*) FROM foods;").fetchone()[0])
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp.npy")
+    mat = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(n, width))
+    cur = conn.execute("SELECT per100 FROM foods ORDER BY id;"); i = 0
+    while rows := cur.fetchmany(CHUNKSIZE):
+        for j, (blob,) in enumerate(rows):
+            raw = np.frombuffer(blob, dtype="<f4"); mat[i + j, :len(raw)] = raw
+        i += len(rows)
+    mat.flush(); del mat
+    os.replace(tmp, path)
+    return path
+
+
+
+
+def _finish_store(conn: sqlite3.Connection, directory: Path) -> FtsSearchIndex | None:
+    conn.execute("CREATE INDEX idx_foods_nom ON foods(nom);")
+    conn.execute("ANALYZE;")
+    if not fts5_available(): return None   # SQLite compilé sans FTS5 : recherche LIKE sur nom
+    return FtsSearchIndex.build((r[0] for r in conn.execute("SELECT nom FROM foods ORDER BY id;")), directory)
+
+
+
+
+def import_catalog(src, dest=DEFAULT_STORE_PATH, preset: str | None = None, mapping: dict | None = None,
+                   chunksize: int = CHUNKSIZE, progress: Callable[[int], None] | None = None) -> dict:
+    """
+    Importe `src` (CSV/TSV/Parquet) dans le magasin SQLite `dest`, reconstruit dans un fichier temporaire
+    puis publié par renommage atomique (les lecteurs ouverts gardent l'ancienne version).
+    Retourne un petit rapport (lignes lues / importées, colonnes, durée).
+    """
+    t0 = time.perf_counter()
+    src, dest = Path(src), Path(dest)
+    sep = None if src.suffix.lower() == ".parquet" else _sniff_sep(src)
+    preset, name_col, cols = resolve_mapping(_read_header(src, sep), preset, mapping)
+    tmp = dest.with_name(dest.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp)
+    _create_store(conn)
+    schema = NutrientSchema()
+    read = kept = 0
+    for chunk in iter_source_chunks(src, [name_col, *cols], chunksize, sep):
+        read += len(chunk)
+        df = normalize_chunk(chunk, name_col, cols)
+        if df.empty: continue
+        ncols = nutrient_cols(df)
+        added = schema.extend(per100_to_name(c) for c in ncols)
+        if added:
+            conn.executemany("INSERT INTO nutrient_columns (idx, name) VALUES (?,?);",
+                             [(schema.index(n), n) for n in added])
+        idx = schema.indices(tuple(per100_to_name(c) for c in ncols))
+        mat = np.zeros((len(df), schema.version), dtype=np.float32)
+        mat[:, idx] = df[ncols].to_numpy(dtype=np.float32)
+        names = df["nom"].tolist()
+        conn.executemany("INSERT INTO foods (nom, per100) VALUES (?,?);",
+                         zip(names, (row.tobytes() for row in mat.astype("<f4"))))
+        conn.commit()
+        kept += len(df)
+        if progress: progress(read)
+    index = _finish_store(conn, dest.parent)
+    # nom unique par import : un processus encore attaché à l'ancien magasin garde sa matrice
+    matrix = _write_matrix(conn, dest.parent / f"{dest.stem}-matrix-{time.time_ns():x}.npy", schema.version)
+    report = {"source": str(src), "preset": preset, "rows_read": read, "rows_imported": kept,
+              "nutrients": schema.version, "fts5": index is not None, "duration_s": round(time.perf_counter() - t0, 2)}
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?,?);",
+                     [("report", json.dumps(report, ensure_ascii=False)), ("imported_at", str(time.time())),
+                      ("search_index", index.path.name if index else ""), ("matrix", matrix.name)])
+    conn.commit(); conn.close()
+    tmp.replace(dest)
+    return report
+
+
+
+
+class CatalogStore:
+    """
+    Lecture seule d'un magasin importé : recherche (FtsSearchIndex publié à l'import) et valeurs /100 g aliment par
+    aliment, sans charger le catalogue. Même interface d'ajout au journal que CatalogSnapshot (nutrient_names,
+    food_entry) ; matrix() et names() servent les calculs sur tout le catalogue (recommandeur, échanges).
+    Une connexion en lecture seule par thread, comme FtsSearchIndex.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        conn = self._conn()
+        self.nutrient_names = tuple(r[0] for r in conn.execute("SELECT name FROM nutrient_columns ORDER BY idx;"))
+        self.meta = dict(conn.execute("SELECT key, value FROM meta;").fetchall())
+        self.report = json.loads(self.meta["report"]) if self.meta.get("report") else {}
+        # magasin importé avant l'index partagé, ou sans FTS5 : recherche LIKE
+        index = self.path.parent / self.meta["search_index"] if self.meta.get("search_index") else None
+        self.search_index = FtsSearchIndex(index) if index is not None and index.exists() else None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return int(self._conn().execute("SELECT COUNT(*) FROM foods;").fetchone()[0])
+
+    def _vector(self, blob: bytes) -> np.ndarray:
+        v = np.zeros(len(self.nutrient_names), dtype=np.float32)
+        raw = np.frombuffer(blob, dtype="<f4"); v[:len(raw)] = raw
+        return v
+
+    def per100(self, name: str) -> np.ndarray | None:
+        r = self._conn().execute("SELECT per100 FROM foods WHERE nom=? ORDER BY id LIMIT 1;", (str(name),)).fetchone()
+        return None if r is None else self._vector(r[0])
+
+    def row_of(self, name: str) -> int | None:
+        """Ligne de la matrice (ordre d'import) du premier aliment de ce nom."""
+        r = self._conn().execute("SELECT id FROM foods WHERE nom=? ORDER BY id LIMIT 1;", (str(name),)).fetchone()
+        return None if r is None else int(r[0]) - 1
+
+    def food_entry(self, name: str, qty_g: float, schema: NutrientSchema) -> NutrientEntry | None:
+        v = self.per100(name)
+        return None if v is None else food_entry(v, self.nutrient_names, qty_g, schema)
+
+    def names(self) -> list[str]:
+        """Tous les noms, dans l'ordre d'import (lignes de matrix())."""
+        return [r[0] for r in self._conn().execute("SELECT nom FROM foods ORDER BY id;")]
+
+    def matrix(self) -> np.ndarray:
+        """
+        Valeurs /100 g de tout le catalogue (float32, aliments x nutrient_names) en memmap lecture seule : le .npy
+        publié à l'import, ou, pour un magasin plus ancien, un .npy écrit une fois dans SEARCH_DIR.
+        """
+        path = self.path.parent / self.meta["matrix"] if self.meta.get("matrix") else None
+        if path is None or not path.exists():
+            s = os.stat(self.path)
+            key = hashlib.sha1(f"{self.path.resolve()}|{s.st_mtime_ns}|{s.st_size}".encode()).hexdigest()[:16]
+            path = Path(SEARCH_DIR) / f"totum-store-matrix-{key}.npy"
+            if not path.exists(): _write_matrix(self._conn(), path, len(self.nutrient_names))
+        return np.load(path, mmap_mode="r")
+
+    def frame(self, names: list[str]) -> pd.DataFrame:
+        """Quelques lignes au format de clean_liste (nom + colonnes _100g), pour l'UI."""
+        rows = [(n, self.per100(n)) for n in names]
+        rows = [(n, v) for n, v in rows if v is not None]
+        df = pd.DataFrame([v for _, v in rows], columns=[f"{n}_100g" for n in self.nutrient_names], dtype=float)
+        df.insert(0, "nom", [n for n, _ in rows])
+        return df
+
+    def search(self, q: str, limit: int = 12) -> list[str]:
+        """Mêmes paliers que la recherche de l'app (FtsSearchIndex) ; à défaut, tous les mots en LIKE, noms courts d'abord."""
+        terms = [t for t in canon(q).replace('"', " ").split() if t]
+        if not terms: return []
+        if self.search_index is not None: return self.search_index.search(q, limit)
+        like = " AND ".join("nom LIKE ?" for _ in terms)
+        sql = f"SELECT nom FROM foods WHERE {like} GROUP BY nom ORDER BY LENGTH(nom) LIMIT ?;"
+        return [r[0] for r in self._conn().execute(sql, (*[f"%{t}%" for t in terms], int(limit)))]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None: conn.close(); self._local.conn = None
+
+
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Importe un grand catalogue (CSV/TSV/Parquet) dans un magasin SQLite.")
+    ap.add_argument("source"); ap.add_argument("dest", nargs="?", default=str(DEFAULT_STORE_PATH))
+    ap.add_argument("--preset", choices=sorted(PRESETS)); ap.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    ap.add_argument("--mapping", help="JSON {\"name\": col, \"columns\": {col: [colonne_Totum_100g, facteur]}}")
+    a = ap.parse_args()
+    rep = import_catalog(a.source, a.dest, preset=a.preset, mapping=json.loads(a.mapping) if a.mapping else None,
+                         chunksize=a.chunksize, progress=lambda n: print(f"\r{n} lignes lues", end="", file=sys.stderr))
+    print(file=sys.stderr); print(json.dumps(rep, ensure_ascii=False, indent=2))
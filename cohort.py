@@ -0,0 +1,75 @@
+# Totum — objectifs calculés pour une cohorte (tableaux de bord coachs)
+# Version vectorisée de excel_like_targets : mêmes formules, mêmes constantes, un seul passage NumPy
+# pour des milliers (ou millions) de profils. Les résultats sont identiques bit à bit à la version scalaire.
+
+
+
+
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+from totum_core import norm, activity_key, ACTIVITY_TABLE, RULES
+
+
+
+
+PROFILE_COLS = ["sexe", "age", "taille_cm", "poids_kg", "activite"]
+TARGET_KEYS = ["energie_kcal", "proteines_g", "lipides_g", "agsatures_g", "omega9_g", "omega6_g", "ala_w3_g",
+               "epa_g", "dha_g", "glucides_g", "sucres_g", "fibres_g", "sel_g"]
+
+
+
+
+def _map_labels(values, fns: list, dtype) -> list[np.ndarray]:
+    # les libellés (sexe, activité) ont très peu de valeurs distinctes : chaque fn n'est appliquée qu'une fois par valeur
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    uniques = list(uniques) + [None]  # code -1 (valeur manquante) -> dernier élément
+    return [np.array([fn(u) for u in uniques], dtype=dtype)[codes] for fn in fns]
+
+
+
+
+def cohort_targets(profiles: pd.DataFrame | None = None, *, sexe=None, age=None, taille_cm=None,
+                   poids_kg=None, activite=None) -> pd.DataFrame:
+    """
+    Objectifs journaliers (les 13 clés de excel_like_targets, en colonnes) pour chaque profil.
+    `profiles` : DataFrame avec les colonnes sexe, age, taille_cm, poids_kg, activite ;
+    chaque colonne peut aussi être fournie (ou remplacée) par un tableau via les arguments nommés.
+    """
+    given = {"sexe": sexe, "age": age, "taille_cm": taille_cm, "poids_kg": poids_kg, "activite": activite}
+    cols = {}
+    for c in PROFILE_COLS:
+        if given[c] is not None: cols[c] = given[c]
+        elif profiles is not None and c in profiles.columns: cols[c] = profiles[c].to_numpy()
+        else: raise KeyError(f"Colonne de profil manquante : {c}")
+    index = profiles.index if profiles is not None else None
+
+    w = np.asarray(cols["poids_kg"], dtype=np.float64)
+    h = np.asarray(cols["taille_cm"], dtype=np.float64)
+    a = np.trunc(np.asarray(cols["age"], dtype=np.float64))  # int(age) comme la version scalaire
+    male, = _map_labels(cols["sexe"], [lambda s: norm(s).startswith("h")], bool)
+    factor, prot_max = _map_labels(cols["activite"], [lambda x: ACTIVITY_TABLE[activity_key(x)]["factor"],
+                                                      lambda x: ACTIVITY_TABLE[activity_key(x)]["prot_max"]], np.float64)
+
+    bmr = np.where(male,
+                   88.362 + 13.397*w + 4.799*h - 5.677*a,
+                   447.593 + 9.247*w + 3.098*h - 4.330*a)
+    tdee = bmr * factor
+    n = len(tdee)
+    out = {
+        "energie_kcal": tdee,
+        "proteines_g":  w * prot_max,
+        "lipides_g":    tdee * RULES["lipides_pct"] / 9.0,
+        "agsatures_g":  tdee * RULES["agsat_pct"]   / 9.0,
+        "omega9_g":     tdee * RULES["omega9_pct"]  / 9.0,
+        "omega6_g":     tdee * RULES["omega6_pct"]  / 9.0,
+        "ala_w3_g":     tdee * RULES["ala_pct"]     / 9.0,
+        "epa_g":        np.full(n, RULES["epa_g"]),
+        "dha_g":        np.full(n, RULES["dha_g"]),
+        "glucides_g":   tdee * RULES["glucides_pct"]/ 4.0,
+        "sucres_g":     tdee * RULES["sucres_pct"]  / 4.0,
+        "fibres_g":     np.full(n, RULES["fibres_g"]),
+        "sel_g":        np.full(n, RULES["sel_g"]),
+    }
+    return pd.DataFrame(out, index=index, columns=TARGET_KEYS)
@@ -0,0 +1,87 @@
+# Totum — réduction des séries longues avant affichage (historique sur des mois ou des années)
+# Un point par jour et par nutriment sur plusieurs années alourdit la page mobile sans rien montrer de plus :
+# au-delà d'un ou deux points par pixel de largeur, les points se superposent. Chaque série est donc ramenée à
+# un nombre de points borné par la largeur du graphique, quelle que soit la période affichée :
+#   lttb     Largest-Triangle-Three-Buckets : un point par tranche, celui qui garde le mieux la forme (pics, creux)
+#   minmax   min et max de chaque tranche : enveloppe exacte, deux points par tranche
+# Au-delà de GL_MIN_POINTS points tracés, la trace passe en WebGL (Scattergl) : rendu GPU, page plus fluide.
+
+
+
+
+from __future__ import annotations
+import os
+import numpy as np
+import pandas as pd
+
+
+
+
+DEFAULT_WIDTH_PX = int(os.getenv("TOTUM_CHART_WIDTH_PX", "720"))   # largeur de tracé visée (px physiques)
+POINTS_PER_PX = {"lttb": 1.0, "minmax": 2.0}
+GL_MIN_POINTS = 1000
+
+
+
+
+def max_points(width_px: int = DEFAULT_WIDTH_PX, method: str = "lttb") -> int:
+    """Nombre de points au plus pour une trace de `width_px` pixels."""
+    return max(int(width_px * POINTS_PER_PX[method]), 3)
+
+
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices retenus par LTTB (premier et dernier points toujours gardés) ; x croissant, sans NaN."""
+    n = len(x)
+    if n_out >= n or n_out < 3: return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)   # n_out - 2 tranches entre le premier et le dernier
+    out = np.empty(n_out, dtype=np.int64); out[0] = 0; out[-1] = n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nlo, nhi = hi, (edges[b + 2] if b + 2 < len(edges) else n)
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()          # moyenne de la tranche suivante
+        # aire du triangle (point retenu précédent, candidat, moyenne suivante) ; le facteur 1/2 est inutile
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area)); out[b + 1] = a
+    return out
+
+
+
+
+def minmax_indices(y: np.ndarray, n_buckets: int) -> np.ndarray:
+    """Indices du min et du max de chaque tranche, dans l'ordre des x (vectorisé : un tri par tranche)."""
+    n = len(y)
+    if 2 * n_buckets >= n: return np.arange(n)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    order = np.lexsort((y, bucket))                             # par tranche, puis par valeur
+    return np.unique(np.concatenate([order[edges[:-1]], order[edges[1:] - 1]]))
+
+
+
+
+def downsample(x, y, width_px: int = DEFAULT_WIDTH_PX, method: str = "lttb") -> tuple[np.ndarray, np.ndarray]:
+    """
+    (x, y) réduits à max_points(width_px, method) points au plus. x : dates ou nombres croissants ;
+    les valeurs manquantes sont ignorées. Renvoie des tableaux (x dans son type d'origine).
+    """
+    x = np.asarray(x); y = np.asarray(pd.to_numeric(pd.Series(y), errors="coerce"), dtype=np.float64)
+    ok = ~np.isnan(y); x, y = x[ok], y[ok]
+    limit = max_points(width_px, method)
+    if len(x) <= limit: return x, y
+    if method == "minmax":
+        idx = minmax_indices(y, limit // 2)
+    else:
+        xf = x.astype("datetime64[ns]").astype(np.int64).astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) \
+            else x.astype(np.float64)
+        idx = lttb_indices(xf, y, limit)
+    return x[idx], y[idx]
+
+
+
+
+def use_webgl(n_points: int, webgl: bool | None = None) -> bool:
+    """WebGL forcé (True / False) ou automatique (None) selon le nombre de points tracés."""
+    return bool(webgl) if webgl is not None else n_points >= GL_MIN_POINTS
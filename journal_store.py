@@ -0,0 +1,183 @@
+# Totum — stockage du journal et du profil, choisi par TOTUM_STORAGE
+#   sqlite    (défaut) totum.db dans le dossier courant (storage.py) : un seul écrivain, un seul nœud
+#   postgres  base partagée par plusieurs nœuds (storage_pg.py, DSN dans TOTUM_PG_DSN) : pool de connexions,
+#             écritures par lots, totaux par jour agrégés par le serveur
+# L'app, l'API mobile et l'analytique importent d'ici les fonctions du journal, qui délèguent au stockage actif.
+# Restent propres au fichier SQLite local : le registre des nutriments (nutrient_schema) et la synchro hors-ligne.
+
+
+
+
+from __future__ import annotations
+import os, threading
+import pandas as pd
+
+import storage
+
+
+
+
+STORAGE_BACKEND = os.getenv("TOTUM_STORAGE", "sqlite").strip().lower()   # "sqlite" | "postgres"
+
+# interface commune : mêmes noms et signatures que les fonctions de storage.py
+STORE_METHODS = (
+    "load_profile", "save_profile",
+    "insert_journal", "insert_journal_batch", "import_journal_frame", "delete_journal_row",
+    "fetch_journal_by_date", "fetch_journal_page", "count_journal_by_date", "journal_names_by_date",
+    "fetch_journal_between", "fetch_last_date_with_rows", "fetch_all_journal", "daily_totals",
+    "journal_version", "journal_day_signatures",
+)
+
+
+
+
+class SQLiteStore:
+    """Stockage historique : les fonctions de storage.py telles quelles."""
+    name = "sqlite"
+    load_profile = staticmethod(storage.load_profile)
+    save_profile = staticmethod(storage.save_profile)
+    insert_journal = staticmethod(storage.insert_journal)
+    insert_journal_batch = staticmethod(storage.insert_journal_batch)
+    import_journal_frame = staticmethod(storage.import_journal_frame)
+    delete_journal_row = staticmethod(storage.delete_journal_row)
+    fetch_journal_by_date = staticmethod(storage.fetch_journal_by_date)
+    fetch_journal_page = staticmethod(storage.fetch_journal_page)
+    count_journal_by_date = staticmethod(storage.count_journal_by_date)
+    journal_names_by_date = staticmethod(storage.journal_names_by_date)
+    fetch_journal_between = staticmethod(storage.fetch_journal_between)
+    fetch_last_date_with_rows = staticmethod(storage.fetch_last_date_with_rows)
+    fetch_all_journal = staticmethod(storage.fetch_all_journal)
+    daily_totals = staticmethod(storage.daily_totals)
+    journal_version = staticmethod(storage.journal_version)
+    journal_day_signatures = staticmethod(storage.journal_day_signatures)
+
+    def describe(self) -> str:
+        return f"SQLite ({storage.DB_PATH})"
+
+
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+
+
+def make_store(backend: str = STORAGE_BACKEND, dsn: str | None = None):
+    if backend == "sqlite": return SQLiteStore()
+    if backend in ("postgres", "postgresql", "pg"):
+        from storage_pg import PostgresStore   # psycopg2 n'est requis que pour ce stockage
+        return PostgresStore(dsn or os.getenv("TOTUM_PG_DSN", ""))
+    raise ValueError(f"TOTUM_STORAGE inconnu : {backend!r} (sqlite | postgres)")
+
+
+
+
+def get_store():
+    """Stockage actif (un par process, créé au premier appel)."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                store = make_store()
+                missing = [m for m in STORE_METHODS if not callable(getattr(store, m, None))]
+                if missing: raise TypeError(f"{type(store).__name__} n'implémente pas : {', '.join(missing)}")
+                _STORE = store
+    return _STORE
+
+
+
+
+# ============ Fonctions du journal (délèguent au stockage actif) ============
+def load_profile():
+    return get_store().load_profile()
+
+
+
+
+def save_profile(p):
+    return get_store().save_profile(p)
+
+
+
+
+def insert_journal(date_iso, repas, nom, quantite_g, nutrients) -> int:
+    return get_store().insert_journal(date_iso, repas, nom, quantite_g, nutrients)
+
+
+
+
+def insert_journal_batch(rows) -> list[int]:
+    return get_store().insert_journal_batch(rows)
+
+
+
+
+def import_journal_frame(df: pd.DataFrame) -> dict:
+    return get_store().import_journal_frame(df)
+
+
+
+
+def delete_journal_row(row_id: int) -> bool:
+    return get_store().delete_journal_row(row_id)
+
+
+
+
+def fetch_journal_by_date(date_iso) -> pd.DataFrame:
+    return get_store().fetch_journal_by_date(date_iso)
+
+
+
+
+def fetch_journal_page(date_iso, after_id: int = 0, limit: int = 50) -> pd.DataFrame:
+    return get_store().fetch_journal_page(date_iso, after_id, limit)
+
+
+
+
+def count_journal_by_date(date_iso) -> int:
+    return get_store().count_journal_by_date(date_iso)
+
+
+
+
+def journal_names_by_date(date_iso) -> list[str]:
+    return get_store().journal_names_by_date(date_iso)
+
+
+
+
+def fetch_journal_between(date_from, date_to) -> pd.DataFrame:
+    return get_store().fetch_journal_between(date_from, date_to)
+
+
+
+
+def fetch_last_date_with_rows() -> str | None:
+    return get_store().fetch_last_date_with_rows()
+
+
+
+
+def fetch_all_journal() -> pd.DataFrame:
+    return get_store().fetch_all_journal()
+
+
+
+
+def daily_totals(date_from, date_to) -> pd.DataFrame:
+    return get_store().daily_totals(date_from, date_to)
+
+
+
+
+def journal_version(date_iso: str | None = None) -> int:
+    return get_store().journal_version(date_iso)
+
+
+
+
+def journal_day_signatures(date_from, date_to) -> dict[str, str]:
+    return get_store().journal_day_signatures(date_from, date_to)
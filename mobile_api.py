@@ -0,0 +1,276 @@
+# mobile_api.py
+"""
+API JSON "headless" au-dessus du noyau nutritionnel, pour les clients mobiles :
+- recherche d'aliments, ajout / suppression de lignes du journal
+- totaux d'un jour ou d'une période, objectifs du profil
+Même stockage (journal_store : totum.db ou PostgreSQL) et même catalogue (classeur Excel packagé, rechargé à
+chaud) que l'app Streamlit : le client ne récupère que du JSON compact au lieu de pages Streamlit entières.
+
+Les réponses "jour" portent un ETag : si le client renvoie If-None-Match et que le jour n'a pas changé,
+la réponse est un 304 sans corps (aucun recalcul côté serveur). /api/range accepte `known=date:etag,...`
+et ne renvoie que les jours modifiés.
+
+Lancer : python mobile_api.py  (port TOTUM_API_PORT, 5002 par défaut, depuis le dossier qui contient totum.db)
+Jeton : si TOTUM_API_TOKEN est défini, l'en-tête "Authorization: Bearer <jeton>" est exigé. Sans jeton, l'API
+n'écoute que sur 127.0.0.1 (TOTUM_API_HOST ne peut alors pas désigner une autre interface).
+"""
+
+import os
+import math
+import hashlib
+import datetime as dt
+
+from flask import Flask, request, jsonify
+
+from totum_core import excel_like_targets, round1, unify_totals_frame, nutrient_label_key
+from catalog import CatalogManager, DEFAULT_EXCEL_PATH, catalog_manager
+from storage import nutrient_schema
+from journal_store import (
+    load_profile, insert_journal, delete_journal_row, fetch_journal_by_date, daily_totals, journal_day_signatures,
+)
+
+API_TOKEN = os.getenv("TOTUM_API_TOKEN")
+PORT = int(os.getenv("TOTUM_API_PORT", 5002))
+HOST = os.getenv("TOTUM_API_HOST") or ("0.0.0.0" if API_TOKEN else "127.0.0.1")
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+MAX_RANGE_DAYS = 366
+
+app = Flask(__name__)
+app.json.ensure_ascii = False
+app.json.compact = True
+
+_catalog = None
+
+
+def get_catalog() -> CatalogManager:
+    global _catalog
+    if _catalog is None:
+        _catalog = catalog_manager(DEFAULT_EXCEL_PATH)
+    return _catalog
+
+
+# ----------------------
+# Helpers
+# ----------------------
+def _parse_date(value):
+    try:
+        return dt.date.fromisoformat(str(value)).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _custom_nutrients(nutrients: dict, snap):
+    """
+    Nutriments d'un aliment personnalisé, ramenés aux noms du catalogue : une clé inconnue du catalogue
+    (même après rapprochement des libellés, ex. 'Proteines_g' -> 'Protéines_g') ou une valeur qui n'est pas
+    un nombre fini >= 0 est refusée, pour ne jamais élargir le registre global des nutriments.
+    Renvoie (dict, None) ou (None, message d'erreur).
+    """
+    by_bucket = {}
+    for name in snap.nutrient_names: by_bucket.setdefault(snap.labels[name][0], name)
+    out, unknown = {}, []
+    for k, v in nutrients.items():
+        name = k if k in snap.labels else by_bucket.get(nutrient_label_key(str(k))[0])
+        if name is None: unknown.append(str(k)); continue
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or not math.isfinite(v) or v < 0:
+            return None, f"Valeur invalide pour {k} : nombre fini >= 0 attendu"
+        out[name] = out.get(name, 0.0) + float(v)
+    if unknown: return None, f"Nutriments inconnus du catalogue : {', '.join(sorted(unknown))}"
+    return out, None
+
+
+def _compact_totals(totals) -> dict:
+    """Totaux arrondis à 0,1, sans les nutriments nuls (réponse la plus petite possible)."""
+    out = {}
+    for k, v in totals.items():
+        v = round1(v)
+        if v: out[str(k)] = v
+    return out
+
+
+def _day_etag(date_iso: str) -> str:
+    sig = journal_day_signatures(date_iso, date_iso).get(date_iso, "0")
+    return f"{date_iso}-{sig}"
+
+
+def _labels():
+    snap = get_catalog().current()
+    return snap.labels if snap else None
+
+
+def _not_modified(etag: str):
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp
+    return None
+
+
+def _with_etag(payload, etag: str):
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    return resp
+
+
+@app.before_request
+def check_token():
+    if API_TOKEN and request.headers.get("Authorization") != f"Bearer {API_TOKEN}":
+        return jsonify({"error": "Jeton manquant ou invalide"}), 401
+    return None
+
+
+# ----------------------
+# Catalogue
+# ----------------------
+@app.route("/api/search", methods=["GET"])
+def search():
+    """?q=<texte>&limit=<n> -> { "catalog_version": v, "results": [noms] }"""
+    snap = get_catalog().current()
+    if snap is None:
+        return jsonify({"error": "Catalogue indisponible"}), 503
+    limit = max(1, min(request.args.get("limit", 10, type=int), 200))
+    results = snap.search(request.args.get("q", ""), limit=limit)
+    return jsonify({"catalog_version": snap.version, "results": results}), 200
+
+
+# ----------------------
+# Journal
+# ----------------------
+@app.route("/api/journal", methods=["POST"])
+def add_entry():
+    """
+    Attendu JSON : { "date": "AAAA-MM-JJ", "repas": "...", "nom": "...", "quantite_g": 150 }
+    "nutrients" (dict, valeurs pour la quantité) permet un aliment personnalisé hors catalogue.
+    Retourne : { "id": <id>, "date": ..., "etag": <nouvel ETag du jour> }
+    """
+    data = request.get_json(silent=True) or {}
+    date_iso = _parse_date(data.get("date"))
+    nom = str(data.get("nom") or "").strip()
+    repas = str(data.get("repas") or "Déjeuner")
+    try:
+        qty = float(data.get("quantite_g"))
+    except (TypeError, ValueError):
+        qty = 0.0
+    if not date_iso or not nom or qty <= 0:
+        return jsonify({"error": "Veuillez envoyer JSON avec date (AAAA-MM-JJ), nom et quantite_g > 0"}), 400
+
+    nutrients = data.get("nutrients")
+    snap = get_catalog().current()
+    if snap is None:
+        return jsonify({"error": "Catalogue indisponible"}), 503
+    if nutrients is None:
+        nutrients = snap.food_entry(nom, qty, nutrient_schema(snap.nutrient_names))
+        if nutrients is None:
+            return jsonify({"error": f"Aliment inconnu : {nom}"}), 404
+    elif not isinstance(nutrients, dict):
+        return jsonify({"error": "nutrients doit être un objet {nutriment: valeur}"}), 400
+    else:
+        nutrients, error = _custom_nutrients(nutrients, snap)
+        if error:
+            return jsonify({"error": error}), 400
+
+    row_id = insert_journal(date_iso, repas, nom, qty, nutrients)
+    return jsonify({"id": row_id, "date": date_iso, "etag": _day_etag(date_iso)}), 201
+
+
+@app.route("/api/journal/<int:row_id>", methods=["DELETE"])
+def delete_entry(row_id):
+    if not delete_journal_row(row_id):
+        return jsonify({"error": "Ligne introuvable"}), 404
+    return "", 204
+
+
+@app.route("/api/day/<date_iso>", methods=["GET"])
+def day(date_iso):
+    """Lignes (sans le détail des nutriments) + totaux unifiés du jour."""
+    date_iso = _parse_date(date_iso)
+    if not date_iso:
+        return jsonify({"error": "Date invalide (AAAA-MM-JJ)"}), 400
+    etag = _day_etag(date_iso)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+    df = fetch_journal_by_date(date_iso)
+    rows = [{"id": int(r.id), "repas": r.repas, "nom": r.nom, "quantite_g": round1(r.quantite_g)}
+            for r in df[["id", "repas", "nom", "quantite_g"]].itertuples(index=False)]
+    totals = _compact_totals(unify_totals_frame(df, labels=_labels()))
+    return _with_etag({"date": date_iso, "rows": rows, "totals": totals}, etag)
+
+
+@app.route("/api/day/<date_iso>/totals", methods=["GET"])
+def day_totals(date_iso):
+    date_iso = _parse_date(date_iso)
+    if not date_iso:
+        return jsonify({"error": "Date invalide (AAAA-MM-JJ)"}), 400
+    etag = _day_etag(date_iso)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+    totals = _compact_totals(unify_totals_frame(fetch_journal_by_date(date_iso), labels=_labels()))
+    return _with_etag({"date": date_iso, "totals": totals}, etag)
+
+
+@app.route("/api/range", methods=["GET"])
+def range_totals():
+    """
+    ?from=AAAA-MM-JJ&to=AAAA-MM-JJ[&known=date:etag,date:etag...]
+    Retourne { "days": {date: {"etag": ..., "totals": {...}}}, "unchanged": [dates] } pour les jours avec des lignes ;
+    les jours déjà connus du client avec le même ETag ne sont listés que dans "unchanged".
+    """
+    d_from, d_to = _parse_date(request.args.get("from")), _parse_date(request.args.get("to"))
+    if not d_from or not d_to or d_from > d_to:
+        return jsonify({"error": "Paramètres from/to invalides (AAAA-MM-JJ, from <= to)"}), 400
+    if (dt.date.fromisoformat(d_to) - dt.date.fromisoformat(d_from)).days >= MAX_RANGE_DAYS:
+        return jsonify({"error": f"Période limitée à {MAX_RANGE_DAYS} jours"}), 400
+
+    etags = {d: f"{d}-{sig}" for d, sig in journal_day_signatures(d_from, d_to).items()}
+    known_arg = request.args.get("known", "")
+    range_etag = hashlib.sha1(f"{d_from}|{d_to}|{known_arg}|{sorted(etags.items())}".encode()).hexdigest()[:20]
+    cached = _not_modified(range_etag)
+    if cached is not None:
+        return cached
+
+    known = dict(p.split(":", 1) for p in known_arg.split(",") if ":" in p)
+    unchanged = sorted(d for d, tag in etags.items() if known.get(d) == tag)
+    changed = [d for d in etags if d not in unchanged]
+    days = {}
+    if changed:
+        df = daily_totals(min(changed), max(changed))   # une ligne par jour (agrégée par le stockage)
+        df = df[df["date"].isin(changed)]
+        labels = _labels()
+        for d, g in df.groupby("date", sort=True):
+            days[d] = {"etag": etags[d], "totals": _compact_totals(unify_totals_frame(g, labels=labels))}
+    return _with_etag({"from": d_from, "to": d_to, "days": days, "unchanged": unchanged}, range_etag)
+
+
+# ----------------------
+# Objectifs
+# ----------------------
+@app.route("/api/targets", methods=["GET"])
+def targets():
+    """Objectifs macro calculés depuis le profil enregistré + objectifs micro du classeur (selon le sexe)."""
+    p = load_profile()
+    snap = get_catalog().current()
+    etag = hashlib.sha1(repr((sorted(p.items()), snap.version if snap else 0)).encode()).hexdigest()[:20]
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+    micro = []
+    if snap is not None:
+        tm = snap.micro_targets_for(p["sexe"])
+        if "Nutriment" in tm.columns and "Objectif" in tm.columns:
+            micro = [{"nutriment": str(n), "objectif": round1(o)} for n, o in zip(tm["Nutriment"], tm["Objectif"])]
+    payload = {"macro": {k: round1(v) for k, v in excel_like_targets(p).items()}, "micro": micro}
+    return _with_etag(payload, etag)
+
+
+# ----------------------
+# Point d'entrée
+# ----------------------
+if __name__ == "__main__":
+    from warmup import warmup, format_report
+    print(format_report(warmup(DEFAULT_EXCEL_PATH)))
+    if not API_TOKEN and HOST not in LOOPBACK_HOSTS:
+        raise SystemExit(f"TOTUM_API_TOKEN requis pour écouter sur {HOST} (sans jeton : 127.0.0.1 uniquement)")
+    print(f"Lancement mobile_api sur {HOST}:{PORT}" + ("" if API_TOKEN else " (sans jeton : accès local seulement)"))
+    app.run(host=HOST, port=PORT)
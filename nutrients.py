@@ -0,0 +1,104 @@
+# Totum — représentation compacte des nutriments d'une ligne du journal
+# Un schéma global (ordre fixe, qui ne fait que grandir, persisté dans SQLite par storage.py) associe chaque
+# nutriment à un indice. Une ligne ne porte plus qu'un tableau float32 indexé par ce schéma + la version du
+# schéma au moment de l'encodage, au lieu d'un dict {nom: valeur} recopiant 40+ chaînes par ligne.
+
+
+
+
+from __future__ import annotations
+import threading
+import numpy as np
+
+
+
+
+class NutrientSchema:
+    """Ordre global des nutriments. version = nombre de noms ; un indice attribué ne change jamais."""
+    __slots__ = ("_names", "_index", "_idx_cache", "_lock")
+
+    def __init__(self, names=()):
+        self._names: list[str] = []
+        self._index: dict[str, int] = {}
+        self._idx_cache: dict[tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.extend(names)
+
+    @property
+    def version(self) -> int:
+        return len(self._names)
+
+    @property
+    def names(self) -> list[str]:
+        return self._names
+
+    def __contains__(self, name) -> bool:
+        return name in self._index
+
+    def index(self, name: str) -> int | None:
+        return self._index.get(name)
+
+    def missing(self, names) -> list[str]:
+        return [n for n in dict.fromkeys(str(x) for x in names) if n not in self._index]
+
+    def extend(self, names) -> list[str]:
+        """Ajoute les noms inconnus en fin de schéma (dans l'ordre donné) ; renvoie les noms ajoutés."""
+        with self._lock:
+            added = self.missing(names)
+            for n in added:
+                self._index[n] = len(self._names); self._names.append(n)
+            return added
+
+    def indices(self, names: tuple) -> np.ndarray:
+        """Indices (mis en cache) d'une suite de noms déjà présents dans le schéma."""
+        idx = self._idx_cache.get(names)
+        if idx is None:
+            idx = np.fromiter((self._index[n] for n in names), dtype=np.intp, count=len(names))
+            self._idx_cache[names] = idx
+        return idx
+
+    def encode(self, nutrients: dict) -> "NutrientEntry":
+        values = np.zeros(self.version, dtype=np.float32)
+        for k, v in nutrients.items():
+            try: values[self._index[str(k)]] = float(v)
+            except (TypeError, ValueError): pass
+        return NutrientEntry(values, self.version)
+
+    def matrix(self, entries: list["NutrientEntry"], width: int | None = None) -> np.ndarray:
+        """Empile des lignes (versions éventuellement différentes) en une matrice float32 alignée sur le schéma."""
+        width = width or max((e.version for e in entries), default=0)
+        out = np.zeros((len(entries), width), dtype=np.float32)
+        for i, e in enumerate(entries):
+            out[i, :e.version] = e.values
+        return out
+
+
+
+
+class NutrientEntry:
+    """Nutriments d'une ligne : float32 indexés par le schéma, `version` = taille du schéma à l'encodage."""
+    __slots__ = ("values", "version")
+
+    def __init__(self, values: np.ndarray, version: int):
+        self.values = values
+        self.version = int(version)
+
+    def to_bytes(self) -> bytes:
+        return self.values.astype("<f4", copy=False).tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes, version: int) -> "NutrientEntry":
+        return cls(np.frombuffer(blob, dtype="<f4", count=int(version)), version)
+
+    def to_dict(self, schema: NutrientSchema, keep_zeros: bool = False) -> dict[str, float]:
+        names = schema.names
+        return {names[i]: float(v) for i, v in enumerate(self.values) if keep_zeros or v}
+
+
+
+
+def food_entry(per100: np.ndarray, names: tuple, qty_g: float, schema: NutrientSchema) -> NutrientEntry:
+    """Équivalent vectoriel de calc_from_food_row : ligne du catalogue (valeurs /100 g) x quantité."""
+    values = np.zeros(schema.version, dtype=np.float32)
+    values[schema.indices(names)] = np.asarray(per100, dtype=np.float32) * np.float32(float(qty_g) / 100.0)
+    return NutrientEntry(values, schema.version)
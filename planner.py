@@ -0,0 +1,127 @@
+# Totum — optimiseur de journée type : quantités (g) d'aliments candidats qui approchent les objectifs
+# Problème quadratique à bornes (QP) sur la matrice du catalogue, x = quantités en centaines de grammes :
+#   min  Σ_j w_j (A_j x / t_j - 1)²          nutriments à atteindre (énergie, macros, micros de la feuille)
+#      + Σ_j w_j max(A_j x / t_j - 1, 0)²    plafonds (sucres, AG saturés, sel) : seul l'excès est pénalisé
+#      + λ Σ x                                préfère le moins de grammes à écart égal
+#   sous lo_i <= x_i <= hi_i
+# Résolu par gradient projeté accéléré (FISTA, projection = simple clip sur les bornes), NumPy seul :
+# quelques millisecondes pour des centaines de candidats.
+
+
+
+
+from __future__ import annotations
+import time
+import numpy as np
+import pandas as pd
+
+from totum_core import nutrient_label_key, compile_micro_targets, TARGET_NUTRIENTS
+from recommender import LIMIT_KEYS, ENERGY_BUCKET
+
+
+
+
+DEFAULT_BOUNDS_G = (0.0, 300.0)
+ENERGY_WEIGHT = 4.0
+MACRO_WEIGHT = 2.0
+MICRO_WEIGHT = 0.5
+SPARSITY = 1e-3
+MIN_GRAMS = 5.0      # en dessous, l'aliment est retiré du plan
+
+
+
+
+class MealPlan:
+    """Résultat : grammes par aliment, apports obtenus vs objectifs, et lignes prêtes pour le journal."""
+    __slots__ = ("plan", "achieved", "iterations", "solve_s", "objective")
+
+    def __init__(self, plan: pd.DataFrame, achieved: pd.DataFrame, iterations: int, solve_s: float, objective: float):
+        self.plan = plan
+        self.achieved = achieved
+        self.iterations = iterations
+        self.solve_s = solve_s
+        self.objective = objective
+
+    def journal_rows(self, date_iso: str, repas: str, entries) -> list[tuple]:
+        """(date, repas, nom, grammes, nutriments) pour insert_journal_batch ; entries(nom, g) -> nutriments."""
+        out = []
+        for nom, g in zip(self.plan["Aliment"], self.plan["Grammes"]):
+            nutr = entries(nom, float(g))
+            if nutr is not None: out.append((date_iso, repas, nom, float(g), nutr))
+        return out
+
+
+
+
+def _targets(buckets: list[str], profile_targets: dict | None, micro_targets: pd.DataFrame | None):
+    """(objectifs, poids, plafond) alignés sur les colonnes ; les objectifs du profil priment sur la feuille micro."""
+    col_of = {b: j for j, b in reversed(list(enumerate(buckets)))}
+    tgt = np.zeros(len(buckets)); w = np.zeros(len(buckets)); limit = np.zeros(len(buckets), dtype=bool)
+    micro_targets = compile_micro_targets(micro_targets)
+    if not micro_targets.empty and "_cle" in micro_targets.columns:
+        obj = pd.to_numeric(micro_targets["Objectif"], errors="coerce").fillna(0.0).to_numpy()
+        for key, o in zip(micro_targets["_cle"], obj):
+            j = col_of.get(nutrient_label_key(str(key))[0])
+            if j is not None and o > 0: tgt[j] = o; w[j] = MICRO_WEIGHT
+    for k, v in (profile_targets or {}).items():
+        j = col_of.get(nutrient_label_key(TARGET_NUTRIENTS.get(k, k))[0])
+        if j is None or not v: continue
+        tgt[j] = float(v); limit[j] = k in LIMIT_KEYS
+        w[j] = ENERGY_WEIGHT if buckets[j] == ENERGY_BUCKET else MACRO_WEIGHT
+    return tgt, w, limit
+
+
+
+
+def optimize_plan(names, nutrient_names, matrix: np.ndarray, profile_targets: dict | None,
+                  micro_targets: pd.DataFrame | None = None, bounds=DEFAULT_BOUNDS_G,
+                  max_iter: int = 3000, tol: float = 1e-7) -> MealPlan:
+    """
+    names / matrix : candidats (lignes /100 g du catalogue). bounds : (min, max) en grammes pour tous,
+    ou {nom: (min, max)} (les absents gardent DEFAULT_BOUNDS_G).
+    """
+    t0 = time.perf_counter()
+    names = [str(n) for n in names]
+    buckets = [nutrient_label_key(n)[0] for n in nutrient_names]
+    tgt, w, limit = _targets(buckets, profile_targets, micro_targets)
+    keep = tgt > 0
+    A = np.asarray(matrix, dtype=np.float64)[:, keep].T / tgt[keep, None]   # (nutriments, candidats), /100 g / objectif
+    sw, lim = np.sqrt(w[keep]), limit[keep]
+    M = A * sw[:, None]                                                     # résidus pondérés : r = M x - sw
+    if isinstance(bounds, dict):
+        lo = np.array([bounds.get(n, DEFAULT_BOUNDS_G)[0] for n in names], dtype=float) / 100.0
+        hi = np.array([bounds.get(n, DEFAULT_BOUNDS_G)[1] for n in names], dtype=float) / 100.0
+    else:
+        lo = np.full(len(names), bounds[0] / 100.0); hi = np.full(len(names), bounds[1] / 100.0)
+
+    def residual(x):
+        r = M @ x - sw
+        r[lim] = np.maximum(r[lim], 0.0)   # plafond : seul l'excès compte
+        return r
+
+    # pas = 1 / L, L = 2 ||M||² (borne de Lipschitz du gradient, valable aussi pour les plafonds)
+    L = 2.0 * max(np.linalg.norm(M, 2) ** 2, 1e-12) if M.size else 1.0
+    x = np.clip(np.zeros(len(names)), lo, hi); y = x.copy(); t = 1.0
+    it = 0; prev = np.inf
+    for it in range(1, max_iter + 1):
+        grad = 2.0 * M.T @ residual(y) + SPARSITY
+        x_new = np.clip(y - grad / L, lo, hi)
+        t_new = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+        y = x_new + ((t - 1.0) / t_new) * (x_new - x)
+        x, t = x_new, t_new
+        if it % 25 == 0:
+            f = float(residual(x) @ residual(x) + SPARSITY * x.sum())
+            if np.isfinite(prev) and prev - f <= tol * max(prev, 1.0): break
+            prev = f
+    grams = np.round(x * 100.0 / 5.0) * 5.0
+    sel = grams >= MIN_GRAMS
+    plan = pd.DataFrame({"Aliment": np.asarray(names, dtype=object)[sel], "Grammes": grams[sel]})
+    got = np.asarray(matrix, dtype=np.float64)[sel].T @ (grams[sel] / 100.0)
+    nut = np.asarray(nutrient_names, dtype=object)
+    achieved = pd.DataFrame({"Nutriment": nut[keep], "Objectif": np.round(tgt[keep], 1),
+                             "Plan": np.round(got[keep], 1),
+                             "% objectif": np.round(100.0 * got[keep] / tgt[keep], 0),
+                             "Plafond": limit[keep]})
+    r = residual(x)
+    return MealPlan(plan.sort_values("Grammes", ascending=False, ignore_index=True), achieved, it,
+                    time.perf_counter() - t0, float(r @ r))
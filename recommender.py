@@ -0,0 +1,125 @@
+# Totum — recommandations : quels aliments comblent ce qu'il reste à atteindre aujourd'hui
+# Le catalogue est déjà une matrice float32 (aliments x nutriments, valeurs /100 g, cf. CatalogSnapshot.matrix).
+# Pour un jour donné on calcule le vecteur des manques (objectifs du profil + feuille micro - totaux unifiés),
+# on le transforme en poids par nutriment, et le score de chaque aliment est un seul produit matrice-vecteur
+# (couverture des manques pour 100 kcal, plafonnée à un jour d'objectif par nutriment, pénalisée pour sucres /
+# AG saturés / sel).
+# Le top-k sort d'un argpartition ; pas de boucle Python par aliment (seulement par tranche de BLOCK_ROWS).
+
+
+
+
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+from totum_core import nutrient_label_key, compile_micro_targets, TARGET_NUTRIENTS
+
+
+
+
+# objectifs "plafond" : on ne cherche pas à les combler, un aliment qui en apporte beaucoup est pénalisé
+LIMIT_KEYS = ("sucres_g", "agsatures_g", "sel_g")
+ENERGY_BUCKET = nutrient_label_key(TARGET_NUTRIENTS["energie_kcal"])[0]
+LIMIT_WEIGHT = 0.5
+PORTION_SHARE = 0.3           # une suggestion vise au plus 30 % de l'énergie restante
+PORTION_RANGE = (5.0, 300.0)   # grammes
+DEFAULT_PORTION_G = 150.0
+MIN_KCAL_100G = 50.0          # évite qu'un aliment presque sans calories écrase le classement
+BLOCK_ROWS = 8192             # aliments par tranche de calcul du score
+
+
+
+
+class GapRecommender:
+    """Préparé une fois par version du catalogue ; recommend() ne fait que du calcul vectoriel."""
+
+    def __init__(self, names, nutrient_names, matrix: np.ndarray):
+        self.names = np.asarray(list(names), dtype=object)
+        self.nutrient_names = tuple(nutrient_names)
+        self.buckets = [nutrient_label_key(n)[0] for n in self.nutrient_names]
+        self.col_of = {b: j for j, b in reversed(list(enumerate(self.buckets)))}
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        j = self.col_of.get(ENERGY_BUCKET)
+        self.kcal = self.matrix[:, j].astype(np.float64) if j is not None else np.zeros(len(self.names))
+
+    def _density(self, tgt: np.ndarray, w: np.ndarray) -> np.ndarray:
+        """
+        min(valeur /100 g / objectif, 1) @ w, par tranches de BLOCK_ROWS aliments : la mémoire de travail reste
+        bornée quel que soit le catalogue, et rien n'est gardé entre deux requêtes (recommandeur partagé par les
+        sessions, matrice éventuellement en memmap).
+        """
+        inv = np.where(tgt > 0, 1.0 / np.where(tgt > 0, tgt, 1.0), 0.0).astype(np.float32)
+        w = w.astype(np.float32); out = np.empty(len(self.matrix), dtype=np.float32)
+        for a in range(0, len(self.matrix), BLOCK_ROWS):
+            block = self.matrix[a:a + BLOCK_ROWS] * inv
+            np.minimum(block, np.float32(1.0), out=block)
+            out[a:a + BLOCK_ROWS] = block @ w
+        return out
+
+    def targets_vector(self, profile_targets: dict | None, micro_targets: pd.DataFrame | None = None):
+        """(objectifs, masque plafond) alignés sur les colonnes de la matrice ; 0 = pas d'objectif."""
+        tgt = np.zeros(len(self.buckets)); limit = np.zeros(len(self.buckets), dtype=bool)
+        micro_targets = compile_micro_targets(micro_targets)
+        if not micro_targets.empty and "_cle" in micro_targets.columns:
+            obj = pd.to_numeric(micro_targets["Objectif"], errors="coerce").fillna(0.0).to_numpy()
+            for key, o in zip(micro_targets["_cle"], obj):
+                j = self.col_of.get(nutrient_label_key(str(key))[0])
+                if j is not None and o > 0: tgt[j] = o
+        for k, v in (profile_targets or {}).items():
+            j = self.col_of.get(nutrient_label_key(TARGET_NUTRIENTS.get(k, k))[0])
+            if j is not None and v: tgt[j] = float(v); limit[j] = k in LIMIT_KEYS
+        return tgt, limit
+
+    def consumed_vector(self, totals: pd.Series | None) -> np.ndarray:
+        out = np.zeros(len(self.buckets))
+        if isinstance(totals, pd.Series) and not totals.empty:
+            vals = pd.to_numeric(totals, errors="coerce").fillna(0.0)
+            for label, v in vals.items():
+                j = self.col_of.get(nutrient_label_key(str(label))[0])
+                if j is not None: out[j] += float(v)
+        return out
+
+    def recommend(self, totals: pd.Series | None, profile_targets: dict | None,
+                  micro_targets: pd.DataFrame | None = None, k: int = 5, exclude=()) -> pd.DataFrame:
+        """Top-k : Aliment, Grammes, Score, Comble (les manques les mieux couverts par la portion proposée)."""
+        empty = pd.DataFrame(columns=["Aliment", "Grammes", "Score", "Comble"])
+        if not len(self.names) or not self.matrix.shape[1]: return empty
+        tgt, limit = self.targets_vector(profile_targets, micro_targets)
+        cons = self.consumed_vector(totals)
+        has = tgt > 0
+        gap = np.where(has & ~limit, np.clip(1.0 - cons / np.where(has, tgt, 1.0), 0.0, 1.0), 0.0)
+        if ENERGY_BUCKET in self.col_of: gap[self.col_of[ENERGY_BUCKET]] = 0.0   # l'énergie sert de budget
+        if not gap.any(): return empty
+        # couverture /100 g plafonnée à 1 jour d'objectif : le score est la part des manques couverte
+        # pour 100 kcal, moins une pénalité sur les plafonds
+        w = gap.copy(); w[has & limit] = -LIMIT_WEIGHT
+        density = self._density(tgt, w)                                  # (n,) : produit matrice-vecteur par tranches
+        score = density / np.maximum(self.kcal, MIN_KCAL_100G) * 100.0   # pour 100 kcal
+        if len(exclude):
+            score[np.isin(self.names, np.asarray(list(exclude), dtype=object))] = -np.inf
+        k = min(k, int(np.isfinite(score).sum()))
+        if k <= 0: return empty
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top])]
+        top = top[score[top] > 0]
+        if not len(top): return empty
+        # portion (k lignes seulement) : de quoi fermer le plus grand des 3 manques que l'aliment couvre le mieux,
+        # sans dépasser une part de l'énergie restante
+        per100 = self.matrix[top].astype(np.float64)
+        fill100 = np.minimum(per100 / np.where(has, tgt, np.inf), 1.0) * (gap > 0)
+        main = np.argsort(-fill100, axis=1)[:, :3]
+        need = np.take_along_axis(gap * tgt / np.maximum(per100, 1e-12), main, axis=1) * 100.0
+        need = np.where(np.take_along_axis(fill100, main, axis=1) > 0, need, 0.0).max(axis=1)
+        j = self.col_of.get(ENERGY_BUCKET)
+        left_kcal = max(tgt[j] - cons[j], 0.0) if j is not None and tgt[j] > 0 else 0.0
+        kcal = self.kcal[top]
+        by_energy = np.where((kcal > 0) & (left_kcal > 0), 100.0 * PORTION_SHARE * left_kcal / np.maximum(kcal, 1e-9),
+                             DEFAULT_PORTION_G)
+        grams = np.minimum(need, by_energy)
+        grams = np.maximum(np.round(np.clip(grams, *PORTION_RANGE) / 5.0) * 5.0, PORTION_RANGE[0])
+        fill = np.minimum(per100 * (grams[:, None] / 100.0) / np.where(has, tgt, np.inf), gap)
+        labels = [", ".join(self.nutrient_names[c].rsplit("_", 1)[0].replace("_", " ")
+                            for c in np.argsort(-row)[:3] if row[c] > 0.02) for row in fill]
+        return pd.DataFrame({"Aliment": self.names[top], "Grammes": grams, "Score": np.round(score[top], 2),
+                             "Comble": labels})
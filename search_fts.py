@@ -0,0 +1,138 @@
+# Totum — recherche d'aliments adossée à SQLite FTS5 (alternative à journal_search_candidates)
+# Les noms canoniques (canon : sans accents, minuscules) sont écrits une fois par version du catalogue dans
+# un petit fichier SQLite partagé par toutes les sessions (et réutilisé d'un démarrage à l'autre) :
+# - B-tree sur canon          -> palier "commence par" (requête de préfixe sur l'index)
+# - FTS5 trigram              -> palier "tous les mots présents" (LIKE '%mot%' indexé)
+# - table vocab + FTS5 unicode61 -> fautes de frappe : mots proches du vocabulaire, puis noms qui les contiennent
+# Classement et complément suivent les règles de totum_core (fuzzy_*, char_overlap) : mêmes résultats que
+# journal_search_candidates. Les paliers exacts ne lisent que quelques pages d'index ; seul le complément
+# (requête sans aucun mot proche) parcourt la table des noms, en flux : mémoire bornée.
+
+
+
+
+from __future__ import annotations
+import os, heapq, hashlib, sqlite3, tempfile, threading
+from pathlib import Path
+
+from totum_core import FUZZY_MIN_LEN, canon, char_overlap, fuzzy_close_words, fuzzy_name_score, search_words
+
+
+
+
+SEARCH_BACKEND = os.getenv("TOTUM_SEARCH_BACKEND", "memory").strip().lower()   # "memory" | "fts5"
+SEARCH_DIR = Path(os.getenv("TOTUM_SEARCH_DIR", tempfile.gettempdir()))
+INDEX_VERSION = 2   # à incrémenter quand le schéma ou canon change : les anciens fichiers ne sont plus repris
+
+
+
+
+def fts5_available() -> bool:
+    try:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram');")
+        conn.close()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+
+
+class FtsSearchIndex:
+    """Index de recherche sur fichier SQLite ; une connexion en lecture seule par thread."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    @classmethod
+    def build(cls, names, directory: Path = SEARCH_DIR) -> "FtsSearchIndex":
+        """Construit (ou réutilise, si les noms sont identiques) l'index de ces noms, publié par renommage atomique."""
+        names = [str(n) for n in names]
+        digest = hashlib.sha1("\n".join([f"v{INDEX_VERSION}", *names]).encode("utf-8")).hexdigest()[:16]
+        path = Path(directory) / f"totum-search-{digest}.db"
+        if not path.exists():
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            conn = sqlite3.connect(tmp)
+            conn.executescript("""
+                PRAGMA journal_mode=OFF;
+                CREATE TABLE names (id INTEGER PRIMARY KEY, nom TEXT NOT NULL, canon TEXT NOT NULL);
+                CREATE VIRTUAL TABLE names_tri USING fts5(canon, content='names', content_rowid='id', tokenize='trigram');
+                CREATE VIRTUAL TABLE names_words USING fts5(canon, content='names', content_rowid='id',
+                                                            tokenize='unicode61');
+                CREATE TABLE vocab (term TEXT PRIMARY KEY) WITHOUT ROWID;
+            """)
+            canons = [canon(n) for n in names]
+            conn.executemany("INSERT INTO names (id, nom, canon) VALUES (?,?,?);", zip(range(len(names)), names, canons))
+            conn.executemany("INSERT INTO vocab (term) VALUES (?);", ((w,) for w in sorted({w for c in canons for w in search_words(c)})))
+            conn.execute("CREATE INDEX idx_names_canon ON names(canon);")
+            conn.execute("INSERT INTO names_tri(names_tri) VALUES ('rebuild');")
+            conn.execute("INSERT INTO names_words(names_words) VALUES ('rebuild');")
+            conn.commit(); conn.close()
+            os.replace(tmp, path)
+        return cls(path)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def search(self, q: str, limit: int = 12) -> list[str]:
+        """Mêmes paliers que journal_search_candidates : commence par, tous les mots, fautes de frappe, complément."""
+        conn = self._conn()
+        if not (q or "").strip():
+            return [r[0] for r in conn.execute("SELECT nom FROM names ORDER BY id LIMIT ?;", (limit,))]
+        q_canon = canon(q)
+        out: list[str] = []; seen: set[str] = set()
+
+        def take(rows):
+            for (nom,) in rows:
+                if nom not in seen:
+                    seen.add(nom); out.append(nom)
+                    if len(out) >= limit: return True
+            return False
+
+        # 1) commence par : parcours de l'index B-tree sur [q, q + U+10FFFF)
+        bounds = (q_canon, q_canon + "\U0010ffff")
+        if take(conn.execute("SELECT nom FROM names WHERE canon >= ? AND canon < ? ORDER BY id LIMIT ?;",
+                             (*bounds, limit))): return out
+        # 2) tous les mots présents (sous-chaînes, comme l'original) ; le trigram préfiltre sur les mots de 3+ lettres
+        tokens = [t for t in q_canon.split(" ") if t]
+        long_t = [t for t in tokens if len(t) >= FUZZY_MIN_LEN]
+        cond = " AND ".join("instr(canon, ?) > 0" for _ in tokens) or "1"
+        if long_t:
+            where = " AND ".join("canon LIKE ?" for _ in long_t)
+            cond += f" AND id IN (SELECT rowid FROM names_tri WHERE {where})"
+        rows = conn.execute(f"SELECT nom FROM names WHERE {cond} AND NOT (canon >= ? AND canon < ?) ORDER BY id LIMIT ?;",
+                            (*tokens, *(f"%{t}%" for t in long_t), *bounds, limit * 2))
+        if take(rows): return out
+        # 3) fautes de frappe : mots proches dans le vocabulaire (même 1re ou 2e lettre), puis noms qui les contiennent
+        if long_t:
+            vocab = [r[0] for p in sorted({c for t in long_t for c in t[:2]})
+                     for r in conn.execute("SELECT term FROM vocab WHERE term >= ? AND term < ?;", (p, p + "\U0010ffff"))]
+            close = fuzzy_close_words(long_t, vocab)
+            words = sorted({w for c in close.values() for w in c})
+            if words:
+                rows = conn.execute("SELECT id, nom, canon FROM names WHERE id IN "
+                                    "(SELECT rowid FROM names_words WHERE names_words MATCH ?);",
+                                    (" OR ".join(_quote(w) for w in words),))
+                scored = sorted((-fuzzy_name_score(long_t, close, search_words(c)), i, nom) for i, nom, c in rows)
+                if take((nom,) for s, _, nom in scored if s < 0): return out
+        # 4) complément : recouvrement des caractères, en flux sur la table des noms
+        sb = frozenset(q_canon)
+
+        def rest():
+            for i, nom, c in conn.execute("SELECT id, nom, canon FROM names ORDER BY id;"):
+                if nom in seen: continue
+                seen.add(nom); yield -char_overlap(frozenset(c), sb), i, nom
+        out += [nom for _, _, nom in heapq.nsmallest(limit - len(out), rest())]
+        return out
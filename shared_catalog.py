@@ -0,0 +1,114 @@
+# Totum — catalogue partagé entre processus (déploiement multi-workers derrière un load balancer)
+# Le premier processus qui construit une version du catalogue la publie dans TOTUM_SHARED_CATALOG_DIR, sous
+# un dossier nommé par l'empreinte du classeur source :
+#   matrix.npy   valeurs /100 g en float32 (aliments x nutriments), ouvert en np.memmap lecture seule
+#   names.txt    noms d'aliments, un par ligne (UTF-8)
+#   meta.json    noms des nutriments, cibles macro / micro (JSON "split")
+# Les autres processus (et les redémarrages) s'y attachent sans relire le classeur : les pages de la matrice
+# sont partagées par le cache du système, la mémoire ne croît plus avec le nombre de workers.
+# L'empreinte couvre aussi le code qui produit la matrice (LOGIC_MODULES) : changer le nettoyage ou les unités
+# publie une nouvelle version, les workers ne s'attachent pas à une matrice calculée par l'ancien code.
+# Publication atomique : écriture dans un dossier temporaire puis os.rename ; le perdant d'une course jette le sien.
+# Désactivé si TOTUM_SHARED_CATALOG_DIR n'est pas défini.
+
+
+
+
+from __future__ import annotations
+import io, os, json, shutil, hashlib, tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+
+
+SHARED_DIR = os.getenv("TOTUM_SHARED_CATALOG_DIR", "").strip()
+FORMAT_VERSION = 1
+# code qui décide du contenu publié (nettoyage clean_liste, fusion des unités, colonnes, cibles) : un déploiement
+# qui le modifie publie une nouvelle version au lieu de s'attacher à une matrice calculée par l'ancien code
+LOGIC_MODULES = ("totum_core.py", "units.py", "catalog.py")
+_LOGIC: bytes | None = None
+
+
+
+
+def shared_enabled() -> bool:
+    return bool(SHARED_DIR)
+
+
+
+
+def _logic_digest() -> bytes:
+    global _LOGIC
+    if _LOGIC is None:
+        h = hashlib.sha1()
+        for name in LOGIC_MODULES:
+            h.update(name.encode()); h.update((Path(__file__).parent / name).read_bytes())
+        _LOGIC = h.digest()
+    return _LOGIC
+
+
+
+
+def source_digest(path: Path) -> str:
+    """Empreinte du classeur source (contenu + format de publication + code de nettoyage et d'unités)."""
+    h = hashlib.sha1(f"totum-catalog-v{FORMAT_VERSION}".encode()); h.update(_logic_digest())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""): h.update(block)
+    return h.hexdigest()[:20]
+
+
+
+
+def _frame_to_json(df: pd.DataFrame | None):
+    return None if df is None or df.empty else json.loads(df.to_json(orient="split", force_ascii=False))
+
+
+
+
+def _frame_from_json(obj) -> pd.DataFrame:
+    if not obj: return pd.DataFrame()
+    return pd.read_json(io.StringIO(json.dumps(obj)), orient="split", dtype=False)
+
+
+
+
+def publish(digest: str, names, nutrient_names, matrix: np.ndarray, targets_macro: pd.DataFrame,
+            targets_micro: dict[str, pd.DataFrame]) -> Path:
+    """Écrit la version `digest` si elle n'existe pas encore ; renvoie son dossier."""
+    root = Path(SHARED_DIR); final = root / digest
+    if (final / "meta.json").exists(): return final
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{digest}-", dir=root))
+    try:
+        np.save(tmp / "matrix.npy", np.ascontiguousarray(matrix, dtype=np.float32))
+        (tmp / "names.txt").write_text("\n".join(str(n).replace("\n", " ") for n in names), encoding="utf-8")
+        # meta.json en dernier : sa présence signale une version complète
+        meta = {"format": FORMAT_VERSION, "rows": int(matrix.shape[0]), "nutrient_names": list(nutrient_names),
+                "targets_macro": _frame_to_json(targets_macro),
+                "targets_micro": {k: _frame_to_json(v) for k, v in targets_micro.items()}}
+        (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.rename(tmp, final)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)   # un autre processus a publié avant nous (ou disque plein)
+        if not (final / "meta.json").exists(): raise
+    return final
+
+
+
+
+def attach(digest: str) -> dict | None:
+    """Version publiée `digest` (matrice en memmap lecture seule) ou None si absente / incomplète."""
+    d = Path(SHARED_DIR) / digest
+    try:
+        meta = json.loads((d / "meta.json").read_text(encoding="utf-8"))
+        matrix = np.load(d / "matrix.npy", mmap_mode="r")
+        names = (d / "names.txt").read_text(encoding="utf-8").split("\n") if meta["rows"] else []
+    except (OSError, ValueError, KeyError):
+        return None
+    if meta.get("format") != FORMAT_VERSION or len(names) != matrix.shape[0]: return None
+    return {"names": names, "nutrient_names": tuple(meta["nutrient_names"]), "matrix": matrix,
+            "targets_macro": _frame_from_json(meta.get("targets_macro")),
+            "targets_micro": {k: _frame_from_json(v) for k, v in (meta.get("targets_micro") or {}).items()},
+            "path": d}
@@ -0,0 +1,104 @@
+# Totum — préparation des assets statiques (logo, favicon)
+# Le logo est redimensionné / recompressé une seule fois par process (Pillow si disponible) et écrit
+# dans static/ sous un nom qui contient son empreinte : Streamlit le sert alors en fichier statique
+# (server.enableStaticServing) et le navigateur le garde en cache ; chaque rerun n'envoie plus qu'une URL.
+# Sans service statique, repli sur une data URI calculée une fois (sur l'image réduite, pas l'original).
+
+
+
+
+from __future__ import annotations
+import io, re, base64, hashlib
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow optionnel : on sert alors l'original tel quel
+    Image = None
+
+
+
+
+STATIC_DIR = Path(__file__).parent / "static"
+STATIC_URL = "app/static"
+TOPBAR_PX = 140
+FAVICON_PX = 32
+
+
+
+
+def _resized_png(data: bytes, px: int) -> bytes:
+    """PNG carré de `px` * 2 (écrans haute densité) au plus, optimisé ; l'original si Pillow est absent ou échoue."""
+    if Image is None: return data
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im = im.convert("RGBA")
+            im.thumbnail((px * 2, px * 2), Image.LANCZOS)
+            out = io.BytesIO()
+            im.save(out, format="PNG", optimize=True)
+            return out.getvalue() if out.tell() < len(data) else data
+    except Exception:
+        return data
+
+
+
+
+def _publish(data: bytes, stem: str) -> Path:
+    # nom à empreinte : un nouveau logo = une nouvelle URL, l'ancien reste valide pour les pages déjà ouvertes
+    path = STATIC_DIR / f"{stem}-{hashlib.sha1(data).hexdigest()[:10]}.png"
+    if not path.exists():
+        STATIC_DIR.mkdir(exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data); tmp.replace(path)
+    return path
+
+
+
+
+class LogoAssets:
+    """Logo de la barre du haut + favicon, encodés une fois ; `src(static)` donne l'URL ou la data URI."""
+    __slots__ = ("topbar_png", "favicon_png", "topbar_path", "favicon_path", "_data_uri")
+
+    def __init__(self, logo_path: Path):
+        data = Path(logo_path).read_bytes()
+        self.topbar_png = _resized_png(data, TOPBAR_PX)
+        self.favicon_png = _resized_png(data, FAVICON_PX)
+        try:
+            self.topbar_path = _publish(self.topbar_png, "logo")
+            self.favicon_path = _publish(self.favicon_png, "favicon")
+        except OSError:   # dossier en lecture seule : data URI uniquement
+            self.topbar_path = self.favicon_path = None
+        self._data_uri = None
+
+    def src(self, static: bool) -> str:
+        if static and self.topbar_path is not None:
+            return f"{STATIC_URL}/{self.topbar_path.name}"
+        if self._data_uri is None:
+            self._data_uri = "data:image/png;base64," + base64.b64encode(self.topbar_png).decode()
+        return self._data_uri
+
+
+
+
+@lru_cache(maxsize=4)
+def _logo_assets(path: str, mtime_ns: int) -> LogoAssets:
+    return LogoAssets(Path(path))
+
+
+
+
+def load_logo_assets(logo_path: Path) -> LogoAssets | None:
+    """Assets du logo, recalculés seulement si le fichier change (mtime) ; None si le logo est absent."""
+    try: mtime_ns = Path(logo_path).stat().st_mtime_ns
+    except OSError: return None
+    return _logo_assets(str(logo_path), mtime_ns)
+
+
+
+
+def minify_css(css: str) -> str:
+    """Retire commentaires et blancs superflus (le bloc <style> est renvoyé à chaque rerun)."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
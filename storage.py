@@ -0,0 +1,610 @@
+# Totum — stockage du journal et du profil (SQLite local)
+# Sans dépendance à Streamlit : utilisé par l'app, l'analytique et les traitements hors UI.
+
+
+
+
+from __future__ import annotations
+import os, json, time, uuid, hashlib, sqlite3, threading
+import numpy as np
+import pandas as pd
+
+from totum_core import TARGET_NUTRIENTS
+from nutrients import NutrientSchema, NutrientEntry
+
+
+
+
+DB_PATH = os.path.join(os.getcwd(), "totum.db")
+
+
+
+
+# ============ SQLite ============
+def db():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    return conn
+
+
+
+
+_READERS = threading.local()
+
+
+
+
+def _reader():
+    """
+    Connexion de lecture réutilisée (une par thread et par DB_PATH) pour les petites requêtes appelées à chaque rerun
+    (versions du journal, comptages) ; en WAL, chaque SELECT hors transaction voit les dernières écritures validées.
+    """
+    conns = getattr(_READERS, "conns", None)
+    if conns is None: conns = _READERS.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        init_db(); conn = conns[DB_PATH] = db()
+    return conn
+
+
+
+
+def init_db():
+    # schéma + migrations une fois par process et par DB_PATH (refait si le fichier a disparu entre-temps)
+    ready = DB_PATH in _MIGRATED and os.path.exists(DB_PATH)
+    conn = db()
+    if ready: return conn
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS profile (
+            id INTEGER PRIMARY KEY CHECK (id=1),
+            sexe TEXT, age INTEGER, taille_cm REAL, poids_kg REAL,
+            activite TEXT, prot_pct INTEGER, gluc_pct INTEGER, lip_pct INTEGER
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            repas TEXT NOT NULL,
+            nom TEXT NOT NULL,
+            quantite_g REAL NOT NULL,
+            nutrients_json TEXT NOT NULL
+        );
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS nutrient_schema (idx INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);")
+    # synchronisation : journal des changements local (append-only), tombstones des suppressions, état (curseurs)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS journal_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('upsert','delete')),
+            updated_at INTEGER NOT NULL,
+            payload TEXT
+        );
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS journal_tombstones (uid TEXT PRIMARY KEY, updated_at INTEGER NOT NULL, device TEXT NOT NULL);")
+    # empreintes des lignes supprimées : un ré-import (ex. ancien export) ne les fait pas revenir
+    conn.execute("CREATE TABLE IF NOT EXISTS journal_hash_tombstones (content_hash TEXT NOT NULL, occurrence INTEGER NOT NULL, "
+                 "PRIMARY KEY (content_hash, occurrence));")
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);")
+    # compteurs (version du journal : +1 à chaque ajout / suppression, sert de clé aux caches de vues)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0);")
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('journal_version', 0);")
+    conn.commit()
+    _migrate_journal(conn); _MIGRATED.add(DB_PATH)
+    return conn
+
+
+
+
+# ============ Schéma des nutriments (vecteurs float32) ============
+_MIGRATED: set[str] = set()
+_SCHEMAS: dict[str, NutrientSchema] = {}
+_SCHEMA_LOCK = threading.Lock()
+
+
+
+
+def _sync_schema(conn, names=(), reload: bool = False) -> NutrientSchema:
+    # le schéma en mémoire est toujours un préfixe de l'ordre en base : on insère d'abord en base, puis on relit
+    with _SCHEMA_LOCK:
+        schema = _SCHEMAS.setdefault(DB_PATH, NutrientSchema())
+        missing = schema.missing(names)
+        if missing or reload or schema.version == 0:
+            if missing:
+                conn.executemany("INSERT OR IGNORE INTO nutrient_schema (name) VALUES (?);", [(n,) for n in missing])
+                conn.commit()
+            schema.extend(r[0] for r in conn.execute("SELECT name FROM nutrient_schema ORDER BY idx;"))
+        return schema
+
+
+
+
+def nutrient_schema(names=()) -> NutrientSchema:
+    """Schéma global (process + base) ; `names` inconnus sont ajoutés en fin de schéma."""
+    schema = _SCHEMAS.get(DB_PATH)
+    if schema is not None and not schema.missing(names):
+        return schema
+    return _sync_schema(init_db(), names)
+
+
+
+
+def encode_nutrients(nutrients: dict | NutrientEntry, conn=None) -> NutrientEntry:
+    if isinstance(nutrients, NutrientEntry): return nutrients
+    schema = _sync_schema(conn, nutrients.keys()) if conn is not None else nutrient_schema(nutrients.keys())
+    return schema.encode(nutrients)
+
+
+
+
+def content_hash(date_iso, repas, nom, quantite_g, nutrients: dict) -> str:
+    """
+    Empreinte d'une ligne (date, repas, nom, quantité, nutriments non nuls arrondis à 4 décimales, comme l'export) :
+    identique pour une ligne locale (float32) et la même ligne relue depuis journal.xlsx.
+    """
+    parts = [str(date_iso), str(repas).strip(), str(nom).strip(), repr(round(float(quantite_g), 3))]
+    parts += sorted(f"{k}={round(float(v), 4)!r}" for k, v in (nutrients or {}).items() if v and round(float(v), 4))
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+
+
+def _next_occurrence(conn, h: str, uid: str | None = None) -> int:
+    r = conn.execute("SELECT MAX(occurrence) FROM journal WHERE content_hash=? AND uid IS NOT ?;", (h, uid)).fetchone()
+    return 0 if r[0] is None else int(r[0]) + 1
+
+
+
+
+def _migrate_journal(conn):
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(journal);")}
+    if "nutrients_blob" not in cols:
+        conn.execute("ALTER TABLE journal ADD COLUMN nutrients_blob BLOB;")
+        conn.execute("ALTER TABLE journal ADD COLUMN schema_version INTEGER;")
+    if "uid" not in cols:
+        # identifiant stable entre appareils + horodatage LWW ; les lignes existantes partent au prochain push
+        conn.execute("ALTER TABLE journal ADD COLUMN uid TEXT;")
+        conn.execute("ALTER TABLE journal ADD COLUMN updated_at INTEGER;")
+        conn.execute("ALTER TABLE journal ADD COLUMN device TEXT;")
+    # lignes historiques (JSON) -> vecteurs float32, une seule fois
+    legacy = conn.execute("SELECT id, nutrients_json FROM journal WHERE nutrients_blob IS NULL;").fetchall()
+    if legacy:
+        decoded = []
+        for row_id, js in legacy:
+            try: decoded.append((row_id, json.loads(js) or {}))
+            except Exception: decoded.append((row_id, {}))
+        _sync_schema(conn, [k for _, d in decoded for k in d])
+        updates = []
+        for row_id, d in decoded:
+            e = encode_nutrients(d, conn)
+            updates.append((e.to_bytes(), e.version, row_id))
+        conn.executemany("UPDATE journal SET nutrients_blob=?, schema_version=?, nutrients_json='{}' WHERE id=?;", updates)
+    legacy_ids = [r[0] for r in conn.execute("SELECT id FROM journal WHERE uid IS NULL;")]
+    if legacy_ids:
+        now, device = now_ms(), device_id(conn)
+        conn.executemany("UPDATE journal SET uid=?, updated_at=?, device=? WHERE id=?;",
+                         [(uuid.uuid4().hex, now, device, i) for i in legacy_ids])
+        for i in legacy_ids: _log_upsert(conn, i)
+    if "content_hash" not in cols:
+        # empreinte du contenu (+ rang parmi les lignes identiques) : un ré-import ne duplique rien
+        conn.execute("ALTER TABLE journal ADD COLUMN content_hash TEXT;")
+        conn.execute("ALTER TABLE journal ADD COLUMN occurrence INTEGER NOT NULL DEFAULT 0;")
+    missing = conn.execute("SELECT id,date,repas,nom,quantite_g,nutrients_blob,schema_version FROM journal "
+                           "WHERE content_hash IS NULL ORDER BY id;").fetchall()
+    if missing:
+        schema = _sync_schema(conn, reload=True); seen: dict[str, int] = {}
+        for h, in conn.execute("SELECT content_hash FROM journal WHERE content_hash IS NOT NULL;"):
+            seen[h] = seen.get(h, 0) + 1
+        updates = []
+        for row_id, d, repas, nom, q, blob, version in missing:
+            nutr = NutrientEntry.from_bytes(blob, version).to_dict(schema) if blob is not None else {}
+            h = content_hash(d, repas, nom, q, nutr)
+            updates.append((h, seen.get(h, 0), row_id)); seen[h] = seen.get(h, 0) + 1
+        conn.executemany("UPDATE journal SET content_hash=?, occurrence=? WHERE id=?;", updates)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_journal_uid ON journal(uid);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_date_id ON journal(date, id);")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_journal_content ON journal(content_hash, occurrence);")
+    conn.commit()
+
+
+
+
+# ============ Version du journal ============
+# une version globale + une par jour touché : un ajout sur un jour n'invalide pas les vues des autres jours
+def _bump_journal_version(conn, dates=()):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key='journal_version';")
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1;",
+                     [(f"journal_version:{d}",) for d in sorted(set(map(str, dates)))])
+
+
+
+
+def journal_version(date_iso: str | None = None) -> int:
+    """Version globale du journal, ou celle d'un jour (`date_iso`) si précisé."""
+    key = "journal_version" if date_iso is None else f"journal_version:{date_iso}"
+    r = _reader().execute("SELECT value FROM meta WHERE key=?;", (key,)).fetchone()
+    return int(r[0]) if r else 0
+
+
+
+
+# ============ Journal des changements (sync) ============
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+
+
+def device_id(conn=None) -> str:
+    """Identifiant de cet appareil (créé une fois, conservé dans sync_state) ; départage les égalités LWW."""
+    conn = conn or init_db()
+    r = conn.execute("SELECT value FROM sync_state WHERE key='device';").fetchone()
+    if r: return r[0]
+    conn.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('device', ?);", (uuid.uuid4().hex,))
+    conn.commit()
+    return conn.execute("SELECT value FROM sync_state WHERE key='device';").fetchone()[0]
+
+
+
+
+def sync_state_get(key: str, default=None, conn=None):
+    r = (conn or init_db()).execute("SELECT value FROM sync_state WHERE key=?;", (key,)).fetchone()
+    return r[0] if r else default
+
+
+
+
+def sync_state_set(key: str, value, conn=None):
+    conn = conn or init_db()
+    conn.execute("INSERT INTO sync_state (key, value) VALUES (?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value;",
+                 (key, str(value)))
+    conn.commit()
+
+
+
+
+def _log_upsert(conn, row_id: int):
+    # la charge utile porte les nutriments par nom : l'ordre du schéma diffère d'un appareil à l'autre
+    r = conn.execute("SELECT uid,date,repas,nom,quantite_g,nutrients_blob,schema_version,updated_at,device "
+                     "FROM journal WHERE id=?;", (row_id,)).fetchone()
+    if r is None: return
+    entry = NutrientEntry.from_bytes(r[5], r[6]) if r[5] is not None else NutrientEntry(np.zeros(0, np.float32), 0)
+    payload = {"date": r[1], "repas": r[2], "nom": r[3], "quantite_g": r[4], "device": r[8],
+               "nutrients": _entry_dict(conn, entry)}
+    conn.execute("INSERT INTO journal_changes (uid, op, updated_at, payload) VALUES (?,?,?,?);",
+                 (r[0], "upsert", r[7], json.dumps(payload, ensure_ascii=False)))
+
+
+
+
+def pending_changes(after_seq: int, limit: int = 500) -> list[dict]:
+    """Changements locaux non encore poussés (seq > after_seq), dans l'ordre du journal."""
+    conn = init_db()
+    cur = conn.execute("SELECT seq, uid, op, updated_at, payload FROM journal_changes WHERE seq>? ORDER BY seq LIMIT ?;",
+                       (int(after_seq), int(limit)))
+    return [{"seq": r[0], "uid": r[1], "op": r[2], "updated_at": r[3], **json.loads(r[4] or "{}")} for r in cur.fetchall()]
+
+
+
+
+def _local_version(conn, uid: str):
+    r = conn.execute("SELECT updated_at, device FROM journal WHERE uid=?;", (uid,)).fetchone()
+    t = conn.execute("SELECT updated_at, device FROM journal_tombstones WHERE uid=?;", (uid,)).fetchone()
+    return max((v for v in (r, t) if v is not None), default=None)
+
+
+
+
+def apply_remote_changes(changes: list[dict]) -> int:
+    """
+    Applique des changements distants en last-writer-wins sur (updated_at, device) :
+    un changement plus ancien que la version locale (ligne ou tombstone) est ignoré.
+    Rien n'est réécrit dans journal_changes (pas d'écho au prochain push). Renvoie le nb de changements appliqués.
+    """
+    conn = init_db()
+    applied = 0; touched: set[str] = set()
+    for ch in changes:
+        uid, ts, device = str(ch["uid"]), int(ch["updated_at"]), str(ch.get("device") or "")
+        local = _local_version(conn, uid)
+        if local is not None and tuple(local) >= (ts, device): continue
+        prev = conn.execute("SELECT date FROM journal WHERE uid=?;", (uid,)).fetchone()
+        if prev: touched.add(prev[0])
+        if ch["op"] == "delete":
+            _bury_hash(conn, "uid=?", uid)
+            conn.execute("DELETE FROM journal WHERE uid=?;", (uid,))
+            conn.execute("INSERT OR REPLACE INTO journal_tombstones (uid, updated_at, device) VALUES (?,?,?);",
+                         (uid, ts, device))
+        else:
+            entry = encode_nutrients(ch.get("nutrients") or {}, conn)
+            h = content_hash(ch["date"], ch["repas"], ch["nom"], ch["quantite_g"], ch.get("nutrients") or {})
+            # OR REPLACE -> nouvel id : les empreintes par jour (ETag) changent aussi sur une mise à jour
+            conn.execute("INSERT OR REPLACE INTO journal (date,repas,nom,quantite_g,nutrients_json,nutrients_blob,"
+                         "schema_version,uid,updated_at,device,content_hash,occurrence) VALUES (?,?,?,?,'{}',?,?,?,?,?,?,?);",
+                         (ch["date"], ch["repas"], ch["nom"], float(ch["quantite_g"]), entry.to_bytes(), entry.version,
+                          uid, ts, device, h, _next_occurrence(conn, h, uid)))
+            conn.execute("DELETE FROM journal_tombstones WHERE uid=?;", (uid,))
+            touched.add(str(ch["date"]))
+        applied += 1
+    if applied: _bump_journal_version(conn, touched)
+    conn.commit()
+    return applied
+
+
+
+
+def load_profile():
+    conn = init_db()
+    cur = conn.execute("SELECT sexe,age,taille_cm,poids_kg,activite,prot_pct,gluc_pct,lip_pct FROM profile WHERE id=1;")
+    row = cur.fetchone()
+    if row:
+        return {"sexe":row[0],"age":row[1],"taille_cm":row[2],"poids_kg":row[3],
+                "activite":row[4],"repartition_macros":(row[5],row[6],row[7])}
+    return {"sexe":"Homme","age":40,"taille_cm":181.0,"poids_kg":72.0,"activite":"Sédentaire","repartition_macros":(30,55,15)}
+
+
+
+
+def save_profile(p):
+    conn = init_db()
+    conn.execute("""
+        INSERT INTO profile (id,sexe,age,taille_cm,poids_kg,activite,prot_pct,gluc_pct,lip_pct)
+        VALUES (1,?,?,?,?,?,?,?,?)
+        ON CONFLICT(id) DO UPDATE SET
+            sexe=excluded.sexe, age=excluded.age, taille_cm=excluded.taille_cm, poids_kg=excluded.poids_kg,
+            activite=excluded.activite, prot_pct=excluded.prot_pct, gluc_pct=excluded.gluc_pct, lip_pct=excluded.lip_pct;
+    """, (p["sexe"], int(p["age"]), float(p["taille_cm"]), float(p["poids_kg"]),
+          p["activite"], 30, 55, 15))
+    conn.commit()
+
+
+
+
+def _insert_row(conn, date_iso, repas, nom, quantite_g, nutrients) -> int:
+    entry = encode_nutrients(nutrients, conn)
+    h = content_hash(date_iso, repas, nom, quantite_g, _entry_dict(conn, entry))
+    cur = conn.execute("INSERT INTO journal (date,repas,nom,quantite_g,nutrients_json,nutrients_blob,schema_version,"
+                       "uid,updated_at,device,content_hash,occurrence) VALUES (?,?,?,?,'{}',?,?,?,?,?,?,?)",
+                       (date_iso, repas, nom, float(quantite_g), entry.to_bytes(), entry.version,
+                        uuid.uuid4().hex, now_ms(), device_id(conn), h, _next_occurrence(conn, h)))
+    _log_upsert(conn, cur.lastrowid)
+    return int(cur.lastrowid)
+
+
+
+
+def _entry_dict(conn, entry: NutrientEntry) -> dict:
+    schema = _SCHEMAS.get(DB_PATH) or _sync_schema(conn)
+    if entry.version > schema.version: schema = _sync_schema(conn, reload=True)
+    return entry.to_dict(schema)
+
+
+
+
+def insert_journal(date_iso, repas, nom, quantite_g, nutrients: dict | NutrientEntry) -> int:
+    conn = init_db()
+    row_id = _insert_row(conn, date_iso, repas, nom, quantite_g, nutrients)
+    _bump_journal_version(conn, [date_iso])
+    conn.commit()
+    return row_id
+
+
+
+
+def insert_journal_batch(rows) -> list[int]:
+    """Plusieurs lignes (date, repas, nom, quantite_g, nutriments) en une transaction : tout ou rien."""
+    conn = init_db()
+    try:
+        rows = list(rows)
+        ids = [_insert_row(conn, *r) for r in rows]
+        if ids: _bump_journal_version(conn, [r[0] for r in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback(); raise
+    return ids
+
+
+
+
+JOURNAL_BASE_COLS = ("date", "repas", "nom", "quantite_g")
+
+
+
+
+def _bury_hash(conn, where: str, key):
+    """Garde l'empreinte (content_hash, occurrence) de la ligne supprimée : l'import ne la recrée pas."""
+    conn.execute("INSERT OR IGNORE INTO journal_hash_tombstones (content_hash, occurrence) "
+                 f"SELECT content_hash, occurrence FROM journal WHERE {where} AND content_hash IS NOT NULL;", (key,))
+
+
+
+
+def _buried(conn, hashes) -> set[tuple[str, int]]:
+    hashes = list(hashes); out: set[tuple[str, int]] = set()
+    for k in range(0, len(hashes), 500):
+        chunk = hashes[k:k + 500]
+        out.update(conn.execute("SELECT content_hash, occurrence FROM journal_hash_tombstones "
+                                f"WHERE content_hash IN ({','.join('?' * len(chunk))});", chunk).fetchall())
+    return out
+
+
+
+
+def import_journal_frame(df: pd.DataFrame) -> dict:
+    """
+    Import en masse (ex. journal.xlsx exporté) idempotent : empreinte par ligne + rang parmi les lignes identiques
+    du fichier, INSERT OR IGNORE sur l'index unique (content_hash, occurrence). Ré-importer le même fichier
+    n'ajoute rien. Colonnes hors date/repas/nom/quantite_g (et id) = nutriments. Renvoie le rapport.
+    Une ligne supprimée dans l'app laisse son empreinte (journal_hash_tombstones) : ré-importer un ancien export
+    ne la recrée pas, même si d'autres lignes identiques restent. Contrepartie : pour la récupérer, il faut la
+    ressaisir (un ajout manuel n'est pas filtré). Seuls les jours des lignes réellement insérées changent de version.
+    """
+    t0 = time.perf_counter()
+    conn = init_db()
+    nutr_cols = [c for c in df.columns if c not in JOURNAL_BASE_COLS and c != "id"]
+    dates = pd.to_datetime(df["date"]).dt.date.astype(str).tolist()
+    repas = df["repas"].astype(str).tolist(); noms = df["nom"].astype(str).tolist()
+    qty = pd.to_numeric(df["quantite_g"], errors="coerce").fillna(0.0).astype(float).tolist()
+    values = df[nutr_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float) if nutr_cols \
+        else np.zeros((len(df), 0))
+    schema = _sync_schema(conn, [str(c) for c in nutr_cols])
+    now, device = now_ms(), device_id(conn)
+    occurrences: dict[str, int] = {}
+    rows = []
+    for i in range(len(df)):
+        nutr = {str(c): float(v) for c, v in zip(nutr_cols, values[i]) if v == v}   # v == v : pas NaN
+        entry = schema.encode(nutr)
+        h = content_hash(dates[i], repas[i], noms[i], qty[i], _entry_dict(conn, entry))
+        occ = occurrences.get(h, 0); occurrences[h] = occ + 1
+        rows.append((dates[i], repas[i], noms[i], qty[i], entry.to_bytes(), entry.version,
+                     uuid.uuid4().hex, now, device, h, occ))
+    buried = _buried(conn, occurrences)
+    if buried: rows = [r for r in rows if (r[9], r[10]) not in buried]
+    try:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO journal (date,repas,nom,quantite_g,nutrients_json,nutrients_blob,"
+                         "schema_version,uid,updated_at,device,content_hash,occurrence) "
+                         "VALUES (?,?,?,?,'{}',?,?,?,?,?,?,?);", rows)
+        inserted = conn.total_changes - before
+        if inserted:
+            uids = [r[6] for r in rows]; touched: set[str] = set()
+            for k in range(0, len(uids), 500):
+                chunk = uids[k:k + 500]
+                for row_id, d in conn.execute(f"SELECT id, date FROM journal WHERE uid IN ({','.join('?' * len(chunk))}) "
+                                              "ORDER BY id;", chunk):
+                    _log_upsert(conn, row_id); touched.add(d)
+            _bump_journal_version(conn, touched)
+        conn.commit()
+    except Exception:
+        conn.rollback(); raise
+    return {"rows": len(df), "inserted": inserted, "skipped": len(df) - inserted, "tombstoned": len(df) - len(rows),
+            "duration_s": round(time.perf_counter() - t0, 3)}
+
+
+
+
+def delete_journal_row(row_id: int) -> bool:
+    conn = init_db()
+    r = conn.execute("SELECT uid, date FROM journal WHERE id=?;", (int(row_id),)).fetchone()
+    if r is None: return False
+    ts, device = now_ms(), device_id(conn)
+    _bury_hash(conn, "id=?", int(row_id))
+    conn.execute("DELETE FROM journal WHERE id=?", (int(row_id),))
+    conn.execute("INSERT OR REPLACE INTO journal_tombstones (uid, updated_at, device) VALUES (?,?,?);", (r[0], ts, device))
+    conn.execute("INSERT INTO journal_changes (uid, op, updated_at, payload) VALUES (?,?,?,?);",
+                 (r[0], "delete", ts, json.dumps({"device": device})))
+    _bump_journal_version(conn, [r[1]])
+    conn.commit()
+    return True
+
+
+
+
+JOURNAL_COLS = "id,date,repas,nom,quantite_g,nutrients_blob,schema_version,nutrients_json"
+CORE_NUTRIENTS = set(TARGET_NUTRIENTS.values())
+
+
+
+
+def _journal_frame(rows, empty_cols: list[str]) -> pd.DataFrame:
+    if not rows: return pd.DataFrame(columns=empty_cols)
+    entries = []
+    for r in rows:
+        blob, version, js = r[5], r[6], r[7]
+        if blob is not None: entries.append(NutrientEntry.from_bytes(blob, version))
+        else:
+            try: entries.append(encode_nutrients(json.loads(js) or {}))
+            except Exception: entries.append(NutrientEntry(np.zeros(0, dtype=np.float32), 0))
+    schema = nutrient_schema()
+    if max(e.version for e in entries) > schema.version:   # noms ajoutés par un autre process (API mobile)
+        schema = _sync_schema(init_db(), reload=True)
+    mat = schema.matrix(entries)
+    names = schema.names[:mat.shape[1]]
+    # colonnes utiles seulement : nutriments présents ce jour-là (+ les macros de base), sans réalignement par ligne
+    keep = [i for i, n in enumerate(names) if n in CORE_NUTRIENTS or mat[:, i].any()]
+    df = pd.DataFrame([r[:5] for r in rows], columns=["id","date","repas","nom","quantite_g"])
+    nutr_df = pd.DataFrame(mat[:, keep].astype(np.float64), columns=[names[i] for i in keep])
+    return pd.concat([df, nutr_df], axis=1)
+
+
+
+
+def fetch_journal_by_date(date_iso) -> pd.DataFrame:
+    conn = init_db()
+    cur = conn.execute(f"SELECT {JOURNAL_COLS} FROM journal WHERE date=? ORDER BY id ASC;", (date_iso,))
+    return _journal_frame(cur.fetchall(), ["id","date","repas","nom","quantite_g"])
+
+
+
+
+def fetch_journal_page(date_iso, after_id: int = 0, limit: int = 50) -> pd.DataFrame:
+    """Page d'un jour en keyset sur id (id > after_id) : coût borné par `limit`, quelle que soit la taille du jour."""
+    conn = init_db()
+    cur = conn.execute(f"SELECT {JOURNAL_COLS} FROM journal WHERE date=? AND id>? ORDER BY id ASC LIMIT ?;",
+                       (date_iso, int(after_id), int(limit)))
+    return _journal_frame(cur.fetchall(), ["id","date","repas","nom","quantite_g"])
+
+
+
+
+def count_journal_by_date(date_iso) -> int:
+    conn = _reader()
+    return int(conn.execute("SELECT COUNT(*) FROM journal WHERE date=?;", (date_iso,)).fetchone()[0])
+
+
+
+
+def journal_names_by_date(date_iso) -> list[str]:
+    """Aliments distincts saisis ce jour-là, dans l'ordre de saisie (sans décoder les nutriments)."""
+    conn = _reader()
+    return [r[0] for r in conn.execute("SELECT nom FROM journal WHERE date=? GROUP BY nom ORDER BY MIN(id);", (date_iso,))]
+
+
+
+
+def fetch_journal_between(date_from, date_to) -> pd.DataFrame:
+    """Lignes du journal entre deux dates ISO (bornes incluses)."""
+    conn = init_db()
+    cur = conn.execute(f"SELECT {JOURNAL_COLS} FROM journal WHERE date>=? AND date<=? ORDER BY date, id;",
+                       (date_from, date_to))
+    return _journal_frame(cur.fetchall(), ["id","date","repas","nom","quantite_g"])
+
+
+
+
+def fetch_last_date_with_rows() -> str | None:
+    conn = _reader()
+    cur = conn.execute("SELECT date, COUNT(*) c FROM journal GROUP BY date ORDER BY date DESC;")
+    r = cur.fetchone()
+    return r[0] if r else None
+
+
+
+
+def fetch_all_journal() -> pd.DataFrame:
+    conn = init_db()
+    cur = conn.execute(f"SELECT {JOURNAL_COLS} FROM journal ORDER BY date, id;")
+    return _journal_frame(cur.fetchall(), ["date","repas","nom","quantite_g"])
+
+
+
+
+def journal_day_signatures(date_from, date_to) -> dict[str, str]:
+    """
+    Empreinte légère par jour (nb de lignes, max/somme des id) : change à chaque ajout ou suppression,
+    car les id AUTOINCREMENT ne sont jamais réutilisés. Sert d'ETag sans relire les nutriments.
+    """
+    conn = _reader()
+    cur = conn.execute("SELECT date, COUNT(*), MAX(id), SUM(id) FROM journal WHERE date>=? AND date<=? GROUP BY date;",
+                       (date_from, date_to))
+    return {r[0]: f"{r[1]}-{r[2]}-{r[3]}" for r in cur.fetchall()}
+
+
+
+
+def daily_totals(date_from, date_to) -> pd.DataFrame:
+    """Nutriments sommés par jour entre deux dates ISO : une ligne par date avec des saisies (colonne "date")."""
+    df = fetch_journal_between(date_from, date_to)
+    if df.empty: return pd.DataFrame(columns=["date"])
+    return (df.drop(columns=["id", "repas", "nom", "quantite_g"]).groupby("date", sort=True)
+              .sum(numeric_only=True).reset_index())
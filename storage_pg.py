@@ -0,0 +1,334 @@
+# Totum — stockage du journal et du profil sur PostgreSQL (TOTUM_STORAGE=postgres, cf. journal_store.py)
+# Pour plusieurs nœuds derrière un load balancer : plus de fichier local à écrivain unique.
+# - pool de connexions par process (psycopg2 ThreadedConnectionPool, TOTUM_PG_POOL_MIN / TOTUM_PG_POOL_MAX) ;
+#   au-delà de POOL_MAX opérations simultanées, les suivantes attendent une connexion libre
+# - nutriments d'une ligne en jsonb {nom: valeur} : l'ordre du schéma float32 (nutrients.py) est propre à chaque nœud
+# - écritures par lots : insert_journal_batch / import_journal_frame en INSERT ... VALUES multiples (execute_values)
+# - daily_totals agrégé par le serveur (jsonb_each_text + SUM ... GROUP BY jour, nutriment) : seuls les totaux transitent
+# - mêmes garanties que storage.py : empreinte de contenu + rang (import idempotent, lignes supprimées non recréées),
+#   versions du journal (globale et par jour) incrémentées dans la transaction de l'écriture
+# Tables créées au premier démarrage (sous verrou consultatif : plusieurs nœuds peuvent démarrer ensemble), dans le
+# schéma TOTUM_PG_SCHEMA s'il est défini (search_path), sinon dans celui de la connexion.
+# Vérifier contre une base locale : TOTUM_PG_DSN=postgresql://localhost/totum python storage_pg.py selftest
+
+
+
+
+from __future__ import annotations
+import os, re, sys, time, uuid, threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import psycopg2
+    from psycopg2 import errors as pg_errors
+    from psycopg2.extras import Json, execute_values
+    from psycopg2.extensions import parse_dsn
+    from psycopg2.pool import ThreadedConnectionPool
+except ImportError:  # psycopg2 optionnel : requis seulement pour TOTUM_STORAGE=postgres
+    psycopg2 = None
+
+from nutrients import NutrientEntry
+from storage import content_hash, nutrient_schema, now_ms, CORE_NUTRIENTS, JOURNAL_BASE_COLS
+
+
+
+
+PG_SCHEMA = os.getenv("TOTUM_PG_SCHEMA", "").strip()
+POOL_MIN = int(os.getenv("TOTUM_PG_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("TOTUM_PG_POOL_MAX", "8"))
+PAGE_SIZE = 500       # lignes par INSERT multi-VALUES
+WRITE_RETRIES = 3     # deux nœuds qui écrivent la même ligne au même instant : le rang est recalculé, on réessaie
+
+DDL = """
+CREATE TABLE IF NOT EXISTS profile (
+    id INTEGER PRIMARY KEY CHECK (id=1),
+    sexe TEXT, age INTEGER, taille_cm DOUBLE PRECISION, poids_kg DOUBLE PRECISION,
+    activite TEXT, prot_pct INTEGER, gluc_pct INTEGER, lip_pct INTEGER
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id BIGSERIAL PRIMARY KEY,
+    date TEXT NOT NULL,
+    repas TEXT NOT NULL,
+    nom TEXT NOT NULL,
+    quantite_g DOUBLE PRECISION NOT NULL,
+    nutrients JSONB NOT NULL DEFAULT '{}'::jsonb,
+    uid TEXT NOT NULL UNIQUE,
+    updated_at BIGINT NOT NULL,
+    content_hash TEXT NOT NULL,
+    occurrence INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (content_hash, occurrence)
+);
+CREATE INDEX IF NOT EXISTS idx_journal_date_id ON journal (date, id);
+CREATE TABLE IF NOT EXISTS journal_hash_tombstones (
+    content_hash TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    PRIMARY KEY (content_hash, occurrence)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BIGINT NOT NULL DEFAULT 0);
+INSERT INTO meta (key, value) VALUES ('journal_version', 0) ON CONFLICT (key) DO NOTHING;
+"""
+
+JOURNAL_SELECT = "SELECT id, date, repas, nom, quantite_g, nutrients FROM journal"
+INSERT_JOURNAL = ("INSERT INTO journal (date,repas,nom,quantite_g,nutrients,uid,updated_at,content_hash,occurrence) "
+                  "VALUES %s")
+
+
+
+
+def _nutrient_dict(nutrients) -> dict[str, float]:
+    """{nom: valeur} non nuls, en précision float32 comme storage.py (mêmes empreintes d'un stockage à l'autre)."""
+    if isinstance(nutrients, NutrientEntry): return nutrients.to_dict(nutrient_schema())
+    return {str(k): float(np.float32(v)) for k, v in (nutrients or {}).items() if v == v and v}
+
+
+
+
+def _journal_frame(rows, empty_cols: list[str]) -> pd.DataFrame:
+    # même forme que storage._journal_frame : colonnes de base + nutriments présents (et macros de base)
+    if not rows: return pd.DataFrame(columns=empty_cols)
+    df = pd.DataFrame([r[:5] for r in rows], columns=["id", "date", "repas", "nom", "quantite_g"])
+    nutr = pd.DataFrame.from_records([r[5] or {} for r in rows], index=df.index).astype(np.float64).fillna(0.0)
+    keep = [c for c in nutr.columns if c in CORE_NUTRIENTS or nutr[c].any()]
+    return pd.concat([df, nutr[keep]], axis=1)
+
+
+
+
+def _bump_journal_version(cur, dates=()):
+    keys = ["journal_version"] + [f"journal_version:{d}" for d in sorted(set(map(str, dates)))]
+    execute_values(cur, "INSERT INTO meta (key, value) VALUES %s ON CONFLICT (key) DO UPDATE SET value = meta.value + 1;",
+                   [(k, 1) for k in keys])
+
+
+
+
+def _insert_rows(cur, rows) -> list[int]:
+    """rows : (date, repas, nom, quantite_g, nutriments) ; le rang d'une empreinte suit ceux déjà en base."""
+    prepared = []
+    for d, repas, nom, q, nutrients in rows:
+        nd = _nutrient_dict(nutrients)
+        prepared.append((str(d), str(repas), str(nom), float(q), nd, content_hash(d, repas, nom, q, nd)))
+    cur.execute("SELECT content_hash, MAX(occurrence) FROM journal WHERE content_hash = ANY(%s) GROUP BY content_hash;",
+                (sorted({p[5] for p in prepared}),))
+    nxt = {h: int(m) + 1 for h, m in cur.fetchall()}
+    now = now_ms(); values = []
+    for d, repas, nom, q, nd, h in prepared:
+        occ = nxt.get(h, 0); nxt[h] = occ + 1
+        values.append((d, repas, nom, q, Json(nd), uuid.uuid4().hex, now, h, occ))
+    ids = execute_values(cur, INSERT_JOURNAL + " RETURNING id;", values, page_size=PAGE_SIZE, fetch=True)
+    return [int(r[0]) for r in ids]
+
+
+
+
+class PostgresStore:
+    """Même interface que journal_store.SQLiteStore ; sûr entre threads (une connexion du pool par opération)."""
+    name = "postgres"
+
+    def __init__(self, dsn: str, minconn: int = POOL_MIN, maxconn: int = POOL_MAX, schema: str = PG_SCHEMA):
+        if psycopg2 is None:
+            raise RuntimeError("TOTUM_STORAGE=postgres requiert psycopg2 (pip install psycopg2-binary)")
+        if not dsn: raise ValueError("TOTUM_PG_DSN manquant")
+        if schema and not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", schema):
+            raise ValueError(f"TOTUM_PG_SCHEMA invalide : {schema!r}")
+        self.dsn = dsn
+        self.schema = schema
+        self.pool = ThreadedConnectionPool(minconn, maxconn, dsn, **({"options": f"-c search_path={schema}"} if schema else {}))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        with self._cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('totum_schema'));")
+            if schema: cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema};")
+            cur.execute(DDL)
+
+    @contextmanager
+    def _cursor(self):
+        """Curseur dans une transaction : commit en sortie, rollback sur erreur ; la connexion retourne au pool."""
+        with self._slots:
+            conn = self.pool.getconn()
+            try:
+                with conn, conn.cursor() as cur:
+                    yield cur
+            finally:
+                self.pool.putconn(conn, close=bool(conn.closed))
+
+    def _write(self, fn):
+        for attempt in range(WRITE_RETRIES):
+            try:
+                with self._cursor() as cur: return fn(cur)
+            except pg_errors.UniqueViolation:
+                if attempt == WRITE_RETRIES - 1: raise
+
+    def _read(self, sql: str, params=()):
+        with self._cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def close(self):
+        self.pool.closeall()
+
+    def describe(self) -> str:
+        p = parse_dsn(self.dsn)
+        return f"PostgreSQL ({p.get('host', 'localhost')}/{p.get('dbname', '')}{'.' + self.schema if self.schema else ''})"
+
+    # ---------- profil ----------
+    def load_profile(self):
+        rows = self._read("SELECT sexe,age,taille_cm,poids_kg,activite,prot_pct,gluc_pct,lip_pct FROM profile WHERE id=1;")
+        if rows:
+            r = rows[0]
+            return {"sexe":r[0],"age":r[1],"taille_cm":r[2],"poids_kg":r[3],
+                    "activite":r[4],"repartition_macros":(r[5],r[6],r[7])}
+        return {"sexe":"Homme","age":40,"taille_cm":181.0,"poids_kg":72.0,"activite":"Sédentaire","repartition_macros":(30,55,15)}
+
+    def save_profile(self, p):
+        with self._cursor() as cur:
+            cur.execute("""
+                INSERT INTO profile (id,sexe,age,taille_cm,poids_kg,activite,prot_pct,gluc_pct,lip_pct)
+                VALUES (1,%s,%s,%s,%s,%s,%s,%s,%s)
+                ON CONFLICT (id) DO UPDATE SET
+                    sexe=excluded.sexe, age=excluded.age, taille_cm=excluded.taille_cm, poids_kg=excluded.poids_kg,
+                    activite=excluded.activite, prot_pct=excluded.prot_pct, gluc_pct=excluded.gluc_pct, lip_pct=excluded.lip_pct;
+            """, (p["sexe"], int(p["age"]), float(p["taille_cm"]), float(p["poids_kg"]), p["activite"], 30, 55, 15))
+
+    # ---------- écritures ----------
+    def insert_journal(self, date_iso, repas, nom, quantite_g, nutrients) -> int:
+        return self.insert_journal_batch([(date_iso, repas, nom, quantite_g, nutrients)])[0]
+
+    def insert_journal_batch(self, rows) -> list[int]:
+        """Plusieurs lignes (date, repas, nom, quantite_g, nutriments) en une transaction : tout ou rien."""
+        rows = list(rows)
+        if not rows: return []
+        def write(cur):
+            ids = _insert_rows(cur, rows)
+            _bump_journal_version(cur, [r[0] for r in rows])
+            return ids
+        return self._write(write)
+
+    def import_journal_frame(self, df: pd.DataFrame) -> dict:
+        """Comme storage.import_journal_frame : ON CONFLICT (content_hash, occurrence) DO NOTHING, par lots."""
+        t0 = time.perf_counter()
+        nutr_cols = [c for c in df.columns if c not in JOURNAL_BASE_COLS and c != "id"]
+        dates = pd.to_datetime(df["date"]).dt.date.astype(str).tolist()
+        repas = df["repas"].astype(str).tolist(); noms = df["nom"].astype(str).tolist()
+        qty = pd.to_numeric(df["quantite_g"], errors="coerce").fillna(0.0).astype(float).tolist()
+        values = df[nutr_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float) if nutr_cols \
+            else np.zeros((len(df), 0))
+        now = now_ms(); occurrences: dict[str, int] = {}; rows = []
+        for i in range(len(df)):
+            nd = _nutrient_dict(dict(zip(map(str, nutr_cols), values[i])))
+            h = content_hash(dates[i], repas[i], noms[i], qty[i], nd)
+            occ = occurrences.get(h, 0); occurrences[h] = occ + 1
+            rows.append((dates[i], repas[i], noms[i], qty[i], Json(nd), uuid.uuid4().hex, now, h, occ))
+        def write(cur):
+            cur.execute("SELECT content_hash, occurrence FROM journal_hash_tombstones WHERE content_hash = ANY(%s);",
+                        (list(occurrences),))
+            buried = set(cur.fetchall())
+            live = [r for r in rows if (r[7], r[8]) not in buried]
+            if not live: return 0, 0
+            ids = execute_values(cur, INSERT_JOURNAL + " ON CONFLICT (content_hash, occurrence) DO NOTHING "
+                                 "RETURNING id, date;", live, page_size=PAGE_SIZE, fetch=True)
+            if ids: _bump_journal_version(cur, {d for _, d in ids})
+            return len(ids), len(rows) - len(live)
+        inserted, dead = self._write(write) if rows else (0, 0)
+        return {"rows": len(rows), "inserted": inserted, "skipped": len(rows) - inserted, "tombstoned": dead,
+                "duration_s": round(time.perf_counter() - t0, 3)}
+
+    def delete_journal_row(self, row_id: int) -> bool:
+        with self._cursor() as cur:
+            cur.execute("DELETE FROM journal WHERE id=%s RETURNING date, content_hash, occurrence;", (int(row_id),))
+            r = cur.fetchone()
+            if r is None: return False
+            cur.execute("INSERT INTO journal_hash_tombstones (content_hash, occurrence) VALUES (%s,%s) "
+                        "ON CONFLICT DO NOTHING;", (r[1], r[2]))
+            _bump_journal_version(cur, [r[0]])
+        return True
+
+    # ---------- lectures ----------
+    def fetch_journal_by_date(self, date_iso) -> pd.DataFrame:
+        rows = self._read(f"{JOURNAL_SELECT} WHERE date=%s ORDER BY id;", (date_iso,))
+        return _journal_frame(rows, ["id","date","repas","nom","quantite_g"])
+
+    def fetch_journal_page(self, date_iso, after_id: int = 0, limit: int = 50) -> pd.DataFrame:
+        rows = self._read(f"{JOURNAL_SELECT} WHERE date=%s AND id>%s ORDER BY id LIMIT %s;",
+                          (date_iso, int(after_id), int(limit)))
+        return _journal_frame(rows, ["id","date","repas","nom","quantite_g"])
+
+    def count_journal_by_date(self, date_iso) -> int:
+        return int(self._read("SELECT COUNT(*) FROM journal WHERE date=%s;", (date_iso,))[0][0])
+
+    def journal_names_by_date(self, date_iso) -> list[str]:
+        return [r[0] for r in self._read("SELECT nom FROM journal WHERE date=%s GROUP BY nom ORDER BY MIN(id);",
+                                         (date_iso,))]
+
+    def fetch_journal_between(self, date_from, date_to) -> pd.DataFrame:
+        rows = self._read(f"{JOURNAL_SELECT} WHERE date>=%s AND date<=%s ORDER BY date, id;", (date_from, date_to))
+        return _journal_frame(rows, ["id","date","repas","nom","quantite_g"])
+
+    def fetch_last_date_with_rows(self) -> str | None:
+        return self._read("SELECT MAX(date) FROM journal;")[0][0]
+
+    def fetch_all_journal(self) -> pd.DataFrame:
+        return _journal_frame(self._read(f"{JOURNAL_SELECT} ORDER BY date, id;"), ["date","repas","nom","quantite_g"])
+
+    def daily_totals(self, date_from, date_to) -> pd.DataFrame:
+        """Sommes par jour et par nutriment calculées par le serveur ; même forme que storage.daily_totals."""
+        rows = self._read("SELECT j.date, e.key, SUM(e.value::double precision) "
+                          "FROM journal j CROSS JOIN LATERAL jsonb_each_text(j.nutrients) AS e(key, value) "
+                          "WHERE j.date>=%s AND j.date<=%s GROUP BY j.date, e.key;", (date_from, date_to))
+        days = self._read("SELECT DISTINCT date FROM journal WHERE date>=%s AND date<=%s ORDER BY date;",
+                          (date_from, date_to))
+        if not days: return pd.DataFrame(columns=["date"])
+        long = pd.DataFrame(rows, columns=["date", "nutriment", "valeur"])
+        wide = long.pivot(index="date", columns="nutriment", values="valeur").rename_axis(columns=None)
+        return wide.reindex([d for d, in days]).fillna(0.0).rename_axis("date").reset_index()
+
+    def journal_version(self, date_iso: str | None = None) -> int:
+        key = "journal_version" if date_iso is None else f"journal_version:{date_iso}"
+        rows = self._read("SELECT value FROM meta WHERE key=%s;", (key,))
+        return int(rows[0][0]) if rows else 0
+
+    def journal_day_signatures(self, date_from, date_to) -> dict[str, str]:
+        """Même empreinte que storage.journal_day_signatures (les id BIGSERIAL ne sont jamais réutilisés)."""
+        rows = self._read("SELECT date, COUNT(*), MAX(id), SUM(id) FROM journal WHERE date>=%s AND date<=%s GROUP BY date;",
+                          (date_from, date_to))
+        return {r[0]: f"{r[1]}-{r[2]}-{r[3]}" for r in rows}
+
+
+
+
+# ============ Vérification contre une base réelle ============
+def selftest(dsn: str) -> None:
+    """Aller-retour complet dans un schéma jetable (supprimé à la fin) ; lève AssertionError au premier écart."""
+    schema = f"totum_selftest_{os.getpid()}"
+    store = PostgresStore(dsn, schema=schema)
+    try:
+        d = "2024-01-02"
+        store.insert_journal(d, "Déjeuner", "Pomme", 150, {"Énergie_kcal": 78.0, "Glucides_g": 18.5})
+        ids = store.insert_journal_batch([(d, "Dîner", "Riz", 200, {"Énergie_kcal": 260.0})] * 2)
+        assert store.count_journal_by_date(d) == 3 and store.journal_version(d) == 2, "insertions"
+        assert store.journal_names_by_date(d) == ["Pomme", "Riz"], "noms du jour"
+        day = store.fetch_journal_by_date(d)
+        tot = store.daily_totals(d, d)
+        assert abs(float(tot["Énergie_kcal"].iloc[0]) - float(day["Énergie_kcal"].sum())) < 1e-6, "agrégat serveur"
+        rep = store.import_journal_frame(day.drop(columns=["id"]))
+        assert rep["inserted"] == 0 and rep["skipped"] == 3, f"ré-import non idempotent : {rep}"
+        assert store.delete_journal_row(ids[0]) and store.count_journal_by_date(d) == 2, "suppression"
+        assert store.fetch_journal_page(d, after_id=0, limit=1).shape[0] == 1, "pagination"
+        assert store.fetch_last_date_with_rows() == d and d in store.journal_day_signatures(d, d), "signatures"
+        p = {"sexe": "Femme", "age": 35, "taille_cm": 165.0, "poids_kg": 60.0, "activite": "Actif"}
+        store.save_profile(p)
+        assert store.load_profile()["sexe"] == "Femme", "profil"
+    finally:
+        with store._cursor() as cur: cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+        store.close()
+
+
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["selftest"]:
+        selftest(os.getenv("TOTUM_PG_DSN", "") or (sys.argv[2] if len(sys.argv) > 2 else ""))
+        print("PostgresStore : OK")
+    else:
+        print("usage : python storage_pg.py selftest [dsn]   (ou TOTUM_PG_DSN)")
@@ -0,0 +1,113 @@
+# Totum — index de substitution : aliments proches en nutriments, mais plus légers sur un point donné
+# Les valeurs /100 g du catalogue (CatalogSnapshot.matrix) sont mises à l'échelle par nutriment (95e centile des
+# valeurs non nulles, pour que les kcal n'écrasent pas les µg) puis normalisées : la similarité est un cosinus.
+# Le top-k est calculé par blocs de lignes (produit bloc x requêtes, fusion des meilleurs par argpartition) :
+# mémoire bornée quelle que soit la taille du catalogue. Les contraintes ("moins d'AG saturés, protéines
+# proches") sont des masques vectoriels appliqués avant le classement.
+
+
+
+
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+
+from totum_core import canon_key
+
+
+
+
+BLOCK_ROWS = 16_384
+SIMILAR_TOL = 0.25     # "proche" = à ±25 % de la valeur de l'aliment d'origine
+LOWER_MARGIN = 0.10    # "moins" = au moins 10 % de moins
+
+# nutriments à surveiller -> contraintes par défaut de l'échange proposé
+SWAP_RULES = {
+    "AG_saturés_g": {"AG_saturés_g": "lower", "Protéines_g": "similar"},
+    "Sucres_g":     {"Sucres_g": "lower", "Fibres_g": "not_lower"},
+    "Sel_g":        {"Sel_g": "lower", "Protéines_g": "similar"},
+}
+
+
+
+
+class SubstitutionIndex:
+    """Vecteurs unitaires float32 (aliments x nutriments), construits une fois par version du catalogue."""
+
+    def __init__(self, names, nutrient_names, matrix: np.ndarray):
+        self.names = np.asarray(list(names), dtype=object)
+        self.nutrient_names = tuple(nutrient_names)
+        self.col_of = {canon_key(n): j for j, n in reversed(list(enumerate(self.nutrient_names)))}
+        self.values = np.asarray(matrix, dtype=np.float32)
+        row_of: dict[str, int] = {}
+        for i, n in enumerate(self.names): row_of.setdefault(str(n), i)
+        self.row_of = row_of
+        x = np.maximum(self.values, 0.0)
+        scale = np.ones(x.shape[1], dtype=np.float32)
+        for j in range(x.shape[1]):
+            nz = x[:, j][x[:, j] > 0]
+            if len(nz): scale[j] = max(float(np.percentile(nz, 95)), 1e-6)
+        u = x / scale
+        norms = np.linalg.norm(u, axis=1, keepdims=True)
+        self.unit = np.where(norms > 0, u / np.where(norms > 0, norms, 1.0), 0.0).astype(np.float32)
+        self.valid = norms[:, 0] > 0
+
+    def column(self, nutrient: str) -> int | None:
+        return self.col_of.get(canon_key(nutrient))
+
+    def constraint_mask(self, row: int, constraints: dict | None) -> np.ndarray:
+        """Masque des candidats qui respectent les contraintes {nutriment: lower | not_lower | similar}."""
+        mask = self.valid.copy(); mask[row] = False
+        for nutrient, rule in (constraints or {}).items():
+            j = self.column(nutrient)
+            if j is None: continue
+            col, ref = self.values[:, j], float(self.values[row, j])
+            if rule == "lower": mask &= col <= ref * (1.0 - LOWER_MARGIN)
+            elif rule == "not_lower": mask &= col >= ref * (1.0 - LOWER_MARGIN)
+            elif rule == "similar": mask &= np.abs(col - ref) <= SIMILAR_TOL * max(ref, 1e-6)
+            else: raise ValueError(f"Contrainte inconnue : {rule!r}")
+        return mask
+
+    def top_k(self, queries: np.ndarray, k: int, mask: np.ndarray | None = None,
+              block: int = BLOCK_ROWS) -> tuple[np.ndarray, np.ndarray]:
+        """(indices, similarités) des k plus proches de chaque requête, (q, k), par blocs de `block` lignes."""
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_i = np.full((len(q), 0), -1, dtype=np.int64); best_s = np.empty((len(q), 0), dtype=np.float32)
+        for start in range(0, len(self.unit), block):
+            sims = q @ self.unit[start:start + block].T
+            if mask is not None: sims[:, ~mask[start:start + block]] = -np.inf
+            idx = np.broadcast_to(np.arange(start, start + sims.shape[1]), sims.shape)
+            cand_s = np.concatenate([best_s, sims], axis=1); cand_i = np.concatenate([best_i, idx], axis=1)
+            kk = min(k, cand_s.shape[1])
+            part = np.argpartition(-cand_s, kk - 1, axis=1)[:, :kk]
+            best_s = np.take_along_axis(cand_s, part, axis=1); best_i = np.take_along_axis(cand_i, part, axis=1)
+        order = np.argsort(-best_s, axis=1)
+        return np.take_along_axis(best_i, order, axis=1), np.take_along_axis(best_s, order, axis=1)
+
+    def substitutes(self, name: str, k: int = 5, constraints: dict | None = None) -> pd.DataFrame:
+        """Aliments les plus proches de `name` qui respectent les contraintes, avec l'écart sur chaque nutriment contraint."""
+        row = self.row_of.get(str(name))
+        cols = ["Aliment", "Similarité"] + [f"Δ {n}" for n in (constraints or {})]
+        if row is None or not self.valid[row]: return pd.DataFrame(columns=cols)
+        idx, sims = self.top_k(self.unit[row], k, self.constraint_mask(row, constraints))
+        keep = np.isfinite(sims[0]); idx, sims = idx[0][keep], sims[0][keep]
+        out = {"Aliment": self.names[idx], "Similarité": np.round(sims.astype(float), 3)}
+        for n in (constraints or {}):
+            j = self.column(n)
+            out[f"Δ {n}"] = (np.round(self.values[idx, j] - self.values[row, j], 2) if j is not None
+                             else np.full(len(idx), np.nan))
+        return pd.DataFrame(out, columns=cols)
+
+    def healthier_swaps(self, name: str, k: int = 3) -> tuple[str | None, pd.DataFrame]:
+        """Nutriment à surveiller le plus présent (par rapport au catalogue) et les échanges qui le réduisent."""
+        row = self.row_of.get(str(name))
+        if row is None: return None, pd.DataFrame()
+        # position de l'aliment dans la distribution du catalogue : on vise le point le plus "haut"
+        ranks = {}
+        for n in SWAP_RULES:
+            j = self.column(n)
+            if j is not None and self.values[row, j] > 0:
+                ranks[n] = float((self.values[:, j] < self.values[row, j]).mean())
+        if not ranks: return None, pd.DataFrame()
+        worst = max(ranks, key=ranks.get)
+        return worst, self.substitutes(name, k, SWAP_RULES[worst])
@@ -0,0 +1,360 @@
+# Totum — synchronisation hors-ligne d'abord du journal
+# Toutes les lectures / écritures restent locales (totum.db). Chaque ajout / suppression est ajouté à
+# journal_changes (append-only, cf. storage.py) ; ce module pousse ces changements vers un magasin distant
+# par lots, puis tire les changements des autres appareils et les applique en last-writer-wins
+# (updated_at, device), les suppressions voyageant sous forme de tombstones.
+#
+# Deux magasins distants, choisis par TOTUM_SYNC_KIND :
+#   supabase  table journal_changes de auth_api/supabase_schema.sql, via l'API REST de Supabase (PostgREST) :
+#             TOTUM_SYNC_URL = URL du projet, TOTUM_SYNC_APIKEY (ou SUPABASE_KEY) = clé anon,
+#             TOTUM_SYNC_TOKEN = access_token de l'utilisateur connecté (JWT), TOTUM_SYNC_REFRESH_TOKEN pour
+#             le renouveler. user_id = claim "sub" du JWT (uuid d'auth.users), la RLS limite chacun à ses lignes.
+#             TOTUM_SYNC_OVERLAP_S : fenêtre relue à chaque pull (commits tardifs, cf. SupabaseSyncEngine.pull)
+#   changes   (défaut) protocole REST ci-dessous, gzip dans les deux sens. Seul MockSyncServer l'implémente
+#             (tests / développement) : aucun service de production ne l'expose.
+#     POST {url}/changes                       corps gzip {"user_id", "changes": [...]} -> {"accepted", "cursor"}
+#     GET  {url}/changes?user_id=&since=&limit= -> {"changes": [... + "seq"], "cursor", "more"}
+#
+# Variables : TOTUM_SYNC_KIND, TOTUM_SYNC_URL, TOTUM_SYNC_TOKEN (Bearer), TOTUM_SYNC_USER (protocole changes),
+#             TOTUM_SYNC_INTERVAL_S (60 par défaut)
+# Lancer un serveur factice : python sync.py mock [port]   |   une synchro : python sync.py once
+
+
+
+
+from __future__ import annotations
+import os, sys, gzip, json, time, base64, threading
+import datetime as dt
+import urllib.request, urllib.parse, urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from storage import pending_changes, apply_remote_changes, sync_state_get, sync_state_set
+
+
+
+
+SYNC_KIND = os.getenv("TOTUM_SYNC_KIND", "changes").strip().lower()   # "changes" | "supabase"
+SYNC_URL = os.getenv("TOTUM_SYNC_URL")
+SYNC_TOKEN = os.getenv("TOTUM_SYNC_TOKEN")
+SYNC_USER = os.getenv("TOTUM_SYNC_USER", "local")
+SYNC_API_KEY = os.getenv("TOTUM_SYNC_APIKEY") or os.getenv("SUPABASE_KEY")
+SYNC_REFRESH_TOKEN = os.getenv("TOTUM_SYNC_REFRESH_TOKEN")
+SYNC_OVERLAP_S = float(os.getenv("TOTUM_SYNC_OVERLAP_S", "300"))   # fenêtre relue à chaque pull (supabase)
+SYNC_INTERVAL_S = float(os.getenv("TOTUM_SYNC_INTERVAL_S", "60"))
+BATCH_SIZE = 500
+
+
+
+
+def _gzip_json(obj) -> bytes:
+    return gzip.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), compresslevel=6)
+
+
+
+
+def _read_json(body: bytes, encoding: str | None):
+    if encoding == "gzip": body = gzip.decompress(body)
+    return json.loads(body.decode("utf-8") or "null")
+
+
+
+
+def jwt_subject(token: str) -> str:
+    """Claim "sub" d'un JWT (uuid de l'utilisateur Supabase), sans vérifier la signature : c'est le serveur qui le fait."""
+    try:
+        part = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(part + "=" * (-len(part) % 4)))
+        return str(claims["sub"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        raise ValueError("Jeton de synchro invalide : JWT Supabase attendu (claim sub)") from None
+
+
+
+
+class SyncEngine:
+    """
+    push() : changements locaux depuis le dernier seq poussé, par lots de `batch_size`
+    pull() : changements distants depuis le dernier curseur serveur, appliqués en LWW
+    Les curseurs (push_seq, pull_cursor) vivent dans sync_state : une synchro interrompue reprend où elle s'est arrêtée.
+    Transport : protocole "changes" (MockSyncServer) ; SupabaseSyncEngine redéfinit _send_changes et pull.
+    """
+    state_prefix = ""          # curseurs propres à chaque magasin distant
+    gzip_requests = True
+
+    def __init__(self, url: str, token: str | None = None, user_id: str = SYNC_USER,
+                 batch_size: int = BATCH_SIZE, timeout: float = 10.0):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.last_error: Exception | None = None
+        self.last_sync: dict | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _headers(self) -> dict:
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+        if self.token: headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def _request(self, method: str, path: str, payload=None, params: dict | None = None, headers: dict | None = None):
+        url = f"{self.url}{path}" + (f"?{urllib.parse.urlencode(params)}" if params else "")
+        headers = {**self._headers(), **(headers or {})}
+        data = None
+        if payload is not None:
+            if self.gzip_requests:
+                data = _gzip_json(payload); headers["Content-Encoding"] = "gzip"
+            else:
+                data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(url, data=data, method=method, headers=headers)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return _read_json(resp.read(), resp.headers.get("Content-Encoding"))
+
+    def _send_changes(self, changes: list[dict]):
+        self._request("POST", "/changes", {"user_id": self.user_id, "changes": changes})
+
+    def _fetch_changes(self, cursor: int) -> tuple[list[dict], int, bool]:
+        """(changements, nouveau curseur, reste-t-il des pages)"""
+        res = self._request("GET", "/changes", params={"user_id": self.user_id, "since": cursor, "limit": self.batch_size})
+        return res.get("changes") or [], int(res.get("cursor", cursor)), bool(res.get("more"))
+
+    def push(self) -> int:
+        sent = 0; key = f"{self.state_prefix}push_seq"
+        after = int(sync_state_get(key, 0))
+        while True:
+            batch = pending_changes(after, self.batch_size)
+            if not batch: return sent
+            self._send_changes([{k: v for k, v in c.items() if k != "seq"} for c in batch])
+            after = batch[-1]["seq"]; sent += len(batch)
+            sync_state_set(key, after)
+
+    def pull(self) -> int:
+        applied = 0; key = f"{self.state_prefix}pull_cursor"
+        cursor = int(sync_state_get(key, 0))
+        while True:
+            changes, cursor, more = self._fetch_changes(cursor)
+            applied += apply_remote_changes(changes)
+            sync_state_set(key, cursor)
+            if not more: return applied
+
+    def sync(self) -> dict:
+        """Push puis pull ; en cas d'erreur réseau on garde l'erreur et on retentera au prochain tour."""
+        with self._lock:
+            t0 = time.perf_counter()
+            try:
+                pushed = self.push(); pulled = self.pull()
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                self.last_error = e; return {"ok": False, "error": str(e)}
+            self.last_error = None
+            self.last_sync = {"ok": True, "pushed": pushed, "applied": pulled,
+                              "duration_s": round(time.perf_counter() - t0, 3), "at": time.time()}
+            return self.last_sync
+
+    def _loop(self, interval: float):
+        while True:
+            self.sync()
+            if self._stop.wait(interval): return
+
+    def start(self, interval: float = SYNC_INTERVAL_S) -> "SyncEngine":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, args=(interval,), name="totum-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+
+
+class SupabaseSyncEngine(SyncEngine):
+    """
+    Magasin distant = table journal_changes de Supabase, lue et écrite par PostgREST (/rest/v1) avec le JWT de
+    l'utilisateur : user_id est son uuid (claim sub) et la RLS (auth.uid() = user_id) fait le reste.
+    Le curseur de pull est le dernier seq reçu, doublé d'une fenêtre de relecture (cf. pull). Un 401 (jeton expiré)
+    déclenche un renouvellement par le refresh token, conservé dans sync_state car Supabase le fait tourner à chaque usage.
+    """
+    state_prefix = "supabase_"
+    gzip_requests = False      # PostgREST ne décode pas les corps compressés ; les réponses restent gzip
+    COLUMNS = "seq,uid,op,updated_at,device,date,repas,nom,quantite_g,nutrients,received_at"
+
+    def __init__(self, url: str, api_key: str, access_token: str | None = None, refresh_token: str | None = None,
+                 batch_size: int = BATCH_SIZE, timeout: float = 10.0, overlap_s: float = SYNC_OVERLAP_S):
+        if not api_key: raise ValueError("Clé anon Supabase manquante (TOTUM_SYNC_APIKEY ou SUPABASE_KEY)")
+        if not (access_token or refresh_token): raise ValueError("Jeton utilisateur Supabase manquant (TOTUM_SYNC_TOKEN)")
+        super().__init__(url, access_token, user_id="", batch_size=batch_size, timeout=timeout)
+        self.api_key = api_key; self.overlap_s = overlap_s
+        self.refresh_token = sync_state_get("supabase_refresh_token") or refresh_token
+
+    def _headers(self) -> dict:
+        return {**super()._headers(), "apikey": self.api_key}
+
+    def _refresh(self):
+        if not self.refresh_token: raise ValueError("Jeton Supabase expiré et pas de refresh token (TOTUM_SYNC_REFRESH_TOKEN)")
+        self.token = None
+        res = super()._request("POST", "/auth/v1/token", {"refresh_token": self.refresh_token},
+                               params={"grant_type": "refresh_token"}, headers={"Authorization": f"Bearer {self.api_key}"})
+        self.token = res["access_token"]; self.refresh_token = res.get("refresh_token") or self.refresh_token
+        sync_state_set("supabase_refresh_token", self.refresh_token)
+
+    def _session(self):
+        if not self.token: self._refresh()
+        if not self.user_id: self.user_id = jwt_subject(self.token)
+
+    def _request(self, method: str, path: str, payload=None, params: dict | None = None, headers: dict | None = None):
+        self._session()
+        try:
+            return super()._request(method, path, payload, params, headers)
+        except urllib.error.HTTPError as e:
+            if e.code != 401 or not self.refresh_token: raise
+        self._refresh()
+        return super()._request(method, path, payload, params, headers)
+
+    def _send_changes(self, changes: list[dict]):
+        self._session()
+        rows = [{"user_id": self.user_id, "uid": c["uid"], "op": c["op"], "updated_at": c["updated_at"],
+                 "device": c.get("device") or "", "date": c.get("date"), "repas": c.get("repas"), "nom": c.get("nom"),
+                 "quantite_g": c.get("quantite_g"), "nutrients": c.get("nutrients")} for c in changes]
+        self._request("POST", "/rest/v1/journal_changes", rows, headers={"Prefer": "return=minimal"})
+
+    def _page(self, **filters) -> list[dict]:
+        self._session()
+        return self._request("GET", "/rest/v1/journal_changes",
+                             params={"select": self.COLUMNS, "user_id": f"eq.{self.user_id}", **filters,
+                                     "order": "seq.asc", "limit": self.batch_size}) or []
+
+    def pull(self) -> int:
+        """
+        seq (bigserial) est attribué avant le commit : une transaction de seq plus petit peut devenir visible après
+        qu'un seq plus grand a été lu. Chaque pull relit donc d'abord, sous le curseur, les lignes reçues dans les
+        overlap_s secondes précédant la plus récente déjà vue (received_at, horloge du serveur), puis les nouvelles.
+        Les doublons sont absorbés par apply_remote_changes (last-writer-wins par uid). Limite : une insertion restée
+        plus de overlap_s secondes sans commit serait encore manquée.
+        """
+        ckey, tkey = f"{self.state_prefix}pull_cursor", f"{self.state_prefix}pull_received_at"
+        cursor = int(sync_state_get(ckey, 0)); seen = sync_state_get(tkey)
+        applied = 0; latest = dt.datetime.fromisoformat(seen) if seen else None
+
+        def take(rows: list[dict]):
+            nonlocal applied, latest
+            applied += apply_remote_changes(rows)
+            for r in rows:
+                t = dt.datetime.fromisoformat(r["received_at"]) if r.get("received_at") else None
+                if t is not None and (latest is None or t > latest): latest = t
+
+        if latest is not None and cursor:
+            since, after = (latest - dt.timedelta(seconds=self.overlap_s)).isoformat(), 0
+            while True:
+                rows = self._page(received_at=f"gte.{since}", **{"and": f"(seq.gt.{after},seq.lte.{cursor})"})
+                take(rows)
+                if len(rows) < self.batch_size: break
+                after = int(rows[-1]["seq"])
+        while True:
+            rows = self._page(seq=f"gt.{cursor}")
+            take(rows)
+            if rows: cursor = int(rows[-1]["seq"])
+            sync_state_set(ckey, cursor)
+            if latest is not None: sync_state_set(tkey, latest.isoformat())
+            if len(rows) < self.batch_size: return applied
+
+
+
+
+def engine_from_env() -> SyncEngine | None:
+    if not SYNC_URL: return None
+    if SYNC_KIND == "supabase": return SupabaseSyncEngine(SYNC_URL, SYNC_API_KEY, SYNC_TOKEN, SYNC_REFRESH_TOKEN)
+    if SYNC_KIND != "changes": raise ValueError(f"TOTUM_SYNC_KIND inconnu : {SYNC_KIND!r} (changes | supabase)")
+    return SyncEngine(SYNC_URL, SYNC_TOKEN, SYNC_USER)
+
+
+
+
+# ============ Serveur factice (tests / développement) ============
+class _MockHandler(BaseHTTPRequestHandler):
+    server: "MockSyncServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        gz = "gzip" in (self.headers.get("Accept-Encoding") or "")
+        if gz: body = gzip.compress(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if gz: self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        token = self.server.token
+        if token and self.headers.get("Authorization") != f"Bearer {token}":
+            self._send(401, {"error": "Jeton manquant ou invalide"}); return False
+        return True
+
+    def do_POST(self):
+        if not self._authorized(): return
+        if urllib.parse.urlparse(self.path).path != "/changes": return self._send(404, {"error": "introuvable"})
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        data = _read_json(body, self.headers.get("Content-Encoding")) or {}
+        self.server.stats["bytes_in"] += len(body); self.server.stats["posts"] += 1
+        with self.server.lock:
+            log = self.server.logs.setdefault(str(data.get("user_id")), [])
+            for ch in data.get("changes") or []:
+                log.append({**ch, "seq": len(log) + 1})
+            self._send(200, {"accepted": len(data.get("changes") or []), "cursor": len(log)})
+
+    def do_GET(self):
+        if not self._authorized(): return
+        u = urllib.parse.urlparse(self.path)
+        if u.path != "/changes": return self._send(404, {"error": "introuvable"})
+        q = urllib.parse.parse_qs(u.query)
+        since, limit = int(q.get("since", ["0"])[0]), int(q.get("limit", [str(BATCH_SIZE)])[0])
+        self.server.stats["gets"] += 1
+        with self.server.lock:
+            log = self.server.logs.get(q.get("user_id", [""])[0], [])
+            page = log[since:since + limit]
+            self._send(200, {"changes": page, "cursor": since + len(page), "more": since + len(page) < len(log)})
+
+
+
+
+class MockSyncServer(ThreadingHTTPServer):
+    """Magasin distant en mémoire (un journal de changements par utilisateur) du protocole "changes"."""
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token: str | None = None):
+        super().__init__((host, port), _MockHandler)
+        self.token = token
+        self.logs: dict[str, list[dict]] = {}
+        self.lock = threading.Lock()
+        self.stats = {"posts": 0, "gets": 0, "bytes_in": 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "MockSyncServer":
+        threading.Thread(target=self.serve_forever, name="totum-sync-mock", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown(); self.server_close()
+
+
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "once"
+    if cmd == "mock":
+        srv = MockSyncServer(port=int(sys.argv[2]) if len(sys.argv) > 2 else 5003, token=SYNC_TOKEN)
+        print("Serveur de synchro factice sur", srv.url)
+        srv.serve_forever()
+    else:
+        engine = engine_from_env()
+        if engine is None: sys.exit("Définir TOTUM_SYNC_URL (et TOTUM_SYNC_KIND, TOTUM_SYNC_TOKEN, cf. en-tête).")
+        print(engine.sync())
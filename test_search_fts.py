@@ -0,0 +1,55 @@
+# Totum — parité des deux moteurs de recherche (mémoire / FTS5) sur le catalogue livré
+# pytest test_search_fts.py   (ou : python test_search_fts.py)
+
+
+
+
+from __future__ import annotations
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from catalog import DEFAULT_EXCEL_PATH, SHEET_LISTE
+from search_fts import FtsSearchIndex, fts5_available
+from totum_core import build_search_index, canon, clean_liste, journal_search_candidates, read_workbook_sheets
+
+
+
+
+QUERIES = ["", "poulet", "riz bl", "pomme de", "yaourt nature", "chocolat noir", "sardine", "Œuf", "bœuf",
+           "pouelt", "yaourh", "fromgae blanc", "xyzq", "a", "de", "-"]
+
+
+
+
+@pytest.fixture(scope="module")
+def backends():
+    if not fts5_available(): pytest.skip("SQLite sans FTS5 (trigram)")
+    names = clean_liste(read_workbook_sheets(DEFAULT_EXCEL_PATH, [SHEET_LISTE])[SHEET_LISTE])["nom"].astype(str).tolist()
+    with tempfile.TemporaryDirectory() as d:
+        yield build_search_index(names), FtsSearchIndex.build(names, directory=Path(d))
+
+
+
+
+@pytest.mark.parametrize("q", QUERIES)
+@pytest.mark.parametrize("limit", [5, 12])
+def test_same_results(backends, q, limit):
+    index, fts = backends
+    assert fts.search(q, limit) == journal_search_candidates(None, q, limit=limit, index=index)
+
+
+
+
+def test_ligatures_and_typos(backends):
+    index, _ = backends
+    assert canon("Bœuf, Œuf") == "boeuf, oeuf"
+    assert all(canon(n).startswith("oeuf") for n in journal_search_candidates(None, "œuf", limit=3, index=index))
+    assert any("poulet" in canon(n) for n in journal_search_candidates(None, "pouelt", limit=5, index=index))
+
+
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
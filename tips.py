@@ -0,0 +1,89 @@
+# Totum — moteur de conseils (onglet Conseils)
+# Les règles sont compilées une seule fois en tableaux NumPy (nutriment, sens, seuil) puis évaluées
+# d'un bloc contre les totaux du jour et les objectifs réels du profil. Le tirage utilise un
+# random.Random propre à la session : l'état global du module `random` n'est jamais touché.
+
+
+
+
+from __future__ import annotations
+import random
+import numpy as np
+import pandas as pd
+
+from totum_core import nutrient_label_key, TARGET_NUTRIENTS
+
+
+
+
+# conseils généraux (holistique / naturopathique + pragmatique)
+GENERAL_TIPS = [
+    "Commence ton repas par un grand verre d’eau — l’hydratation améliore la satiété et la digestion.",
+    "Ajoute une portion de légumes verts à chaque repas pour booster fibres et micronutriments.",
+    "Privilégie les protéines au petit-déjeuner pour mieux gérer l’appétit toute la matinée.",
+    "Remplace une portion de céréales raffinées par des légumineuses pour plus de fibres et protéines.",
+    "Pour réduire les sucres, choisis un fruit entier plutôt qu’un jus ou un dessert sucré.",
+    "Intègre des cuillères d’huile d’olive crue en finition pour augmenter OMÉGA-9 et saveur.",
+    "Si tu manques d’énergie l’après-midi, une petite marche de 10–15 min aide beaucoup.",
+    "Favorise les aliments fermentés (yaourt nature, kéfir, choucroute) pour ta flore intestinale.",
+    "Pour un sommeil réparateur, évite la caféine après 15h et choisis un dîner léger en sucres simples.",
+    "Un snack combinant protéine + fibres (yaourt + graines, pomme + purée d’amande) retarde la faim.",
+    "Pense à la rondeur digestive : mastique plus lentement pour améliorer assimilation et satiété.",
+    "Un bain chaud, respiration lente ou courte méditation avant le dîner favorisent une digestion calme.",
+    "Alterne sources de protéines végétales et animales sur la semaine pour diversité micro-nutritionnelle.",
+    "Inclue une source d’iode (algue en petite quantité, poisson) si tu consommes peu d’iode habituellement.",
+]
+
+MOTIVATIONS = [
+    "Super boulot — chaque petit choix compte, continue comme ça 💪",
+    "Une habitude à la fois : rappelle-toi pourquoi tu as commencé ✨",
+    "Tu es sur la bonne voie — la constance bat la perfection chaque jour.",
+    "Chaque repas est une nouvelle opportunité pour te sentir mieux aujourd'hui.",
+    "Petit conseil : célèbre tes petites victoires (un repas équilibré = une victoire).",
+    "Rappelle-toi : le progrès est progressif — sois gentil·le avec toi-même.",
+]
+
+# règles ciblées : (clé d'objectif, ">" ou "<", fraction de l'objectif, conseil)
+TIP_RULES = [
+    ("sucres_g",    ">", 0.9, "Ton apport en sucres est élevé aujourd'hui — observe boissons et snacks sucrés."),
+    ("agsatures_g", ">", 0.9, "AG saturés proches de la limite — préfère poisson, volaille, huile d'olive plutôt que charcuterie."),
+    ("fibres_g",    "<", 1.0, "Penses-y : une portion additionnelle de légumes/légumineuses équivaut à +5–8 g de fibres."),
+]
+
+
+
+
+class TipEngine:
+    """Règles compilées une fois ; evaluate() est un calcul vectoriel, pick() un simple tirage."""
+
+    def __init__(self, rules=TIP_RULES, general=GENERAL_TIPS, motivations=MOTIVATIONS):
+        self.general = list(general)
+        self.motivations = list(motivations)
+        self.texts = [r[3] for r in rules]
+        self.target_keys = [r[0] for r in rules]
+        self.buckets = [nutrient_label_key(TARGET_NUTRIENTS.get(k, k))[0] for k in self.target_keys]
+        self.sign = np.array([1.0 if r[1] == ">" else -1.0 for r in rules])
+        self.ratio = np.array([float(r[2]) for r in rules])
+
+    def evaluate(self, totals: pd.Series, targets: dict) -> np.ndarray:
+        """Masque des règles déclenchées ; une règle sans objectif (absent ou nul) ne se déclenche pas."""
+        if isinstance(totals, pd.Series) and not totals.empty:
+            by_bucket = pd.Series(pd.to_numeric(totals, errors="coerce").fillna(0.0).to_numpy(),
+                                  index=[nutrient_label_key(str(i))[0] for i in totals.index]).groupby(level=0).sum()
+            values = by_bucket.reindex(self.buckets).fillna(0.0).to_numpy()
+        else:
+            values = np.zeros(len(self.buckets))
+        tgt = np.array([float((targets or {}).get(k) or 0.0) for k in self.target_keys])
+        return (tgt > 0) & (self.sign * (values - self.ratio * tgt) > 0)
+
+    def pick(self, totals: pd.Series, targets: dict, rng: random.Random,
+             n_tips: int = 4, n_motiv: int = 3) -> tuple[list[str], list[str]]:
+        """(conseils_pratiques, phrases_motivation) : tirage dans les conseils généraux + ceux des règles déclenchées."""
+        pool = self.general + [self.texts[i] for i in np.flatnonzero(self.evaluate(totals, targets))]
+        return (rng.sample(pool, min(len(pool), n_tips)),
+                rng.sample(self.motivations, min(len(self.motivations), n_motiv)))
+
+
+
+
+DEFAULT_ENGINE = TipEngine()
@@ -0,0 +1,580 @@
+# Totum — noyau nutritionnel (sans Streamlit)
+# Fonctions pures partagées par l'app Streamlit et les traitements de fond :
+# normalisation des libellés, nettoyage de la feuille 'Liste', calculs d'objectifs, unification des totaux.
+
+
+
+
+from __future__ import annotations
+import io, re, heapq, unicodedata
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import openpyxl
+
+from units import conversion_factor, split_unit, unit_rank
+
+
+
+
+# ===================== Utils =====================
+LIGATURES = str.maketrans({"œ": "oe", "Œ": "Oe", "æ": "ae", "Æ": "Ae"})   # NFD ne les décompose pas
+
+
+
+
+def strip_accents(text: str) -> str:
+    text = str(text or "").translate(LIGATURES)
+    return "".join(ch for ch in unicodedata.normalize("NFD", text) if unicodedata.category(ch) != "Mn")
+
+
+
+
+def canon(s: str) -> str:
+    s = strip_accents(str(s)).lower().replace("_", " ").replace("/", " ").replace("-", " ")
+    return re.sub(r"\s+", " ", s).strip()
+
+
+
+
+def canon_key(s: str) -> str:
+    return canon(s).replace("(", "").replace(")", "").replace("’", "'").replace(" ", "").replace("__", "_")
+
+
+
+
+def norm(s: str) -> str:
+    s = strip_accents(s).lower()
+    return re.sub(r"[^a-z0-9]+", "", s)
+
+
+
+
+def normalize_unit(u: str) -> str:
+    # orthographe d'origine conservée ("UI", "kj") : c'est elle qui figure dans les libellés déjà au journal ;
+    # l'appariement tolérant aux alias (UI / IU, kj / kJ) passe par nutrient_label_key, cf. micro_consumed
+    u = (u or "").strip()
+    return u.replace("mcg", "µg").replace("ug", "µg").replace("μg", "µg")
+
+
+
+
+def parse_name_unit(label: str) -> tuple[str,str]:
+    if label is None: return "", ""
+    s = str(label).strip()
+    parts = re.split(r"\s*[-–—]\s*", s)
+    if len(parts) >= 2:
+        unit = normalize_unit(parts[-1])
+        name = "-".join(parts[:-1]).strip()
+        return name, unit
+    return s, ""
+
+
+
+
+def coerce_num_col(s: pd.Series | None) -> pd.Series | None:
+    if s is None: return None
+    if pd.api.types.is_numeric_dtype(s): return s.astype(float)   # déjà converti (ex. facteur d'unité appliqué)
+    s = s.astype(str).str.replace("\u00A0", " ", regex=False).str.replace(",", ".", regex=False)
+    # cas courant : nombre décimal simple -> conversion directe ; le reste ("< 0.5", "12 g", "1e-05", "traces"...)
+    # passe par l'extraction du premier nombre, comme avant
+    out = pd.to_numeric(s, errors="coerce")
+    slow = out.isna().to_numpy() | s.str.contains(r"[^0-9.+\- ]", regex=True).to_numpy()
+    if slow.any():
+        ext = s[slow].str.extract(r"([-+]?\d*\.?\d+)")[0]
+        out = out.astype(float); out[slow] = pd.to_numeric(ext, errors="coerce").to_numpy()
+    return out
+
+
+
+
+def percent(n, d):
+    n = pd.to_numeric(n, errors="coerce").fillna(0.0)
+    d = pd.to_numeric(d, errors="coerce").replace(0, np.nan)
+    return (n / d * 100).fillna(0.0)
+
+
+
+
+def nutrient_cols(df_or_row):
+    cols = list(df_or_row.index if isinstance(df_or_row, pd.Series) else df_or_row.columns)
+    return [c for c in cols if str(c).endswith("_100g")]
+
+
+
+
+def per100_to_name(c): return c[:-5]
+
+
+
+
+def drop_parasite_columns(df: pd.DataFrame | None) -> pd.DataFrame | None:
+    if df is None or df.empty: return df
+    cols = []
+    for c in df.columns:
+        sc = str(c).strip().lower()
+        if sc == "" or sc.startswith("unnamed") or sc in {"done","none","nan"}:
+            continue
+        cols.append(c)
+    out = df[cols]
+    return out.loc[:, ~(out.isna().all())]
+
+
+
+
+def _sheet_to_df(ws) -> pd.DataFrame | None:
+    rows = list(ws.values)
+    if not rows: return None
+    header = [str(x) if x is not None else "" for x in rows[0]]
+    df = pd.DataFrame(rows[1:], columns=header)
+    return drop_parasite_columns(df)
+
+
+
+
+def read_sheet_values_path(path: Path, sheet_name: str) -> pd.DataFrame | None:
+    try:
+        bio = io.BytesIO(Path(path).read_bytes())
+        wb = openpyxl.load_workbook(bio, data_only=True, read_only=True)
+        if sheet_name not in wb.sheetnames: return None
+        return _sheet_to_df(wb[sheet_name])
+    except Exception:
+        return None
+
+
+
+
+def read_workbook_sheets(path: Path, sheet_names: list[str]) -> dict[str, pd.DataFrame | None]:
+    """Lit plusieurs feuilles en un seul chargement du classeur (une feuille absente/illisible -> None)."""
+    bio = io.BytesIO(Path(path).read_bytes())
+    wb = openpyxl.load_workbook(bio, data_only=True, read_only=True)
+    out: dict[str, pd.DataFrame | None] = {}
+    for name in sheet_names:
+        try: out[name] = _sheet_to_df(wb[name]) if name in wb.sheetnames else None
+        except Exception: out[name] = None
+    return out
+
+
+
+
+def resolve_nutrient_columns(cols) -> dict[str, list[tuple[str, float, bool]]]:
+    """
+    Colonnes /100 g groupées par nutriment (nom sans unité, canon_key) :
+    {colonne cible: [(colonne, multiplicateur vers l'unité cible, même unité que la cible ?), ...]}.
+    Cible = unité préférée (kcal > masse > UI) puis nom le plus court, comme l'ancienne fusion par canon_key.
+    """
+    groups: dict[str, list[tuple[str, str, str | None]]] = {}
+    for c in cols:
+        name, unit = split_unit(c)
+        groups.setdefault(canon_key(name), []).append((c, name, unit))
+    plan: dict[str, list[tuple[str, float, bool]]] = {}
+    for members in groups.values():
+        target, t_name, t_unit = sorted(members, key=lambda m: (unit_rank(m[2]), len(m[0])))[0]
+        out = []
+        for c, name, unit in members:
+            try: f = conversion_factor(unit, t_unit, t_name)
+            except ValueError: plan[c] = [(c, 1.0, True)]; continue   # inconvertible : colonne gardée à part
+            out.append((c, f, unit == t_unit))
+        plan[target] = out
+    return plan
+
+
+
+
+def clean_liste(df_liste: pd.DataFrame) -> pd.DataFrame:
+    df_liste = drop_parasite_columns(df_liste)
+    assert "nom" in df_liste.columns, "La feuille 'Liste' doit contenir la colonne 'nom'."
+    if "Energie_kcal_100g" in df_liste.columns and "Énergie_kcal_100g" not in df_liste.columns:
+        df_liste = df_liste.rename(columns={"Energie_kcal_100g": "Énergie_kcal_100g"})
+    keep = ["nom"] + [c for c in df_liste.columns if c.endswith("_100g")]
+    df = df_liste[keep].copy()
+    for c in [x for x in df.columns if x.endswith("_100g")]:
+        df[c] = coerce_num_col(df[c]).fillna(0.0)
+
+
+
+
+    # fusion des colonnes d'un même nutriment : conversion d'unité (un seul produit vectoriel sur la matrice),
+    # somme des doublons de même unité, complément (là où la cible vaut 0) pour ceux d'une autre unité
+    plan = resolve_nutrient_columns([x for x in df.columns if x.endswith("_100g")])
+    if any(len(m) > 1 or m[0][1] != 1.0 for m in plan.values()):
+        src = [c for members in plan.values() for c, _, _ in members]
+        scale = np.array([f for members in plan.values() for _, f, _ in members], dtype=float)
+        mat = df[src].to_numpy(dtype=float) * scale
+        pos = {c: i for i, c in enumerate(src)}
+        merged = {}
+        for target, members in plan.items():
+            same = [pos[c] for c, _, same_unit in members if same_unit]
+            col = mat[:, same].sum(axis=1)
+            for c, _, same_unit in members:
+                if not same_unit: col = np.where(col == 0.0, mat[:, pos[c]], col)
+            merged[target] = col
+        df = pd.concat([df[["nom"]], pd.DataFrame(merged, index=df.index)], axis=1)
+    return df
+
+
+
+
+def calc_from_food_row(row: pd.Series, qty_g: float) -> dict:
+    out = {}
+    for c in nutrient_cols(row):
+        val = pd.to_numeric(pd.Series([row[c]]), errors="coerce").iloc[0]
+        if pd.notna(val):
+            out[per100_to_name(c)] = float(qty_g) * float(val) / 100.0
+    return out
+
+
+
+
+def round1(x) -> float:
+    try: return float(np.round(float(x), 1))
+    except Exception: return 0.0
+
+
+
+
+# ============ Unification totaux ============
+PREFERRED_NAMES = {
+    "energiekcal":"Énergie_kcal", "proteinesg":"Protéines_g", "glucidesg":"Glucides_g", "lipidesg":"Lipides_g",
+    "fibresg":"Fibres_g", "agsaturesg":"AG_saturés_g",
+    "acideoleiquew9g":"Acide_oléique_W9_g", "acidelinoleiquew6lag":"Acide_linoléique_W6_LA_g",
+    "acidealphalinoleniquew3alag":"Acide_alpha-linolénique_W3_ALA_g", "acidealpha-linoléniquew3alag":"Acide_alpha-linolénique_W3_ALA_g",
+    "acidealpha_linolenique_w3_alag":"Acide_alpha-linolénique_W3_ALA_g", "acidealphalinoleniquew3ala":"Acide_alpha-linolénique_W3_ALA_g",
+    "omega3alag":"Acide_alpha-linolénique_W3_ALA_g", "omega3ala":"Acide_alpha-linolénique_W3_ALA_g",
+    "w3alag":"Acide_alpha-linolénique_W3_ALA_g", "alag":"Acide_alpha-linolénique_W3_ALA_g",
+    "epag":"EPA_g", "dhag":"DHA_g", "sucresg":"Sucres_g", "selg":"Sel_g",
+}
+def nutrient_label_key(col: str) -> tuple[str, str | None]:
+    """(bucket, nom préféré ou None) d'un libellé de nutriment, tel qu'utilisé par unify_totals_series."""
+    name, unit = split_unit(col)
+    key = canon_key(f"{name}_{unit}" if unit else col); preferred = PREFERRED_NAMES.get(key)
+    return (preferred or key), preferred
+
+
+
+
+def build_label_registry(labels) -> dict[str, tuple[str, str | None]]:
+    return {str(c): nutrient_label_key(str(c)) for c in labels}
+
+
+
+
+def unify_totals_series(s: pd.Series, labels: dict[str, tuple[str, str | None]] | None = None) -> pd.Series:
+    if not isinstance(s, pd.Series) or s.empty: return s
+    labels = labels or {}
+    buckets: dict[str, float] = {}; name_for_bucket: dict[str,str] = {}
+    for col in s.index:
+        bucket, preferred = labels.get(col) or nutrient_label_key(col)
+        buckets[bucket] = buckets.get(bucket, 0.0) + float(s[col] or 0.0)
+        if preferred: name_for_bucket[bucket] = preferred
+        else: name_for_bucket.setdefault(bucket, col)
+    out = pd.Series({name_for_bucket[k]: v for k,v in buckets.items()})
+    if "Énergie_kcal" not in out.index and "Energie_kcal" in out.index: out["Énergie_kcal"] = out["Energie_kcal"]
+    return out
+
+
+
+
+def unify_totals_frame(df_day: pd.DataFrame, labels: dict[str, tuple[str, str | None]] | None = None) -> pd.Series:
+    """Totaux unifiés d'un ensemble de lignes du journal (colonnes nutriments sommées puis unify_totals_series)."""
+    if df_day is None or df_day.empty: return pd.Series(dtype=float)
+    base_exclude = {"id","date","repas","nom","quantite_g"}
+    df_clean = drop_parasite_columns(df_day).copy()
+    for c in df_clean.columns:
+        if c not in base_exclude: df_clean[c] = pd.to_numeric(df_clean[c], errors="coerce")
+    df_num = df_clean.drop(columns=[c for c in base_exclude if c in df_clean.columns], errors="ignore")
+    raw = df_num.sum(numeric_only=True)
+    return unify_totals_series(raw, labels=labels)
+
+
+
+
+# ============ Profil / objectifs ============
+def bmr_harris_benedict_revised(sex, age, height_cm, weight_kg):
+    if norm(sex).startswith("h"):
+        return 88.362 + 13.397*float(weight_kg) + 4.799*float(height_cm) - 5.677*int(age)
+    else:
+        return 447.593 + 9.247*float(weight_kg) + 3.098*float(height_cm) - 4.330*int(age)
+
+
+
+
+ACTIVITY_TABLE = {
+    "sedentaire":{"factor":1.2, "prot_min":0.8, "prot_max":1.0},
+    "leger":{"factor":1.375, "prot_min":1.0, "prot_max":1.2},
+    "modere":{"factor":1.55, "prot_min":1.2, "prot_max":1.6},
+    "intense":{"factor":1.725, "prot_min":1.6, "prot_max":2.0},
+    "tresintense":{"factor":1.9, "prot_min":2.0, "prot_max":2.5},
+    "athlete":{"factor":1.9, "prot_min":2.0, "prot_max":2.5},
+}
+RULES = {
+    "lipides_pct":0.35, "agsat_pct":0.10, "omega9_pct":0.15, "omega6_pct":0.04, "ala_pct":0.01,
+    "glucides_pct":0.55, "sucres_pct":0.10, "fibres_g":30.0, "epa_g":0.25, "dha_g":0.25, "sel_g":6.0,
+}
+
+
+
+
+def activity_key(a: str) -> str:
+    a = norm(a)
+    if "sedentaire" in a: return "sedentaire"
+    if "leger" in a: return "leger"
+    if "modere" in a: return "modere"
+    if "intense" in a and "tres" not in a and "2x" not in a: return "intense"
+    if "tresintense" in a or "2x" in a or "athlete" in a: return "tresintense"
+    return "sedentaire"
+
+
+
+
+def excel_like_targets(p: dict) -> dict:
+    bmr = bmr_harris_benedict_revised(p["sexe"], int(p["age"]), float(p["taille_cm"]), float(p["poids_kg"]))
+    af = ACTIVITY_TABLE[activity_key(p["activite"])]["factor"]
+    prot_max = ACTIVITY_TABLE[activity_key(p["activite"])]["prot_max"]
+    tdee = bmr * af
+    return {
+        "energie_kcal": float(tdee),
+        "proteines_g":  float(float(p["poids_kg"]) * prot_max),
+        "lipides_g":    float(tdee * RULES["lipides_pct"] / 9.0),
+        "agsatures_g":  float(tdee * RULES["agsat_pct"]   / 9.0),
+        "omega9_g":     float(tdee * RULES["omega9_pct"]  / 9.0),
+        "omega6_g":     float(tdee * RULES["omega6_pct"]  / 9.0),
+        "ala_w3_g":     float(tdee * RULES["ala_pct"]     / 9.0),
+        "epa_g":        RULES["epa_g"],
+        "dha_g":        RULES["dha_g"],
+        "glucides_g":   float(tdee * RULES["glucides_pct"]/ 4.0),
+        "sucres_g":     float(tdee * RULES["sucres_pct"]  / 4.0),
+        "fibres_g":     RULES["fibres_g"],
+        "sel_g":        RULES["sel_g"],
+    }
+
+
+
+
+# clés de excel_like_targets -> nom de nutriment unifié dans les totaux (unify_totals_series)
+TARGET_NUTRIENTS = {
+    "energie_kcal": "Énergie_kcal", "proteines_g": "Protéines_g", "lipides_g": "Lipides_g",
+    "agsatures_g": "AG_saturés_g", "omega9_g": "Acide_oléique_W9_g", "omega6_g": "Acide_linoléique_W6_LA_g",
+    "ala_w3_g": "Acide_alpha-linolénique_W3_ALA_g", "epa_g": "EPA_g", "dha_g": "DHA_g",
+    "glucides_g": "Glucides_g", "sucres_g": "Sucres_g", "fibres_g": "Fibres_g", "sel_g": "Sel_g",
+}
+
+
+
+
+# ============ Cibles Excel ============
+def build_objectif_robuste(df: pd.DataFrame) -> pd.Series:
+    if df is None or df.empty: return pd.Series(dtype=float)
+    candidates = [c for c in ["Objectif","Ojectifs","Cible","Objectifs","Objectif (jour)","Target","Cible (jour)"] if c in df.columns]
+    out = pd.Series(0.0, index=df.index, dtype=float)
+    for c in candidates:
+        v = coerce_num_col(df[c])
+        out = out.where(out > 0, v.fillna(0.0))
+    return pd.Series([round1(x) for x in out], index=df.index, dtype=float)
+
+
+
+
+def is_vitamin(n: str) -> bool:
+    n = strip_accents(n).lower(); return n.startswith("vit") or "vitamine" in n
+
+
+
+
+MICRO_COLS = ("_cle", "_cle_canon", "_unite", "_vitamine")
+
+
+def compile_micro_targets(df: pd.DataFrame | None) -> pd.DataFrame:
+    """
+    Feuille "Cible micro" préparée une fois par chargement : objectif robuste, clé de la colonne du journal
+    (nom_unité), sa forme canonique, unité normalisée et drapeau vitamine / minéral.
+    micro_consumed() n'a plus qu'à faire un reindex contre les totaux du jour.
+    """
+    if df is None or df.empty or "Nutriment" not in df.columns: return df if df is not None else pd.DataFrame()
+    if "_cle" in df.columns: return df
+    out = df.copy()
+    if "Objectif" not in out.columns or (pd.to_numeric(out["Objectif"], errors="coerce").fillna(0.0) == 0).all():
+        out["Objectif"] = build_objectif_robuste(out)
+    parsed = [parse_name_unit(str(x)) for x in out["Nutriment"]]
+    out["_cle"] = [f"{n}_{normalize_unit(u)}".replace(" ", "_") for n, u in parsed]
+    out["_cle_canon"] = [nutrient_label_key(k)[0] for k in out["_cle"]]
+    out["_unite"] = [u for _, u in parsed]
+    out["_vitamine"] = out["Nutriment"].astype(str).map(is_vitamin)
+    return out
+
+
+
+
+def micro_consumed(compiled: pd.DataFrame, totals: pd.Series) -> np.ndarray:
+    """
+    Consommé par ligne de cible : clé exacte d'abord, sinon première colonne de même clé canonique (unité
+    canonique comprise : "Vitamine_D_UI" et "Vitamine_D_IU" se rejoignent), sinon 0.
+    """
+    if compiled is None or compiled.empty or not isinstance(totals, pd.Series) or totals.empty:
+        return np.zeros(0 if compiled is None else len(compiled))
+    totals = totals[~totals.index.duplicated()]
+    exact = totals.reindex(compiled["_cle"].to_numpy())
+    by_canon = totals.groupby(np.array([nutrient_label_key(str(i))[0] for i in totals.index]), sort=False).first()
+    fallback = by_canon.reindex(compiled["_cle_canon"].to_numpy())
+    vals = pd.to_numeric(exact.where(exact.notna(), fallback.to_numpy()), errors="coerce").fillna(0.0)
+    return vals.to_numpy(dtype=float)
+
+
+
+
+def macro_base_name(label: str) -> str:
+    name, _ = parse_name_unit(label); nc = canon(name); ns = nc.replace(" ", "")
+    if nc.startswith("energie"): return "energie"
+    if nc.startswith("proteine"): return "proteines"
+    if nc.startswith("glucide"): return "glucides"
+    if nc.startswith("lipide"): return "lipides"
+    if nc.startswith("sucres"): return "sucres"
+    if "acides grassatures" in nc or "acides gras satures" in nc or "ag satures" in nc or "agsatures" in nc: return "agsatures"
+    if "omega9" in ns or ("oleique" in nc and "w9" in nc): return "omega9"
+    if "omega6" in ns or ("linoleique" in nc and ("w6" in nc or "la" in nc)): return "omega6"
+    if "epa" in nc: return "epa"
+    if "dha" in nc: return "dha"
+    if "omega3" in ns or "w3" in ns or ("alpha" in nc and "linolenique" in nc) or "ala" in nc: return "ala"
+    if nc.startswith("fibres"): return "fibres"
+    if nc.startswith("sel"): return "sel"
+    return name
+
+
+
+
+# ============ Recherche aliments ============
+# Les deux moteurs (journal_search_candidates en mémoire, search_fts.FtsSearchIndex) partagent ces règles :
+# mêmes mots, même tolérance aux fautes, même complément -> mêmes résultats.
+WORD_RE = re.compile(r"\w+")
+FUZZY_MIN_LEN = 3
+
+
+
+
+def search_words(c: str) -> list[str]:
+    """Mots d'un nom canonique (découpage identique au tokenizer unicode61 de FTS5)."""
+    return WORD_RE.findall(c)
+
+
+
+
+def osa_distance(a: str, b: str) -> int:
+    """Distance de Damerau-Levenshtein restreinte : insertion, suppression, substitution, inversion de 2 lettres."""
+    prev2 = None; prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+
+
+def fuzzy_word_sim(t: str, w: str) -> float:
+    """
+    Proximité d'un mot de la requête (3+ lettres) et d'un mot du nom, entier ou préfixe (saisie en cours) :
+    1 - fautes / longueur, 0 au-delà d'une faute (2 à partir de 6 lettres) ou si la 1re lettre ne colle pas.
+    """
+    allowed = 1 if len(t) <= 5 else 2
+    if not w or w[0] not in t[:2] or len(w) < len(t) - allowed: return 0.0
+    d = min(osa_distance(t, w), osa_distance(t, w[:len(t)]))
+    return 1.0 - d / len(t) if d <= allowed else 0.0
+
+
+
+
+def fuzzy_close_words(tokens, vocab) -> dict:
+    """{mot de la requête: {mot du vocabulaire: proximité}} pour les mots du vocabulaire assez proches."""
+    vocab = list(vocab)
+    close = {}
+    for t in tokens:
+        sims = ((w, fuzzy_word_sim(t, w)) for w in vocab)
+        close[t] = {w: s for w, s in sims if s > 0}
+    return close
+
+
+
+
+def fuzzy_name_score(tokens, close: dict, words) -> float:
+    """Moyenne, sur les mots de la requête, de la meilleure proximité avec un mot du nom."""
+    return sum(max((close[t].get(w, 0.0) for w in words), default=0.0) for t in tokens) / len(tokens)
+
+
+
+
+def char_overlap(sa: frozenset, sb: frozenset) -> float:
+    """Dernier recours : recouvrement des jeux de caractères (Jaccard)."""
+    return len(sa & sb) / max(len(sa | sb), 1)
+
+
+
+
+def build_search_index(names) -> dict:
+    """Index précalculé pour journal_search_candidates : noms, formes canoniques, mots, vocabulaire et jeux de caractères."""
+    names = [str(n) for n in names]
+    canons = [canon(n) for n in names]
+    words = [tuple(search_words(c)) for c in canons]
+    return {"names": names, "canon": canons, "words": words, "vocab": sorted({w for ws in words for w in ws}),
+            "chars": [frozenset(c) for c in canons]}
+
+
+
+
+def journal_search_candidates(foods_df: pd.DataFrame, q: str, limit: int = 12, index: dict | None = None) -> list[str]:
+    """
+    Recherche optimisée :
+    - priorité startswith (meilleure correspondance)
+    - ensuite token match (tous tokens présents)
+    - ensuite fautes de frappe (mots proches, cf. fuzzy_word_sim), par proximité décroissante
+    - complément jusqu'à `limit` : recouvrement de caractères
+    `index` (build_search_index) évite de recanoniser tout le catalogue à chaque frappe.
+    """
+    if index is None:
+        if foods_df is None or foods_df.empty:
+            return []
+        index = build_search_index(foods_df["nom"].astype(str).tolist())
+    base = index["names"]
+    q = (q or "").strip()
+    if not q:
+        return base[:limit]
+    q_canon = canon(q)
+    q_tokens = [t for t in q_canon.split(" ") if t]
+    starts = []
+    token_match = []
+    for name, c in zip(base, index["canon"]):
+        if c.startswith(q_canon):
+            starts.append(name); continue
+        # token match: all tokens present
+        if all(tok in c for tok in q_tokens):
+            token_match.append(name); continue
+    # dedupe preserving order
+    seen = set(); uniq = []
+    for x in starts + token_match:
+        if x not in seen:
+            uniq.append(x); seen.add(x)
+    if len(uniq) >= limit:
+        return uniq[:limit]
+    # fautes de frappe : noms contenant un mot proche de chaque mot (3+ lettres) de la requête
+    long_t = [t for t in q_tokens if len(t) >= FUZZY_MIN_LEN]
+    if long_t:
+        close = fuzzy_close_words(long_t, index["vocab"])
+        if any(close.values()):
+            scored = sorted((-fuzzy_name_score(long_t, close, ws), i) for i, ws in enumerate(index["words"]))
+            for s, i in scored:
+                if s >= 0 or len(uniq) >= limit: break
+                if base[i] not in seen:
+                    uniq.append(base[i]); seen.add(base[i])
+            if len(uniq) >= limit:
+                return uniq
+    # complément : recouvrement des caractères
+    sb = frozenset(q_canon)
+    rest = []
+    for i, (name, sa) in enumerate(zip(base, index["chars"])):
+        if name in seen: continue
+        seen.add(name); rest.append((-char_overlap(sa, sb), i))
+    uniq += [base[i] for _, i in heapq.nsmallest(limit - len(uniq), rest)]
+    return uniq
@@ -0,0 +1,88 @@
+# Totum — registre des unités de nutriments
+# Chaque colonne "<Nutriment>_<unité>_100g" est résolue une fois au chargement en (nutriment, unité canonique) ;
+# les multiplicateurs de conversion sont précalculés ici. Dimensions gérées :
+#   masse   g / mg / µg (alias ug, mcg, μg)
+#   énergie kcal / kJ
+#   UI      unités internationales, converties en µg pour les vitamines qui en ont une définition (A, D, E)
+
+
+
+
+from __future__ import annotations
+import re, unicodedata
+
+
+
+
+UNIT_ALIASES = {
+    "g": "g", "gr": "g", "mg": "mg", "µg": "µg", "μg": "µg", "ug": "µg", "mcg": "µg",
+    "kcal": "kcal", "kj": "kJ", "ui": "IU", "iu": "IU",
+}
+
+# unité -> (dimension, valeur de 1 unité dans l'unité de base de la dimension : g, kcal)
+UNIT_SCALE = {
+    "g": ("masse", 1.0), "mg": ("masse", 1e-3), "µg": ("masse", 1e-6),
+    "kcal": ("energie", 1.0), "kJ": ("energie", 1.0 / 4.184),
+    "IU": ("ui", 1.0),
+}
+
+# rang de l'unité cible quand un même nutriment arrive en plusieurs unités (kcal plutôt que kJ, masse plutôt qu'UI) ;
+# les unités de masse sont à égalité : c'est alors le nom de colonne le plus court qui l'emporte
+UNIT_RANK = {"kcal": 0, "kJ": 1, "g": 2, "mg": 2, "µg": 2, "IU": 3}
+
+# 1 UI en µg (clé : nom du nutriment sans accents ni séparateurs)
+IU_TO_UG = {
+    "vitaminea": 0.3, "retinol": 0.3,
+    "vitamined": 0.025, "vitamined3": 0.025, "cholecalciferol": 0.025,
+    "vitaminee": 670.0, "alphatocopherol": 670.0,
+}
+
+
+
+
+def _key(name: str) -> str:
+    s = "".join(ch for ch in unicodedata.normalize("NFD", str(name or "")) if unicodedata.category(ch) != "Mn")
+    return re.sub(r"[^a-z0-9]+", "", s.lower())
+
+
+
+
+def canonical_unit(u: str | None) -> str | None:
+    """Orthographe canonique d'une unité connue, None sinon."""
+    if u is None: return None
+    return UNIT_ALIASES.get(str(u).strip().lower())
+
+
+
+
+def split_unit(label: str) -> tuple[str, str | None]:
+    """"Calcium_mg" -> ("Calcium", "mg") ; l'unité est le dernier segment "_" s'il est connu, sinon None."""
+    label = str(label)
+    if label.endswith("_100g"): label = label[:-5]
+    head, sep, tail = label.rpartition("_")
+    unit = canonical_unit(tail) if sep else None
+    return (head, unit) if unit else (label, None)
+
+
+
+
+def conversion_factor(src: str | None, dst: str | None, nutrient: str = "") -> float:
+    """Multiplicateur qui convertit une valeur en `src` vers `dst` ; ValueError si les dimensions diffèrent."""
+    src, dst = canonical_unit(src) or src, canonical_unit(dst) or dst
+    if src == dst or src is None or dst is None: return 1.0
+    if src not in UNIT_SCALE or dst not in UNIT_SCALE: raise ValueError(f"Unité inconnue : {src} -> {dst}")
+    (d_src, s_src), (d_dst, s_dst) = UNIT_SCALE[src], UNIT_SCALE[dst]
+    if d_src == "ui" or d_dst == "ui":
+        ug = IU_TO_UG.get(_key(nutrient))
+        if ug is None: raise ValueError(f"Pas de conversion UI pour {nutrient!r}")
+        if d_src == "ui": return ug * 1e-6 / s_dst
+        return s_src / (ug * 1e-6)
+    if d_src != d_dst: raise ValueError(f"Unités incompatibles : {src} -> {dst}")
+    return s_src / s_dst
+
+
+
+
+def unit_rank(unit: str | None) -> int:
+    """Ordre de préférence pour choisir l'unité cible d'un groupe (plus petit = préféré)."""
+    return UNIT_RANK.get(unit, 4)
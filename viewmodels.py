@@ -0,0 +1,343 @@
+# Totum — modèles de vue des onglets Bilan et Conseils (calcul pur, sans Streamlit)
+# Le calcul (totaux du jour -> donuts, barres micro, cartes) est séparé de l'affichage : app.py met le
+# résultat en cache par session sous la clé (utilisateur, date, version du journal, version du catalogue,
+# empreinte du profil). Une interaction sans rapport (frappe dans la recherche du Journal...) relit donc
+# le modèle déjà calculé au lieu de tout recalculer.
+
+
+
+
+from __future__ import annotations
+import os, sys, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from totum_core import (
+    canon_key, percent, round1, excel_like_targets, macro_base_name, compile_micro_targets, micro_consumed,
+    nutrient_label_key,
+)
+
+
+
+
+LOCAL_USER = "local"
+VM_CACHE_MB = float(os.getenv("TOTUM_VM_CACHE_MB", "24"))   # budget mémoire du cache des vues, par session
+
+MACRO_KEYS = {
+    "Énergie":["Énergie_kcal","Energie_kcal","kcal","energie_kcal"],
+    "Protéines":["Protéines_g","Proteines_g"], "Glucides":["Glucides_g"], "Lipides":["Lipides_g"],
+    "Fibres":["Fibres_g","Fibre_g"], "Sucres":["Sucres_g"],
+    "AG saturés":["AG_saturés_g","Acides_gras_saturés_g","AG_satures_g"],
+    "Oméga-9":["Acide_oléique_W9_g","Acide_oleique_W9_g"],
+    "Oméga-6":["Acide_linoléique_W6_LA_g","Acide_linoleique_W6_LA_g"],
+    "EPA":["EPA_g"], "DHA":["DHA_g"], "Sel":["Sel_g"],
+}
+
+# Fallback si la feuille "Cible Macro" est vide
+DEFAULT_MACRO_ROWS = [
+    {"Nutriment":"Énergie (calories)-kcal","Icône":"🔥"},
+    {"Nutriment":"Lipides-g","Icône":"🥑"},
+    {"Nutriment":"AG saturés-g","Icône":"🥓"},
+    {"Nutriment":"Acide_oléique_W9-g","Icône":"🫒"},
+    {"Nutriment":"Acide_linoléique_W6_LA-g","Icône":"🌻"},
+    {"Nutriment":"Oméga-3 (ALA)-g","Icône":"🌱"},
+    {"Nutriment":"EPA-g","Icône":"🐟"},
+    {"Nutriment":"DHA-g","Icône":"🧠"},
+    {"Nutriment":"Glucides-g","Icône":"🍞"},
+    {"Nutriment":"Sucres-g","Icône":"🍬"},
+    {"Nutriment":"Fibres-g","Icône":"🌾"},
+    {"Nutriment":"Protéines-g","Icône":"💪"},
+    {"Nutriment":"Sel-g","Icône":"🧂"},
+]
+
+BASE_TO_TARGET = {"energie":"energie_kcal","lipides":"lipides_g","agsatures":"agsatures_g","omega9":"omega9_g",
+                  "omega6":"omega6_g","ala":"ala_w3_g","epa":"epa_g","dha":"dha_g","glucides":"glucides_g",
+                  "sucres":"sucres_g","fibres":"fibres_g","proteines":"proteines_g","sel":"sel_g"}
+
+# (base, titre, couleur) des trois grilles de donuts
+DONUT_GROUPS = {
+    "macros": [("energie","Énergie (kcal)","energie"), ("proteines","Protéines (g)","proteines"),
+               ("glucides","Glucides (g)","glucides"), ("lipides","Lipides (g)","lipides"), ("fibres","Fibres (g)","fibres")],
+    "acides_gras": [("ala","Oméga-3 (ALA)","omega3"), ("epa","EPA (g)","epa"), ("dha","DHA (g)","dha"),
+                    ("omega6","Oméga-6 (g)","omega6"), ("omega9","Oméga-9 (g)","omega9")],
+    "surveiller": [("sucres","Sucres (g)","glucides"), ("agsatures","AG saturés (g)","lipides"), ("sel","Sel (g)","muted")],
+}
+
+
+
+
+def profile_hash(profile: dict) -> str:
+    return hashlib.sha1(repr(sorted((k, str(v)) for k, v in (profile or {}).items())).encode()).hexdigest()[:12]
+
+
+
+
+def split_vitamins(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    if df is None or df.empty or "Nutriment" not in df.columns: return pd.DataFrame(), pd.DataFrame()
+    df = compile_micro_targets(df)
+    mask = df["_vitamine"].to_numpy(dtype=bool)
+    return df[mask].copy(), df[~mask].copy()
+
+
+
+
+# ============ Bilan ============
+def find_ala_columns(cols) -> list[str]:
+    out = []
+    for c in cols:
+        ck = canon_key(c)
+        if "epa" in ck or "dha" in ck: continue
+        if ("ala" in ck and ("omega3" in ck or "w3" in ck)) or ("alpha" in ck and "linolen" in ck) \
+           or ck.endswith("alag") or ck.endswith("ala") or "acidealphalinoleniquew3" in ck:
+            out.append(c)
+    return out
+
+
+
+
+def ala_consumed_from_day(df: pd.DataFrame, totals: pd.Series) -> float:
+    if df is not None and not df.empty and "Acide_alpha-linolénique_W3_ALA_g" in df.columns:
+        return float(pd.to_numeric(df["Acide_alpha-linolénique_W3_ALA_g"], errors="coerce").fillna(0.0).sum())
+    if df is not None and not df.empty:
+        ala_cols = find_ala_columns(df.columns.tolist())
+        if ala_cols:
+            s = pd.DataFrame(df[ala_cols]).apply(pd.to_numeric, errors="coerce").fillna(0.0)
+            return float(s.sum(numeric_only=True).sum())
+    if isinstance(totals, pd.Series) and not totals.empty:
+        cand = find_ala_columns(list(totals.index))
+        if cand:
+            return float(pd.to_numeric(totals[cand], errors="coerce").fillna(0.0).sum())
+    return 0.0
+
+
+
+
+def _any_of(totals: pd.Series, keys) -> float:
+    for key in keys:
+        if key in totals.index and pd.notna(totals[key]): return float(totals[key])
+    keyset = [canon_key(k) for k in keys]
+    for idx in totals.index:
+        if canon_key(idx) in keyset and pd.notna(totals[idx]): return float(totals[idx])
+    return 0.0
+
+
+
+
+def consumed_macro(label: str, totals: pd.Series, ala_from_day: float) -> float:
+    base = macro_base_name(label)
+    if base == "energie":
+        p = float(totals.get("Protéines_g", totals.get("Proteines_g", 0.0)))
+        g = float(totals.get("Glucides_g", 0.0)); l = float(totals.get("Lipides_g", 0.0))
+        return p*4 + g*4 + l*9
+    if base == "ala": return ala_from_day
+    mapping = {"proteines":"Protéines","glucides":"Glucides","lipides":"Lipides","fibres":"Fibres","sucres":"Sucres",
+               "agsatures":"AG saturés","omega9":"Oméga-9","omega6":"Oméga-6","epa":"EPA","dha":"DHA","sel":"Sel"}
+    if base in mapping: return _any_of(totals, MACRO_KEYS.get(mapping[base], []))
+    if label in totals.index and pd.notna(totals[label]): return float(totals[label])
+    for idx in totals.index:
+        if canon_key(idx) == canon_key(label): return float(totals[idx])
+    return 0.0
+
+
+
+
+def build_macros_df(targets_macro: pd.DataFrame, profile: dict, profile_targets: dict,
+                    totals: pd.Series, ala_from_day: float) -> pd.DataFrame:
+    xlt = excel_like_targets(profile)
+    df = targets_macro.copy() if targets_macro is not None else None
+    if df is None or df.empty or "Nutriment" not in df.columns:
+        df = pd.DataFrame(DEFAULT_MACRO_ROWS)
+    # Calcul "type Excel" par défaut
+    bases = df["Nutriment"].astype(str).apply(macro_base_name)
+    df["Objectif"] = [xlt[BASE_TO_TARGET[b]] if b in BASE_TO_TARGET else None for b in bases]
+    # 🔒 GARANTIE : ligne ALA présente et objectif non nul
+    df["_base"] = bases
+    if df[df["_base"].eq("ala")].empty:
+        df = pd.concat([df, pd.DataFrame([{"Nutriment":"Oméga-3 (ALA)-g","Icône":"🌱","Objectif":np.nan}])], ignore_index=True)
+        df["_base"] = df["Nutriment"].apply(macro_base_name)
+    omega3_from_profile = float(profile_targets.get("ala_w3_g", xlt["ala_w3_g"]))
+    df.loc[df["_base"].eq("ala"), "Objectif"] = omega3_from_profile
+    # Consommations + % objectifs
+    df["Consommée"] = df["Nutriment"].apply(lambda n: consumed_macro(n, totals, ala_from_day))
+    df["Objectif"]  = pd.to_numeric(df["Objectif"], errors="coerce").fillna(omega3_from_profile)
+    df["Consommée"] = pd.to_numeric(df["Consommée"], errors="coerce").fillna(0.0)
+    df["Objectif"]  = df["Objectif"].apply(round1); df["Consommée"] = df["Consommée"].apply(round1)
+    df["% objectif"] = percent(df["Consommée"], df["Objectif"]).apply(round1)
+    if "Icône" not in df.columns: df["Icône"] = ""
+    df["Icône"] = df["Icône"].fillna("")
+    return df
+
+
+
+
+def _donut_pairs(macros_df: pd.DataFrame, xlt: dict) -> dict[str, tuple[float, float]]:
+    """(consommé, objectif) par base ; première ligne de la base, sinon (0, objectif Excel)."""
+    out = {}
+    first = macros_df.drop_duplicates("_base").set_index("_base") if not macros_df.empty else pd.DataFrame()
+    for group in DONUT_GROUPS.values():
+        for base, _, _ in group:
+            fallback = xlt[BASE_TO_TARGET[base]]
+            if base not in first.index:
+                out[base] = (0.0, round1(fallback)); continue
+            row = first.loc[base]
+            cons = pd.to_numeric(pd.Series([row.get("Consommée", 0)]), errors="coerce").fillna(0).iloc[0]
+            obj  = pd.to_numeric(pd.Series([row.get("Objectif",  fallback)]), errors="coerce").fillna(fallback).iloc[0]
+            out[base] = (float(cons), round1(obj))
+    return out
+
+
+
+
+def micro_table(targets_micro: pd.DataFrame, totals: pd.Series) -> pd.DataFrame:
+    tmi = compile_micro_targets(targets_micro).copy()
+    tmi["Objectif"]  = tmi["Objectif"].apply(round1)
+    tmi["Consommée"] = [round1(x) for x in micro_consumed(tmi, totals)]
+    tmi["% objectif"]= percent(tmi["Consommée"], tmi["Objectif"]).apply(round1)
+    return tmi
+
+
+
+
+def build_bilan_view(df_day: pd.DataFrame, totals: pd.Series, targets_macro: pd.DataFrame,
+                     targets_micro: pd.DataFrame, profile: dict, profile_targets: dict) -> dict:
+    """Tout ce que l'onglet Bilan affiche : trois grilles de donuts + barres vitamines / minéraux."""
+    xlt = excel_like_targets(profile)
+    macros_df = build_macros_df(targets_macro, profile, profile_targets, totals, ala_consumed_from_day(df_day, totals))
+    pairs = _donut_pairs(macros_df, xlt)
+    view = {name: [{"title": title, "cons": pairs[base][0], "target": pairs[base][1], "color": color}
+                   for base, title, color in group] for name, group in DONUT_GROUPS.items()}
+    view["has_micro"] = targets_micro is not None and not targets_micro.empty and "Nutriment" in targets_micro.columns
+    vit = mino = pd.DataFrame()
+    if view["has_micro"]:
+        vit, mino = split_vitamins(micro_table(targets_micro, totals))
+        if not vit.empty:  vit  = vit.sort_values("% objectif", ascending=False)
+        if not mino.empty: mino = mino.sort_values("% objectif", ascending=False)
+    view["vitamines"], view["mineraux"] = vit, mino
+    return view
+
+
+
+
+TREND_NUTRIENTS = ("Énergie_kcal", "Protéines_g", "Glucides_g", "Lipides_g", "Fibres_g", "Sucres_g", "AG_saturés_g",
+                   "Sel_g")
+
+
+
+
+def build_trend_view(daily: pd.DataFrame, nutrients=TREND_NUTRIENTS) -> pd.DataFrame:
+    """Historique : une ligne par jour saisi (date en datetime), une colonne par nutriment (libellés équivalents sommés)."""
+    if daily is None or daily.empty: return pd.DataFrame(columns=["date", *nutrients])
+    buckets: dict[str, list[str]] = {}
+    for c in daily.columns:
+        if c != "date": buckets.setdefault(nutrient_label_key(str(c))[0], []).append(c)
+    out = pd.DataFrame({"date": pd.to_datetime(daily["date"])})
+    for n in nutrients:
+        cols = buckets.get(nutrient_label_key(n)[0], [])
+        out[n] = daily[cols].apply(pd.to_numeric, errors="coerce").fillna(0.0).sum(axis=1) if cols else 0.0
+    return out.sort_values("date", ignore_index=True)
+
+
+
+
+# ============ Conseils ============
+def build_conseils_view(totals: pd.Series, targets_macro: pd.DataFrame, targets_micro: pd.DataFrame) -> dict:
+    """Totaux du dernier jour saisi + cartes rôles / bénéfices ; le tirage des conseils reste fait à l'affichage."""
+    vit, mino = split_vitamins(targets_micro)
+    return {"totals": totals, "macro_cards": targets_macro if targets_macro is not None else pd.DataFrame(),
+            "vitamines": vit, "mineraux": mino}
+
+
+
+
+# ============ Cache ============
+def approx_size(obj) -> int:
+    """Taille mémoire estimée d'un modèle de vue (DataFrame / Series exacts, conteneurs parcourus)."""
+    if isinstance(obj, pd.DataFrame): return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series): return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray): return int(obj.nbytes)
+    if isinstance(obj, dict): return sys.getsizeof(obj) + sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)): return sys.getsizeof(obj) + sum(approx_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+
+
+class ViewModelCache:
+    """
+    LRU borné en nombre d'entrées et en mémoire estimée (max_bytes) ; la clé porte déjà toutes les versions,
+    aucune invalidation explicite. Sûr entre threads : le préchargement y écrit pendant que la page le lit.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = int(VM_CACHE_MB * 2**20)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict = OrderedDict()
+        self._sizes: dict = {}
+        self._prefetched: set = set()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = self.misses = self.prefetch_hits = 0
+
+    def get_or_build(self, key: tuple, build):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key); self.hits += 1
+                if key in self._prefetched: self._prefetched.discard(key); self.prefetch_hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = build()
+        self.put(key, value)
+        return value
+
+    def put(self, key: tuple, value, prefetched: bool = False):
+        size = approx_size(value)
+        with self._lock:
+            if key in self._data: self.nbytes -= self._sizes[key]
+            self._data[key] = value; self._data.move_to_end(key)
+            self._sizes[key] = size; self.nbytes += size
+            if prefetched: self._prefetched.add(key)
+            # l'entrée la plus récente reste, même seule au-dessus du budget
+            while len(self._data) > 1 and (len(self._data) > self.max_entries or self.nbytes > self.max_bytes):
+                old, _ = self._data.popitem(last=False)
+                self.nbytes -= self._sizes.pop(old); self._prefetched.discard(old)
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+
+
+class Prefetcher:
+    """
+    Construit en tâche de fond des modèles de vue probables (jours voisins du Bilan) dans un ViewModelCache.
+    Un seul thread par process : le préchargement ne concurrence jamais plus d'un cœur la page affichée.
+    make_key() est évalué dans le thread (version du journal au moment du calcul) ; une tâche par `tag` à la fois.
+    """
+
+    def __init__(self, max_workers: int = 1):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="totum-prefetch")
+        self._pending: set = set()
+        self._lock = threading.Lock()
+        self.built = self.failed = 0
+
+    def submit(self, cache: ViewModelCache, tag: tuple, make_key, build) -> bool:
+        with self._lock:
+            if tag in self._pending: return False
+            self._pending.add(tag)
+        self._pool.submit(self._run, cache, tag, make_key, build)
+        return True
+
+    def _run(self, cache: ViewModelCache, tag: tuple, make_key, build):
+        try:
+            key = make_key()
+            if key not in cache:
+                cache.put(key, build(), prefetched=True); self.built += 1
+        except Exception:
+            self.failed += 1   # simple anticipation : la page recalculera ce jour-là si on y va
+        finally:
+            with self._lock: self._pending.discard(tag)
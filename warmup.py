@@ -0,0 +1,122 @@
+# Totum — préchauffage : ce que le premier visiteur après un déploiement payait sur son propre chargement
+# Étapes chronométrées, une fois par process :
+#   stockage     schéma / migrations SQLite (ou pool + tables PostgreSQL), registre des nutriments en mémoire
+#   catalogue    lecture du classeur, clean_liste, cibles, registre des libellés, index de recherche, recommandeur
+#                (ou rattachement au catalogue partagé, cf. shared_catalog.py)
+#   nutriments   noms du catalogue inscrits dans le registre (le premier ajout au journal n'écrit plus de schéma)
+#   recherche    première requête (index en mémoire, ou connexion au fichier FTS5)
+#   objectifs    objectifs du profil enregistré + feuille micro du sexe correspondant
+#   échanges     index de substitution (vecteurs normalisés, construit à la demande sinon)
+#   plotly       import + première sérialisation d'une figure (validateurs chargés paresseusement par Plotly)
+# Lancer : python warmup.py          préchauffe et affiche les temps (base, catalogue partagé, index FTS sur disque)
+#          python warmup.py serve …  préchauffe puis lance `streamlit run app.py …` dans le même process : le premier
+#                                    visiteur trouve catalogue, index et base prêts, comme pour un rerun
+# L'app et l'API mobile appellent aussi warmup() au démarrage ; le rapport est conservé (Diagnostic de l'app).
+
+
+
+
+from __future__ import annotations
+import sys, time, threading
+from pathlib import Path
+
+from totum_core import excel_like_targets
+from catalog import catalog_manager, DEFAULT_EXCEL_PATH
+from storage import init_db, nutrient_schema
+from journal_store import get_store, load_profile, journal_version
+
+
+
+
+APP_PATH = Path(__file__).parent / "app.py"
+
+_REPORTS: dict[str, list[dict]] = {}
+_LOCK = threading.Lock()
+
+
+
+
+def _step(report: list[dict], name: str, fn):
+    t0 = time.perf_counter()
+    try:
+        detail = fn(); ok = True
+    except Exception as e:
+        detail = f"erreur : {e!r}"; ok = False
+    report.append({"étape": name, "secondes": round(time.perf_counter() - t0, 3), "ok": ok, "détail": detail or ""})
+
+
+
+
+def _storage():
+    init_db(); nutrient_schema(); journal_version()
+    return get_store().describe()
+
+
+
+
+def _catalog(path: Path):
+    snap = catalog_manager(path).current()
+    if snap is None: raise RuntimeError(f"catalogue indisponible ({path})")
+    return f"v{snap.version}, {len(snap)} aliments, {len(snap.labels)} libellés, construit en {snap.build_s:.2f}s"
+
+
+
+
+def _targets(snap):
+    p = load_profile()
+    return f"{len(excel_like_targets(p))} macros, {len(snap.micro_targets_for(p['sexe']))} micros ({p['sexe']})"
+
+
+
+
+def _plotly():
+    import plotly.graph_objects as go
+    go.Figure(data=[go.Pie(values=[1, 1], hole=0.7)]).to_json()
+    go.Figure(go.Bar(x=[0], y=[1])).to_json()
+
+
+
+
+def warmup(path: Path = DEFAULT_EXCEL_PATH, force: bool = False) -> list[dict]:
+    """Exécute les étapes (une fois par process et par classeur, sauf `force`) ; renvoie le rapport [{étape, secondes, ok, détail}]."""
+    key = str(Path(path).resolve())
+    with _LOCK:
+        if key in _REPORTS and not force: return _REPORTS[key]
+        report: list[dict] = []
+        _step(report, "stockage", _storage)
+        _step(report, "catalogue", lambda: _catalog(path))
+        snap = catalog_manager(path).current()
+        if snap is not None:
+            _step(report, "nutriments", lambda: f"{nutrient_schema(snap.nutrient_names).version} noms")
+            _step(report, "recherche", lambda: f"{len(snap.search('pomme', 10))} résultats")
+            _step(report, "objectifs", lambda: _targets(snap))
+            _step(report, "échanges", lambda: f"{len(snap.substitution_index().names)} vecteurs")
+        _step(report, "plotly", _plotly)
+        _REPORTS[key] = report
+        return report
+
+
+
+
+def warmup_report(path: Path = DEFAULT_EXCEL_PATH) -> list[dict] | None:
+    return _REPORTS.get(str(Path(path).resolve()))
+
+
+
+
+def format_report(report: list[dict]) -> str:
+    lines = [f"{'étape':<12} {'s':>7}  détail"]
+    lines += [f"{r['étape']:<12} {r['secondes']:>7.3f}  {'' if r['ok'] else '⚠ '}{r['détail']}" for r in report]
+    lines.append(f"{'total':<12} {sum(r['secondes'] for r in report):>7.3f}")
+    return "\n".join(lines)
+
+
+
+
+if __name__ == "__main__":
+    import warmup as module   # le module que l'app importera : rapport et caches partagés avec `serve`
+    print(module.format_report(module.warmup()))
+    if sys.argv[1:2] == ["serve"]:
+        from streamlit.web import cli as stcli
+        sys.argv = ["streamlit", "run", str(APP_PATH), *sys.argv[2:]]
+        sys.exit(stcli.main())